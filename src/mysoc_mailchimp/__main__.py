@@ -11,10 +11,27 @@ from rich.console import Console
 from rich.table import Table
 from trogon import tui
 
+from . import snapshots
+from .gdoc import DriveDocument, list_folder_documents
+from .instrumentation import (
+    ApiSummary,
+    JsonLinesWriter,
+    OpenTelemetryExporter,
+    StatsdSender,
+    add_hook,
+)
 from .mailchimp import MailChimpHandler
+from .mirror import MirrorQueryError, mirror_list, query_mirror
+from .overlap import matrix_from_list, matrix_from_mirror, matrix_from_snapshot
+from .profiling import SamplingProfiler
 from .send_mailing_list import create_campaign_from_blog
-from .twfy import DateOptions, print_json_config
-from .wordpress_funcs import load_blog_to_wordpress
+from .twfy import BLOG_FEED_URL, DateOptions, print_bulk_json_config, print_json_config
+from .wordpress_funcs import (
+    batch_load_blogs_to_wordpress,
+    document_id_from_url,
+    load_blog_to_wordpress,
+    write_batch_report,
+)
 
 console = Console()
 
@@ -61,22 +78,29 @@ def assert_mailchimp_api_key_exists():
 
 
 def output_df(
-    df: pd.DataFrame, order_by: str, desc: bool, is_json: bool, data_item: str
+    df: pd.DataFrame,
+    order_by: Optional[str],
+    desc: bool,
+    is_json: bool,
+    data_item: str,
 ):
     """
-    Print the dataframe nicely, or as a json
+    Print the dataframe nicely, or as a json.
+    Without order_by, rows are kept in their current order.
     """
-    if df[order_by].dtype == "object":
-        df["sort_lower"] = df[order_by].str.lower()  # type: ignore
-    else:
-        df["sort_lower"] = df[order_by]
+    if order_by:
+        if df[order_by].dtype == "object":
+            df["sort_lower"] = df[order_by].str.lower()  # type: ignore
+        else:
+            df["sort_lower"] = df[order_by]
 
-    df = df.sort_values("sort_lower", ascending=not desc)
-    df = df.drop(columns=["sort_lower"])
+        df = df.sort_values("sort_lower", ascending=not desc)
+        df = df.drop(columns=["sort_lower"])
 
     if is_json:
         data = {data_item: df.to_dict(orient="records")}
-        print(json.dumps(data, indent=4))
+        # default=str for timestamps
+        print(json.dumps(data, indent=4, default=str))
     else:
         table = df_to_table(df, Table(box=box.SIMPLE))  # type: ignore
         console.print(table)
@@ -84,8 +108,74 @@ def output_df(
 
 @tui()
 @click.group()
-def cli():
-    pass
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Print a summary of the API calls made",
+)
+@click.option(
+    "--profile-jsonl",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Append an event per API call to this file as JSON lines",
+)
+@click.option("--statsd", default=None, help="Send API call metrics to host:port")
+@click.option(
+    "--otel",
+    is_flag=True,
+    default=False,
+    help="Record API calls as OpenTelemetry spans",
+)
+@click.option(
+    "--profile-cpu",
+    is_flag=True,
+    default=False,
+    help="Sample where time is spent and print the hottest functions",
+)
+@click.option(
+    "--profile-cpu-output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default="profile.speedscope.json",
+    help="Where to write the speedscope profile (open at speedscope.app)",
+)
+@click.pass_context
+def cli(
+    ctx: click.Context,
+    profile: bool,
+    profile_jsonl: Optional[Path],
+    statsd: Optional[str],
+    otel: bool,
+    profile_cpu: bool,
+    profile_cpu_output: Path,
+):
+    if profile_cpu:
+        profiler = SamplingProfiler()
+        profiler.start()
+
+        def report():
+            profiler.stop()
+            profiler.write_speedscope(profile_cpu_output, ctx.invoked_subcommand or "")
+            profiler.print_report()
+            click.echo(f"Profile written to {profile_cpu_output}", err=True)
+
+        ctx.call_on_close(report)
+    if profile:
+        summary = ApiSummary()
+        add_hook(summary)
+        ctx.call_on_close(summary.print)
+    if profile_jsonl:
+        writer = JsonLinesWriter(profile_jsonl)
+        add_hook(writer)
+        ctx.call_on_close(writer.close)
+    if statsd:
+        host, _, port = statsd.partition(":")
+        add_hook(StatsdSender(host, int(port or 8125)))
+    if otel:
+        try:
+            add_hook(OpenTelemetryExporter())
+        except ImportError as e:
+            raise click.UsageError(str(e))
 
 
 @cli.command()
@@ -312,6 +402,251 @@ def twfy_config(blog_url: str, start_day: DateOptions, days_up: int):
     print_json_config(blog_url, start_day, days_up)
 
 
+@cli.command()
+@click.option(
+    "--feed-url", "-f", default=BLOG_FEED_URL, help="RSS feed or sitemap of the blog"
+)
+@click.option(
+    "--since",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    default=None,
+    help="Only include posts published on or after this date (YYYY-MM-DD)",
+)
+@click.option(
+    "--existing",
+    "-e",
+    "existing",
+    multiple=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Existing announcement/banner json config - posts already in it are skipped",
+)
+@click.option(
+    "--start-day",
+    "-s",
+    default="tomorrow",
+    help="Date to start banners",
+    callback=validate_date_choice,
+)
+@click.option("--days-up", "-d", default=14, help="Number of days to show banners")
+@click.option("--workers", "-w", default=8, help="Number of posts to fetch at once")
+def twfy_bulk_config(
+    feed_url: str,
+    since: Optional[datetime.datetime],
+    existing: tuple[Path, ...],
+    start_day: DateOptions,
+    days_up: int,
+    workers: int,
+):
+    """
+    Print the twfy announcement and banner configs for all new posts in the blog feed
+    """
+    print_bulk_json_config(
+        feed_url,
+        since.date() if since else None,
+        list(existing),
+        start_day,
+        days_up,
+        workers,
+    )
+
+
+@cli.command()
+@click.option("--list-id", "-l", default="425649", help="web id or name of list")
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Folder to write the snapshot to (default members-<list>-<date>)",
+)
+@click.option(
+    "--fields",
+    "-f",
+    default="",
+    help="Comma separated columns to export, e.g. email_address,merge_*,tags",
+)
+@click.option(
+    "--compression",
+    default="zstd",
+    type=click.Choice(["zstd", "snappy", "gzip", "none"]),
+    help="Parquet compression",
+)
+def export_members(list_id: str, output: Optional[Path], fields: str, compression: str):
+    """
+    Export a snapshot of a list's members as parquet
+    """
+    internal_list_id = mailchimp_handler.list_to_unique_id(list_id)
+    if output is None:
+        output = Path(f"members-{list_id}-{datetime.date.today()}")
+    field_list = [field.strip() for field in fields.split(",") if field.strip()]
+    try:
+        count = snapshots.export_members(
+            mailchimp_handler.api_settings,
+            internal_list_id,
+            output,
+            fields=field_list or None,
+            compression=compression,
+        )
+    except (FileExistsError, ValueError) as e:
+        raise click.UsageError(str(e))
+    print(f"[green]Exported {count} members to {output}[/green]")
+
+
+@cli.command()
+@click.argument("old", type=click.Path(exists=True, file_okay=False, path_type=Path))
+@click.argument("new", type=click.Path(exists=True, file_okay=False, path_type=Path))
+@json_option
+def diff_members(old: Path, new: Path, is_json: bool):
+    """
+    Compare two member snapshots
+    """
+    diff = snapshots.diff_snapshots(
+        snapshots.load_snapshot(old), snapshots.load_snapshot(new)
+    )
+    changed = diff.changed.to_pandas()
+    df = changed.groupby("column").size().rename("changes").reset_index()
+    if not is_json:
+        print(f"{diff.added.num_rows} members added, {diff.removed.num_rows} removed")
+    output_df(df, "changes", True, is_json, "changes")
+
+
+@cli.command()
+@click.option("--list-id", "-l", default="425649", help="web id or name of list")
+@click.option(
+    "--path",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Folder for the mirror (default: in the cache folder)",
+)
+@click.option(
+    "--skip-segment-members",
+    is_flag=True,
+    default=False,
+    help="Don't fetch who is in each segment (one request per segment)",
+)
+def mirror(list_id: str, path: Optional[Path], skip_segment_members: bool):
+    """
+    Copy a list's members, tags, interests, segments and campaigns locally
+    for the query command
+    """
+    counts = mirror_list(
+        mailchimp_handler.api_settings,
+        mailchimp_handler.list_to_unique_id(list_id),
+        path,
+        segment_members=not skip_segment_members,
+    )
+    df = pd.DataFrame({"table": list(counts), "rows": list(counts.values())})
+    output_df(df, None, False, False, "tables")
+
+
+@cli.command()
+@click.argument("sql")
+@click.option(
+    "--path",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Folder of the mirror (default: in the cache folder)",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(["auto", "duckdb", "sqlite"]),
+    default="auto",
+    help="Query with DuckDB or SQLite (auto uses DuckDB if installed)",
+)
+@click.option(
+    "--order-by", "-o", default=None, help="column to order table by (optional)"
+)
+@desc_option
+@json_option
+def query(
+    sql: str,
+    path: Optional[Path],
+    engine: str,
+    order_by: Optional[str],
+    desc: bool,
+    is_json: bool,
+):
+    """
+    Run SQL over the local mirror of a list (see the mirror command).
+    Tables: members, tags, interests, segments, segment_members, campaigns
+    """
+    try:
+        df = query_mirror(sql, path, engine)
+    except (FileNotFoundError, ImportError, MirrorQueryError) as e:
+        raise click.UsageError(str(e))
+    output_df(df, order_by, desc, is_json, "rows")
+
+
+@cli.command()
+@click.option("--list-id", "-l", default="425649", help="web id or name of list")
+@click.option(
+    "--snapshot",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    default=None,
+    help="Use a snapshot from export-members rather than the live list",
+)
+@click.option(
+    "--from-mirror",
+    is_flag=True,
+    default=False,
+    help="Use the local mirror (see the mirror command) rather than the live list",
+)
+@click.option(
+    "--mirror-path",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Folder of the mirror (default: in the cache folder)",
+)
+@click.option(
+    "--segments",
+    "include_segments",
+    is_flag=True,
+    default=False,
+    help="Include segments when using the live list (a request per segment)",
+)
+@click.option("--no-tags", is_flag=True, default=False, help="Leave out tags")
+@click.option("--min-size", default=1, help="Leave out groups smaller than this")
+@click.option(
+    "--percent",
+    is_flag=True,
+    default=False,
+    help="Show each row as the % of that group in each column's group",
+)
+@json_option
+def overlap_report(
+    list_id: str,
+    snapshot: Optional[Path],
+    from_mirror: bool,
+    mirror_path: Optional[Path],
+    include_segments: bool,
+    no_tags: bool,
+    min_size: int,
+    percent: bool,
+    is_json: bool,
+):
+    """
+    Show how many members are in each pair of interest groups, tags and segments
+    """
+    options = {"include_tags": not no_tags, "min_size": min_size}
+    try:
+        if snapshot:
+            matrix = matrix_from_snapshot(
+                snapshot, mailchimp_handler.api_settings, **options
+            )
+        elif from_mirror:
+            matrix = matrix_from_mirror(mirror_path, **options)
+        else:
+            matrix = matrix_from_list(
+                mailchimp_handler.api_settings,
+                mailchimp_handler.list_to_unique_id(list_id),
+                include_segments,
+                **options,
+            )
+    except (FileNotFoundError, ValueError) as e:
+        raise click.UsageError(str(e))
+    output_df(matrix.to_frame(percent), None, False, is_json, "overlaps")
+
+
 # upload wordpress blog
 @cli.command()
 @click.option("--url", "-u", help="Public google doc")
@@ -330,6 +665,57 @@ def wordpress_upload(url: str, unsplash_url: str | None, config: str):
     load_blog_to_wordpress(url, unsplash_url, config_path)
 
 
+@cli.command()
+@click.option(
+    "--folder", "-f", help="Id of a Google Drive folder of docs", default=None
+)
+@click.option("--url", "-u", "urls", multiple=True, help="Google doc url (repeatable)")
+@click.option(
+    "--config", "-c", help="Path to config file (optional)", default="repower-democracy"
+)
+@click.option("--workers", "-w", default=4, help="Number of docs to process at once")
+@click.option(
+    "--rate-limit", "-r", default=5.0, help="Max WordPress requests per second"
+)
+@click.option(
+    "--report",
+    default="wordpress_batch_report.json",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Where to write the summary (.json or .csv)",
+)
+def wordpress_batch_upload(
+    folder: Optional[str],
+    urls: tuple[str, ...],
+    config: str,
+    workers: int,
+    rate_limit: float,
+    report: Path,
+):
+    """
+    Upload a folder (or list) of Google Docs as wordpress blog posts.
+    Each doc must contain a link to its Unsplash image.
+    """
+    documents: list[DriveDocument] = []
+    if folder:
+        documents.extend(list_folder_documents(folder))
+    documents.extend(DriveDocument(document_id_from_url(url)) for url in urls)
+    if not documents:
+        raise click.UsageError("Provide --folder or at least one --url")
+
+    config_path = Path("config") / f"{config}.yaml"
+    results = batch_load_blogs_to_wordpress(
+        documents, config_path, workers=workers, requests_per_second=rate_limit
+    )
+    write_batch_report(results, report)
+
+    created = [r for r in results if r.post_id is not None]
+    print(f"[green]Created {len(created)} of {len(results)} posts[/green]")
+    for result in results:
+        if result.error:
+            print(f"[red]{result.name or result.document_id}: {result.error}[/red]")
+    print(f"Report written to {report}")
+
+
 def main():
     """
     Run main CLI
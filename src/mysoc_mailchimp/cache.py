@@ -0,0 +1,161 @@
+"""
+On-disk caches shared between runs.
+
+The cache folder defaults to ~/.cache/mysoc_mailchimp and can be moved
+with the MYSOC_MAILCHIMP_CACHE environment variable.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import requests
+
+
+def get_cache_dir(*parts: str) -> Path:
+    """
+    Get (and create) a folder inside the cache folder
+    """
+    root = os.environ.get("MYSOC_MAILCHIMP_CACHE")
+    base = Path(root) if root else Path.home() / ".cache" / "mysoc_mailchimp"
+    path = base.joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def atomic_write(path: Path, data: bytes):
+    """
+    Write a file so that concurrent readers never see a partial file
+    """
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(temp_name, path)
+
+
+class OfflineCacheMiss(Exception):
+    """
+    Raised when offline and the url has not been cached
+    """
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    etag: str = ""
+    last_modified: str = ""
+    encoding: str = "utf-8"
+    fetched: float = 0.0
+
+
+class HttpCache:
+    """
+    Persistent cache for GET requests that revalidates with the server
+    using ETag/Last-Modified, so an unchanged page is read from disk.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        offline: Optional[bool] = None,
+        session: Optional[requests.Session] = None,
+    ):
+        self.path = path or get_cache_dir("http")
+        self.path.mkdir(parents=True, exist_ok=True)
+        if offline is None:
+            offline = bool(os.environ.get("MYSOC_MAILCHIMP_OFFLINE"))
+        self.offline = offline
+        self.session = session or requests.Session()
+
+    def _key(self, url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        key = self._key(url)
+        return self.path / f"{key}.json", self.path / f"{key}.body"
+
+    def lookup(self, url: str) -> Optional[tuple[CacheEntry, bytes]]:
+        meta_path, body_path = self._paths(url)
+        try:
+            entry = CacheEntry(**json.loads(meta_path.read_text()))
+            body = body_path.read_bytes()
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            return None
+        return entry, body
+
+    def store(
+        self,
+        url: str,
+        body: bytes,
+        etag: str = "",
+        last_modified: str = "",
+        encoding: str = "utf-8",
+    ) -> CacheEntry:
+        """
+        Add a response to the cache (also used to load recorded fixtures)
+        """
+        entry = CacheEntry(
+            url=url,
+            etag=etag,
+            last_modified=last_modified,
+            encoding=encoding,
+            fetched=time.time(),
+        )
+        meta_path, body_path = self._paths(url)
+        # body first, so the metadata never points at a missing body
+        atomic_write(body_path, body)
+        atomic_write(meta_path, json.dumps(asdict(entry)).encode("utf-8"))
+        return entry
+
+    def get_text(
+        self, url: str, timeout: int = 10, session: Optional[requests.Session] = None
+    ) -> str:
+        """
+        Get the text of a url, using the cached copy if the server says it
+        hasn't changed (or if offline).
+        """
+        cached = self.lookup(url)
+
+        if self.offline:
+            if cached is None:
+                raise OfflineCacheMiss(f"{url} is not in the cache")
+            entry, body = cached
+            return body.decode(entry.encoding)
+
+        headers: dict[str, str] = {}
+        if cached:
+            entry, _ = cached
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        r = (session or self.session).get(url, headers=headers, timeout=timeout)
+
+        if r.status_code == 304 and cached:
+            entry, body = cached
+            return body.decode(entry.encoding)
+
+        r.raise_for_status()
+        encoding = r.encoding or "utf-8"
+        etag = r.headers.get("ETag", "")
+        last_modified = r.headers.get("Last-Modified", "")
+        # kept even without validators, so it can still be read offline
+        self.store(url, r.content, etag, last_modified, encoding)
+        return r.content.decode(encoding, errors="replace")
+
+
+@lru_cache
+def get_http_cache() -> HttpCache:
+    """
+    The shared cache used by default for scraping
+    """
+    return HttpCache()
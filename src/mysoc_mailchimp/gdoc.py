@@ -1,18 +1,30 @@
-import base64
-import hashlib
-import io
 import json
 import os
-import re
+import time
 from pathlib import Path
+from typing import Any, NamedTuple, Optional
+from urllib.parse import urlsplit
 
 import mammoth
 from bs4 import BeautifulSoup, NavigableString, Tag
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+from googleapiclient.http import MediaIoBaseDownload, build_http
+from PIL import Image
 from typing_extensions import assert_never
 
+from .cache import atomic_write
+from .images import (
+    ImageJob,
+    ImageManifest,
+    ProcessedImage,
+    decode_data_uri,
+    process_images,
+)
+from .instrumentation import ApiEvent, collapse_ids, record_event
+from .workspace import Workspace, content_hash
+
 
 def enforce_tag(item: Tag | None | NavigableString) -> Tag:
     """
@@ -27,103 +39,324 @@ def enforce_tag(item: Tag | None | NavigableString) -> Tag:
             assert_never(unreachable)
 
 
-def get_docx_from_file_id(file_id: str, working_dir: Path) -> Path:
-    creds = json.loads(os.environ["GOOGLE_CLIENT_JSON"])
+DOCX_MIME_TYPE = (
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+)
+# the cached conversion, in a document's working folder
+CONVERSION_NAME = "conversion.json"
+
+
+class InstrumentedHttp:
+    """
+    Wraps the http object used by the Drive client,
+    recording each request as an ApiEvent
+    """
+
+    def __init__(self, http: Any):
+        self.http = http
+
+    def request(self, uri: str, method: str = "GET", *args: Any, **kwargs: Any):
+        endpoint = collapse_ids(urlsplit(uri).path)
+        start = time.perf_counter()
+        try:
+            response, content = self.http.request(uri, method, *args, **kwargs)
+        except Exception:
+            record_event(
+                ApiEvent("drive", method, endpoint, 0, time.perf_counter() - start)
+            )
+            raise
+        record_event(
+            ApiEvent(
+                "drive",
+                method,
+                endpoint,
+                response.status,
+                time.perf_counter() - start,
+                response_bytes=len(content or b""),
+            )
+        )
+        return response, content
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.http, name)
+
+
+def build_drive_service(credentials: Any, api_endpoint: Optional[str] = None) -> Any:
+    """
+    Build a Drive client whose requests are instrumented.
+    static_discovery uses the discovery document bundled with
+    google-api-python-client rather than fetching it.
+    """
+    http = InstrumentedHttp(AuthorizedHttp(credentials, http=build_http()))
+    return build(
+        "drive",
+        "v3",
+        http=http,
+        client_options={"api_endpoint": api_endpoint} if api_endpoint else None,
+        static_discovery=True,
+        cache_discovery=False,
+    )
+
+
+# Drive clients by process id
+_drive_services: dict[int, Any] = {}
 
-    credentials = service_account.Credentials.from_service_account_info(creds)
-    drive_service = build("drive", "v3", credentials=credentials)
 
-    request = drive_service.files().export_media(
-        fileId=file_id,
-        mimeType="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+def get_drive_service() -> Any:
+    """
+    Build the Drive client once per process. A forked worker builds its
+    own, rather than sharing its parent's keep-alive connection.
+    """
+    pid = os.getpid()
+    if pid not in _drive_services:
+        creds = json.loads(os.environ["GOOGLE_CLIENT_JSON"])
+
+        credentials = service_account.Credentials.from_service_account_info(creds)
+        _drive_services[pid] = build_drive_service(credentials)
+    return _drive_services[pid]
+
+
+def get_doc_revision(file_id: str) -> str:
+    """
+    Get a key that changes whenever the document is edited.
+    Google Docs don't have a headRevisionId, so fall back to
+    the version and modifiedTime.
+    """
+    metadata = (
+        get_drive_service()
+        .files()
+        .get(fileId=file_id, fields="headRevisionId,version,modifiedTime")
+        .execute()
     )
-    # export this drive file to a local file
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)  # type: ignore
+    if metadata.get("headRevisionId"):
+        return metadata["headRevisionId"]
+    return f"{metadata.get('version', '')}-{metadata.get('modifiedTime', '')}"
+
 
-    done = False
-    while done is False:
-        status, done = downloader.next_chunk()
-        print("Download %d%%." % int(status.progress() * 100))
+class DriveDocument(NamedTuple):
+    id: str
+    name: str = ""
 
-    fh.seek(0)
 
+def list_folder_documents(folder_id: str) -> list[DriveDocument]:
+    """
+    List the Google Docs in a Drive folder
+    """
+    files = get_drive_service().files()
+    documents: list[DriveDocument] = []
+    page_token = None
+    while True:
+        response = files.list(
+            q=(
+                f"'{folder_id}' in parents"
+                " and mimeType='application/vnd.google-apps.document'"
+                " and trashed=false"
+            ),
+            fields="nextPageToken, files(id, name)",
+            orderBy="name",
+            pageSize=100,
+            pageToken=page_token,
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True,
+        ).execute()
+        documents.extend(
+            DriveDocument(item["id"], item.get("name", ""))
+            for item in response.get("files", [])
+        )
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return documents
+
+
+def get_docx_from_file_id(file_id: str, working_dir: Path) -> Path:
+    request = (
+        get_drive_service()
+        .files()
+        .export_media(
+            fileId=file_id,
+            mimeType=DOCX_MIME_TYPE,
+        )
+    )
+
+    # export this drive file straight to a local file
     storage_path = working_dir / f"{file_id}.docx"
-    with open(storage_path, "wb") as f:
-        f.write(fh.read())
+    with open(storage_path, "wb") as fh:
+        downloader = MediaIoBaseDownload(fh, request)  # type: ignore
+
+        done = False
+        while done is False:
+            status, done = downloader.next_chunk()
+            print("Download %d%%." % int(status.progress() * 100))
 
     return storage_path
 
 
-def extract_and_save_images(html: str, temp_dir: Path) -> str:
+class ConversionCache:
+    """
+    The mammoth conversion of a document, kept by revision in its working
+    folder, so an unchanged document doesn't need exporting or converting
+    again. Being in the workspace, it counts towards the workspace's size
+    limit and is evicted along with the document's folder.
+    """
+
+    def __init__(self, working_folder: Path):
+        self.path = working_folder / CONVERSION_NAME
+
+    def get(self, revision: str) -> Optional[str]:
+        try:
+            data = json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if data.get("revision") != revision:
+            return None
+        return data["html"]
+
+    def store(self, revision: str, html: str):
+        data = {"revision": revision, "html": html}
+        atomic_write(self.path, json.dumps(data).encode("utf-8"))
+
+
+def _stored_image(
+    digest: str, manifest: ImageManifest, image_dir: Path
+) -> Optional[ProcessedImage]:
+    """
+    Find an image that has already been processed, by the hash of its bytes
+    """
+    existing = manifest.from_source(digest)
+    if existing:
+        return existing
+    for path in image_dir.glob(f"{digest}.*"):
+        if path.name.startswith("."):
+            continue
+        with Image.open(path) as image:
+            width, height = image.size
+        size = path.stat().st_size
+        return ProcessedImage(str(path), width, height, size, size, digest)
+    return None
+
+
+def extract_images(
+    soup: BeautifulSoup, temp_dir: Path, workspace: Optional[Workspace] = None
+):
     """
     In a mammoth generated HTML file,
     the images are encoded and stored directly in the file.
     This function extracts the images and saves them to disk
     and updates the original reference.
+    Images are named by the sha256 of their decoded bytes, and kept in the
+    workspace image store (or temp_dir if there is no workspace), so an
+    image is only processed once.
+    The images are processed in parallel (see images.py), and their
+    details are written to a manifest in temp_dir for the upload step.
     """
-    soup = BeautifulSoup(html, "html.parser")
+    images = [
+        image for image in soup.find_all("img") if image["src"].startswith("data:")
+    ]
 
-    # Extract all images
-    images = soup.find_all("img")
+    manifest = ImageManifest.load(temp_dir)
 
-    # Loop through images
+    # tags waiting for each image, so repeated images are processed once
+    pending: dict[str, list[Tag]] = {}
+    jobs: list[ImageJob] = []
     for image in images:
         # extract the encoded image
-        src = image["src"]
-        # use hashed src as filename
-        filename = hashlib.md5(src.encode("utf-8")).hexdigest()[:10]
-        if src.startswith("data:"):
-            # first comma seperates the metadata from the image data
-            #  but we want to include any future commas
-            metadata, encoded_image = src.split(",", 1)
-            image_find = re.search(r"image/(.*);", metadata)
-            if image_find is None:
-                raise ValueError(f"Could not extract image type from {metadata}")
-            file_ext = image_find.group(1)
-            # decode the image
-            decoded_image = base64.b64decode(encoded_image)
-            # save the image to disk
-            image_path = temp_dir / f"{filename}.{file_ext}"
-            with open(image_path, "wb") as f:
-                f.write(decoded_image)
-            # update the image src to point to the new image
-            image["src"] = str(image_path)
-
-    # decompose any a tags with an id that starts with an _
+        data, file_ext = decode_data_uri(image["src"])
+        digest = content_hash(data)
+        if digest in pending:
+            pending[digest].append(image)
+            continue
+        if workspace:
+            stem = workspace.image_stem(digest)
+        else:
+            stem = temp_dir / digest
+        existing = _stored_image(digest, manifest, stem.parent)
+        if existing:
+            # already extracted on a previous run
+            if workspace:
+                workspace.mark_used(Path(existing.path))
+            manifest.add(existing)
+            image["src"] = existing.path
+        else:
+            pending[digest] = [image]
+            jobs.append(ImageJob(data, file_ext, str(stem)))
+
+    for tags, processed in zip(pending.values(), process_images(jobs)):
+        processed.source = Path(processed.source).name
+        manifest.add(processed)
+        # update the image src to point to the new image
+        for image in tags:
+            image["src"] = processed.path
+    manifest.save(temp_dir)
+
+
+def strip_bookmark_anchors(soup: BeautifulSoup):
+    """
+    decompose any a tags with an id that starts with an _
+    """
     for a in soup.find_all("a"):
         if a.get("id", "").startswith("_"):
             a.decompose()
 
-    return str(soup)
+
+def add_block_spacing(soup: BeautifulSoup):
+    """
+    add blank lines after any closing h or p tags
+    (WordPress treats these as paragraph breaks)
+    """
+    for tag in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6", "p"]):
+        tag.insert_after("\n\n")
 
 
-def convert_docx_to_html(docx_path: Path, working_folder: Path) -> str:
+def convert_docx_to_html(docx_path: Path) -> str:
+    """
+    Convert a docx file to html with mammoth (images are embedded as data uris)
+    """
     with open(docx_path, "rb") as docx_file:
         result = mammoth.convert_to_html(docx_file)
         html: str = result.value  # The generated HTML
         messages = result.messages  # Any messages, such as warnings during conversion
-    html = extract_and_save_images(html, working_folder)  # type: ignore
     if messages:
         print(messages)  # type: ignore
-    # add newlines after any closing h or p or img tags.
-    html = re.sub(r"(</h\d>|</p>|</img>)", r"\1\n\n", html)
-
     return html
 
 
-def gdoc_to_html(file_id: str, working_folder: Path) -> str:
+def mammoth_html_to_soup(
+    html: str, working_folder: Path, workspace: Optional[Workspace] = None
+) -> BeautifulSoup:
     """
-    Download a Google Doc and convert it to HTML
+    Parse mammoth html, saving the images to disk.
     """
-    docx_path = get_docx_from_file_id(file_id, working_folder)
-    html = convert_docx_to_html(docx_path, working_folder)
-    return html
+    soup = BeautifulSoup(html, "html.parser")
+    extract_images(soup, working_folder, workspace)
+    strip_bookmark_anchors(soup)
+    add_block_spacing(soup)
+    return soup
+
+
+def gdoc_to_soup(
+    file_id: str, working_folder: Path, workspace: Optional[Workspace] = None
+) -> BeautifulSoup:
+    """
+    Download a Google Doc and convert it to a parsed tree.
+    If the document hasn't changed since the last run, the cached
+    conversion is used and nothing is downloaded.
+    """
+    html = export_and_convert(file_id, working_folder)
+    return mammoth_html_to_soup(html, working_folder, workspace)
 
 
-if __name__ == "__main__":
-    working_folder = Path("temp")
-    working_folder.mkdir(exist_ok=True)
-    file_id = "1CYfTKBwP2PgPcV0HasjbuXuh599GbATKUMVFBnfV_gk"
-    content = gdoc_to_html(file_id, working_folder)
-    Path("test.html").write_text(content)
+def export_and_convert(file_id: str, working_folder: Path) -> str:
+    """
+    Get the mammoth html for a Google Doc, from the cache if the
+    document hasn't changed.
+    """
+    cache = ConversionCache(working_folder)
+    revision = get_doc_revision(file_id)
+    html = cache.get(revision)
+    if html is None:
+        docx_path = get_docx_from_file_id(file_id, working_folder)
+        html = convert_docx_to_html(docx_path)
+        cache.store(revision, html)
+        # the conversion is cached, so the export isn't needed again
+        docx_path.unlink()
+    return html
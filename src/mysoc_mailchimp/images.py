@@ -0,0 +1,204 @@
+"""
+Image preparation for images extracted from Google Docs.
+
+Images are decoded, shrunk and recompressed across a process pool,
+and the results are recorded in a manifest that the upload step reads.
+"""
+
+from __future__ import annotations
+
+import base64
+import io
+import json
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from PIL import Image, features
+
+from .cache import atomic_write
+
+# images wider than this are shrunk (twice the 800px they're shown at)
+MAX_IMAGE_WIDTH = 1600
+# pngs bigger than this are usually screenshots and are converted
+MAX_PNG_BYTES = 300_000
+LOSSY_QUALITY = 85
+
+MANIFEST_NAME = "manifest.json"
+
+
+@dataclass
+class ProcessedImage:
+    """
+    An image written to disk, with details for the upload step
+    """
+
+    path: str
+    width: int
+    height: int
+    original_bytes: int
+    bytes: int
+    # the stem the image was asked to be saved as
+    source: str = ""
+
+
+def decode_data_uri(src: str) -> tuple[bytes, str]:
+    """
+    Get the image bytes and file extension from a data uri
+    """
+    # first comma seperates the metadata from the image data
+    #  but we want to include any future commas
+    metadata, encoded_image = src.split(",", 1)
+    image_find = re.search(r"image/(.*);", metadata)
+    if image_find is None:
+        raise ValueError(f"Could not extract image type from {metadata}")
+    return base64.b64decode(encoded_image), image_find.group(1)
+
+
+def _convert_format(image: Image.Image) -> tuple[str, str]:
+    """
+    Pick the format (and extension) to recompress a png to
+    """
+    if features.check("webp"):
+        return "WEBP", "webp"
+    if image.mode in ("RGBA", "LA", "P"):
+        # jpeg can't hold transparency, so stay as png
+        return "PNG", "png"
+    return "JPEG", "jpeg"
+
+
+class ImageJob(NamedTuple):
+    """
+    Decoded image bytes, to be saved as dest_stem.{ext}
+    """
+
+    data: bytes
+    file_ext: str
+    dest_stem: str
+
+
+def _save(dest_stem: str, ext: str, data: bytes) -> Path:
+    path = Path(f"{dest_stem}.{ext}")
+    atomic_write(path, data)
+    return path
+
+
+def process_image(
+    src: str, dest_stem: str, max_width: int = MAX_IMAGE_WIDTH
+) -> ProcessedImage:
+    """
+    Decode a data uri image and save it as dest_stem.{ext}.
+    """
+    data, file_ext = decode_data_uri(src)
+    return process_image_bytes(data, file_ext, dest_stem, max_width)
+
+
+def process_image_bytes(
+    data: bytes, file_ext: str, dest_stem: str, max_width: int = MAX_IMAGE_WIDTH
+) -> ProcessedImage:
+    """
+    Save an image as dest_stem.{ext}.
+    Wide images are shrunk, and large pngs are converted to a lossy format,
+    if that makes the file smaller.
+    """
+    if file_ext not in ("png", "jpeg", "jpg"):
+        # leave anything else (e.g. animated gifs) alone
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+        path = _save(dest_stem, file_ext, data)
+        return ProcessedImage(str(path), width, height, len(data), len(data), dest_stem)
+
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        too_wide = width > max_width
+        large_png = file_ext == "png" and len(data) > MAX_PNG_BYTES
+
+        if not (too_wide or large_png):
+            path = _save(dest_stem, file_ext, data)
+            return ProcessedImage(
+                str(path), width, height, len(data), len(data), dest_stem
+            )
+
+        if large_png:
+            image_format, new_ext = _convert_format(image)
+        else:
+            image_format, new_ext = (image.format or file_ext.upper()), file_ext
+
+        if image_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        if too_wide:
+            new_size = (max_width, max(1, max_width * height // width))
+            image.thumbnail(new_size, Image.BICUBIC)
+
+        buffer = io.BytesIO()
+        if image_format in ("JPEG", "WEBP"):
+            image.save(buffer, format=image_format, quality=LOSSY_QUALITY)
+        else:
+            image.save(buffer, format=image_format, optimize=True)
+        new_data = buffer.getvalue()
+        new_width, new_height = image.size
+
+    if not too_wide and len(new_data) >= len(data):
+        # conversion didn't help, keep the original
+        new_data, new_ext, new_width, new_height = data, file_ext, width, height
+
+    path = _save(dest_stem, new_ext, new_data)
+    return ProcessedImage(
+        str(path), new_width, new_height, len(data), len(new_data), dest_stem
+    )
+
+
+def process_images(
+    jobs: list[ImageJob], max_workers: Optional[int] = None
+) -> list[ProcessedImage]:
+    """
+    Process images, in parallel if there is more than one.
+    """
+    if len(jobs) < 2:
+        return [process_image_bytes(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(process_image_bytes, *zip(*jobs)))
+
+
+class ImageManifest:
+    """
+    Record of the processed images in a working folder, by path
+    """
+
+    def __init__(self, images: Optional[dict[str, ProcessedImage]] = None):
+        self.images = images or {}
+
+    def __getitem__(self, path: str) -> ProcessedImage:
+        return self.images[path]
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.images
+
+    def get(self, path: str) -> Optional[ProcessedImage]:
+        return self.images.get(path)
+
+    def from_source(self, source: str) -> Optional[ProcessedImage]:
+        """
+        Find an already processed image that is still on disk
+        """
+        for image in self.images.values():
+            if image.source == source and Path(image.path).exists():
+                return image
+        return None
+
+    def add(self, image: ProcessedImage):
+        self.images[image.path] = image
+
+    def save(self, folder: Path):
+        data = {path: asdict(image) for path, image in self.images.items()}
+        atomic_write(folder / MANIFEST_NAME, json.dumps(data, indent=2).encode())
+
+    @classmethod
+    def load(cls, folder: Path) -> ImageManifest:
+        path = folder / MANIFEST_NAME
+        if not path.exists():
+            return cls()
+        data = json.loads(path.read_text())
+        return cls({key: ProcessedImage(**value) for key, value in data.items()})
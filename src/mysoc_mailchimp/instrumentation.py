@@ -0,0 +1,247 @@
+"""
+Timing and usage events for calls to the Mailchimp, WordPress and Drive APIs.
+
+Every API call made through get_client, WordPressClient or the Drive
+service is recorded as an ApiEvent and passed to the registered hooks.
+Hooks can summarise the events (the --profile option), write them as
+JSON lines, or forward them to StatsD or OpenTelemetry.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import socket
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from rich import box
+from rich.console import Console
+from rich.table import Table
+
+try:
+    from opentelemetry import trace  # type: ignore
+except ImportError:
+    trace = None
+
+
+@dataclass
+class ApiEvent:
+    """
+    One call to an API (including any retries)
+    """
+
+    service: str
+    method: str
+    endpoint: str
+    status: int
+    seconds: float
+    retries: int = 0
+    response_bytes: int = 0
+    # wall clock time the call finished
+    timestamp: float = field(default_factory=time.time)
+
+
+Hook = Callable[[ApiEvent], None]
+
+_hooks: list[Hook] = []
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook: Hook):
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook: Hook):
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def record_event(event: ApiEvent):
+    """
+    Pass an event to every hook. A failing hook doesn't stop the call.
+    """
+    with _hooks_lock:
+        hooks = list(_hooks)
+    for hook in hooks:
+        try:
+            hook(event)
+        except Exception as e:
+            print(f"Instrumentation hook failed: {e}")
+
+
+def collapse_ids(path: str) -> str:
+    """
+    Replace the ids in a url path with {id}, so calls to the same
+    endpoint are grouped together
+    """
+    segments = [
+        "{id}" if re.fullmatch(r"\d+|[A-Za-z0-9_-]{20,}", segment) else segment
+        for segment in path.split("/")
+    ]
+    return "/".join(segments)
+
+
+class ApiSummary:
+    """
+    Hook that collects events and prints a table of calls per endpoint
+    """
+
+    def __init__(self):
+        self.events: list[ApiEvent] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, event: ApiEvent):
+        with self._lock:
+            self.events.append(event)
+
+    def rows(self) -> list[dict[str, Any]]:
+        """
+        Calls, time, retries and bytes per service, method and endpoint,
+        slowest total first
+        """
+        grouped: dict[tuple[str, str, str], dict[str, Any]] = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            key = (event.service, event.method, event.endpoint)
+            row = grouped.setdefault(
+                key,
+                {
+                    "service": event.service,
+                    "method": event.method,
+                    "endpoint": event.endpoint,
+                    "calls": 0,
+                    "errors": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "retries": 0,
+                    "bytes": 0,
+                },
+            )
+            row["calls"] += 1
+            row["errors"] += event.status >= 400 or event.status == 0
+            row["total"] += event.seconds
+            row["max"] = max(row["max"], event.seconds)
+            row["retries"] += event.retries
+            row["bytes"] += event.response_bytes
+        return sorted(grouped.values(), key=lambda row: row["total"], reverse=True)
+
+    def print(self, console: Optional[Console] = None):
+        console = console or Console(stderr=True)
+        rows = self.rows()
+        if not rows:
+            console.print("No API calls made")
+            return
+        table = Table(title="API calls", box=box.SIMPLE)
+        for column in [
+            "service",
+            "method",
+            "endpoint",
+            "calls",
+            "errors",
+            "total s",
+            "mean ms",
+            "max ms",
+            "retries",
+            "KB",
+        ]:
+            table.add_column(column)
+        for row in rows:
+            table.add_row(
+                row["service"],
+                row["method"],
+                row["endpoint"],
+                str(row["calls"]),
+                str(row["errors"]),
+                f"{row['total']:.2f}",
+                f"{row['total'] / row['calls'] * 1000:.0f}",
+                f"{row['max'] * 1000:.0f}",
+                str(row["retries"]),
+                f"{row['bytes'] / 1024:.1f}",
+            )
+        console.print(table)
+
+
+class JsonLinesWriter:
+    """
+    Hook that appends each event to a file as a line of json
+    """
+
+    def __init__(self, path: Path):
+        self.file = path.open("a")
+        self._lock = threading.Lock()
+
+    def __call__(self, event: ApiEvent):
+        line = json.dumps(asdict(event))
+        with self._lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class StatsdSender:
+    """
+    Hook that sends a timer and counters for each event to StatsD over udp
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 8125, prefix: str = ""):
+        self.address = (host, port)
+        self.prefix = prefix or "mysoc_mailchimp"
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def metric_name(self, event: ApiEvent) -> str:
+        endpoint = re.sub(r"[^A-Za-z0-9]+", "_", event.endpoint).strip("_")
+        return f"{self.prefix}.{event.service}.{event.method.lower()}.{endpoint}"
+
+    def __call__(self, event: ApiEvent):
+        name = self.metric_name(event)
+        lines = [
+            f"{name}.time:{event.seconds * 1000:.3f}|ms",
+            f"{name}.calls:1|c",
+            f"{name}.status_{event.status}:1|c",
+        ]
+        if event.retries:
+            lines.append(f"{name}.retries:{event.retries}|c")
+        try:
+            self.socket.sendto("\n".join(lines).encode(), self.address)
+        except OSError:
+            # metrics are best effort
+            pass
+
+
+class OpenTelemetryExporter:
+    """
+    Hook that records each event as an OpenTelemetry span.
+    Needs the opentelemetry-api package (and an SDK configured
+    to export the spans somewhere).
+    """
+
+    def __init__(self, tracer_name: str = "mysoc_mailchimp"):
+        if trace is None:
+            raise ImportError("OpenTelemetry export needs opentelemetry-api installed")
+        self.tracer = trace.get_tracer(tracer_name)
+
+    def __call__(self, event: ApiEvent):
+        end = int(event.timestamp * 1e9)
+        start = end - int(event.seconds * 1e9)
+        span = self.tracer.start_span(
+            f"{event.service} {event.method} {event.endpoint}",
+            start_time=start,
+            attributes={
+                "service.api": event.service,
+                "http.method": event.method,
+                "http.route": event.endpoint,
+                "http.status_code": event.status,
+                "http.retry_count": event.retries,
+                "http.response_content_length": event.response_bytes,
+            },
+        )
+        span.end(end_time=end)
@@ -1,7 +1,23 @@
 import datetime
+import difflib
 import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-from typing import Any, NamedTuple, NewType, Optional, TypedDict
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    NewType,
+    Optional,
+    TypedDict,
+    TypeVar,
+)
 
 import mailchimp_marketing
 import numpy as np
@@ -9,13 +25,19 @@ import pandas as pd
 import requests
 from mailchimp_marketing.api_client import ApiClientError
 
+from .cache import atomic_write, get_cache_dir
+from .instrumentation import ApiEvent, record_event
+
 InternalListID = NewType("InternalListID", str)
 InterestInternalId = NewType("InterestInternalId", str)
+T = TypeVar("T")
 
 
 class MailChimpApiKey(NamedTuple):
     api_key: str
     server: str
+    # override the api address (e.g. to point at a local test server)
+    host: Optional[str] = None
 
 
 class CategoryInfo(NamedTuple):
@@ -28,12 +50,81 @@ class MemberAndInterests(NamedTuple):
     interests: list[InterestInternalId]
 
 
+# times to retry a request that was rate limited
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+
+
+def instrument_client(client: mailchimp_marketing.Client):  # type: ignore
+    """
+    Wrap the client's requests so each call is recorded as an ApiEvent,
+    and rate limited (429) requests are retried.
+    """
+    api_client = client.api_client
+    call_api = api_client.call_api
+    request = api_client.request
+    # call_api knows the endpoint template, request makes the http call
+    local = threading.local()
+
+    def instrumented_call_api(resource_path: str, method: str, *args, **kwargs):
+        local.endpoint = resource_path
+        return call_api(resource_path, method, *args, **kwargs)
+
+    def instrumented_request(method: str, url: str, *args, **kwargs):
+        endpoint = getattr(local, "endpoint", url)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = request(method, url, *args, **kwargs)
+            except Exception:
+                record_event(
+                    ApiEvent(
+                        "mailchimp",
+                        method,
+                        endpoint,
+                        0,
+                        time.perf_counter() - start,
+                        attempt - 1,
+                    )
+                )
+                raise
+            if response.status_code == 429 and attempt <= MAX_RETRIES:
+                retry_after = response.headers.get("Retry-After", "")
+                time.sleep(
+                    float(retry_after)
+                    if retry_after.isdigit()
+                    else RETRY_BACKOFF * 2 ** (attempt - 1)
+                )
+                continue
+            break
+        record_event(
+            ApiEvent(
+                "mailchimp",
+                method,
+                endpoint,
+                response.status_code,
+                time.perf_counter() - start,
+                attempt - 1,
+                len(response.content),
+            )
+        )
+        return response
+
+    api_client.call_api = instrumented_call_api
+    api_client.request = instrumented_request
+
+
 def get_client(api_key: MailChimpApiKey) -> mailchimp_marketing.Client:  # type: ignore
     """
     Get the mailchimp api client
     """
     client = mailchimp_marketing.Client()
     client.set_config({"api_key": api_key.api_key, "server": api_key.server})
+    if api_key.host:
+        client.api_client.host = api_key.host
+    instrument_client(client)
     return client  # type: ignore
 
 
@@ -113,16 +204,7 @@ def get_segments(api_key: MailChimpApiKey, list_web_id: str) -> pd.DataFrame:
     Get segements of a list as a dataframe
     """
     client = get_client(api_key)
-    # if list_web_id can be converted to an int, it's a webid, otherwise it's a name
-    try:
-        list_id = int(list_web_id)
-        is_web_id = True
-    except ValueError:
-        is_web_id = False
-    if is_web_id:
-        list_id = list_web_id_to_unique_id(api_key, list_web_id)
-    else:
-        list_id = list_name_to_unique_id(api_key, list_web_id)
+    list_id = list_to_unique_id(api_key, list_web_id)
     response: dict[str, Any] = client.lists.list_segments(list_id, count=1000)
     df = pd.DataFrame(response["segments"])  # type: ignore
     df = df[["id", "name", "member_count"]]
@@ -130,6 +212,18 @@ def get_segments(api_key: MailChimpApiKey, list_web_id: str) -> pd.DataFrame:
     return df
 
 
+CAMPAIGN_COLUMNS = [
+    "id",
+    "web_id",
+    "type",
+    "content_type",
+    "title",
+    "status",
+    "send_time",
+    "recipient_count",
+]
+
+
 @lru_cache
 def get_recent_campaigns(api_key: MailChimpApiKey, count: int = 20) -> pd.DataFrame:
     """
@@ -139,24 +233,20 @@ def get_recent_campaigns(api_key: MailChimpApiKey, count: int = 20) -> pd.DataFr
     response: dict[str, Any] = client.campaigns.list(
         count=count, sort_field="create_time", sort_dir="DESC"
     )
-    df = pd.DataFrame(response["campaigns"])
+    return campaigns_to_frame(response["campaigns"])
+
+
+def campaigns_to_frame(campaigns: list[dict[str, Any]]) -> pd.DataFrame:
+    """
+    The main details of some campaigns as a dataframe
+    """
+    if not campaigns:
+        return pd.DataFrame(columns=CAMPAIGN_COLUMNS)
+    df = pd.DataFrame(campaigns)
     df["subject_line"] = df["settings"].apply(lambda x: x.get("subject_line", ""))  # type: ignore
     df["title"] = df["settings"].apply(lambda x: x["title"])  # type: ignore
     df["recipient_count"] = df["recipients"].apply(lambda x: x["recipient_count"])  # type: ignore
-    df = df[
-        [
-            "id",
-            "web_id",
-            "type",
-            "content_type",
-            "title",
-            "status",
-            "send_time",
-            "recipient_count",
-        ]
-    ]
-
-    return df
+    return df[CAMPAIGN_COLUMNS]
 
 
 @lru_cache
@@ -213,6 +303,18 @@ def list_name_to_unique_id(api_key: MailChimpApiKey, name: str) -> InternalListI
     return lookup[name]
 
 
+def list_to_unique_id(api_key: MailChimpApiKey, list_web_id: str) -> InternalListID:
+    """
+    Convert a list web id or name to a unique list id
+    """
+    # if list_web_id can be converted to an int, it's a webid, otherwise it's a name
+    try:
+        int(list_web_id)
+    except ValueError:
+        return list_name_to_unique_id(api_key, list_web_id)
+    return InternalListID(list_web_id_to_unique_id(api_key, list_web_id))
+
+
 def segment_name_to_unique_id(api_key: MailChimpApiKey, list_id: str, name: str) -> int:
     """
     Convert a segment's human name to a unique segment id
@@ -284,24 +386,200 @@ def get_user_hash(email: str):
     return hashlib.md5(email.lower().encode("utf-8")).hexdigest()
 
 
+# how long (seconds) the cached interest categories are trusted for
+INTEREST_TTL = 24 * 60 * 60
+# interest categories fetched at once
+INTEREST_WORKERS = 8
+
+
+class InterestCategory(NamedTuple):
+    id: str
+    title: str
+    interests: dict[str, InterestInternalId]
+
+
+class ListInterests(NamedTuple):
+    """
+    Every interest category of a list and the interests in each,
+    looked up by name or id
+    """
+
+    list_id: str
+    categories: list[InterestCategory]
+    fetched: float
+
+    def category(self, title: str) -> InterestCategory:
+        for category in self.categories:
+            if category.title == title:
+                return category
+        raise ValueError(
+            _not_found(
+                f"interest category {title!r}",
+                title,
+                [category.title for category in self.categories],
+            )
+        )
+
+    def category_by_id(self, category_id: str) -> InterestCategory:
+        for category in self.categories:
+            if category.id == category_id:
+                return category
+        raise ValueError(f"No interest category with id {category_id!r}")
+
+    def interest_ids(self, title: str, names: list[str]) -> list[InterestInternalId]:
+        category = self.category(title)
+        for name in names:
+            if name not in category.interests:
+                raise ValueError(
+                    _not_found(
+                        f"interest {name!r} in {title!r}", name, category.interests
+                    )
+                )
+        return [category.interests[name] for name in names]
+
+    def interest(self, interest_id: str) -> tuple[InterestCategory, str]:
+        """
+        The category and name of an interest
+        """
+        for category in self.categories:
+            for name, category_interest_id in category.interests.items():
+                if category_interest_id == interest_id:
+                    return category, name
+        raise ValueError(f"No interest with id {interest_id!r}")
+
+
+def _not_found(description: str, name: str, options: Iterable[str]) -> str:
+    message = f"No {description}"
+    suggestions = difflib.get_close_matches(name, list(options), n=1)
+    if suggestions:
+        message += f" - did you mean {suggestions[0]!r}?"
+    return message
+
+
+def fetch_list_interests(
+    api_key: MailChimpApiKey, internal_list_id: InternalListID
+) -> ListInterests:
+    """
+    Fetch the categories of a list, then the interests of every
+    category at once
+    """
+    client = get_client(api_key)
+    categories = client.lists.get_list_interest_categories(
+        internal_list_id, count=1000
+    )["categories"]
+
+    def interests(category: dict[str, Any]) -> InterestCategory:
+        reply = client.lists.list_interest_category_interests(
+            internal_list_id, category["id"], count=1000
+        )
+        return InterestCategory(
+            category["id"],
+            category["title"],
+            {interest["name"]: interest["id"] for interest in reply["interests"]},
+        )
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(INTEREST_WORKERS, len(categories)))
+    ) as executor:
+        fetched = list(executor.map(interests, categories))
+    return ListInterests(internal_list_id, fetched, time.time())
+
+
+class InterestIndex:
+    """
+    The interest categories (and their interest ids) of each list, saved
+    between runs so turning a name into an id doesn't need a request.
+    A list's interests are fetched again once older than the ttl, and a
+    lookup that fails against the saved copy refreshes it and tries again.
+    """
+
+    def __init__(self, path: Optional[Path] = None, ttl: float = INTEREST_TTL):
+        self.path = path or get_cache_dir("mailchimp") / "interests.json"
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        try:
+            self._lists: dict[str, dict[str, Any]] = json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._lists = {}
+
+    def _key(self, api_key: MailChimpApiKey, internal_list_id: str) -> str:
+        return f"{api_key.host or api_key.server}/{internal_list_id}"
+
+    def refresh(
+        self, api_key: MailChimpApiKey, internal_list_id: InternalListID
+    ) -> ListInterests:
+        interests = fetch_list_interests(api_key, internal_list_id)
+        with self._lock:
+            self._lists[self._key(api_key, internal_list_id)] = {
+                "fetched": interests.fetched,
+                "categories": [category._asdict() for category in interests.categories],
+            }
+            atomic_write(self.path, json.dumps(self._lists, indent=2).encode("utf-8"))
+        return interests
+
+    def lookup(
+        self,
+        api_key: MailChimpApiKey,
+        internal_list_id: InternalListID,
+        find: Callable[[ListInterests], T],
+    ) -> T:
+        """
+        Look something up in a list's interests. If it isn't found in
+        cached interests they are refreshed once, as it might be new.
+        """
+        with self._lock:
+            stored = self._lists.get(self._key(api_key, internal_list_id))
+        if stored is None or time.time() - stored["fetched"] > self.ttl:
+            return find(self.refresh(api_key, internal_list_id))
+        interests = ListInterests(
+            internal_list_id,
+            [InterestCategory(**category) for category in stored["categories"]],
+            stored["fetched"],
+        )
+        try:
+            return find(interests)
+        except ValueError:
+            return find(self.refresh(api_key, internal_list_id))
+
+    def get(
+        self, api_key: MailChimpApiKey, internal_list_id: InternalListID
+    ) -> ListInterests:
+        return self.lookup(api_key, internal_list_id, lambda interests: interests)
+
+
 @lru_cache
+def get_interest_index() -> InterestIndex:
+    """
+    The interest index shared by everything in this process
+    """
+    return InterestIndex()
+
+
 def get_interest_group(
     api_key: MailChimpApiKey, list_id: InternalListID, interest_group_label: str
 ) -> CategoryInfo:
-    client = get_client(api_key)
-    options = client.lists.get_list_interest_categories(list_id)["categories"]
-    options = [option for option in options if option["title"] == interest_group_label][
-        0
-    ]
-    category_id = options["id"]
-    # get the interests associated with the category
-    interests = client.lists.list_interest_category_interests(
+    category = get_interest_index().lookup(
+        api_key, list_id, lambda interests: interests.category(interest_group_label)
+    )
+    return CategoryInfo(category.id, dict(category.interests))
+
+
+def get_interest_ids(
+    api_key: MailChimpApiKey,
+    list_id: InternalListID,
+    interest_group_label: Optional[str],
+    interests: list[str],
+) -> list[InterestInternalId]:
+    """
+    Convert interest names in a category to their ids
+    """
+    if interest_group_label is None:
+        raise ValueError("An interest group is needed to set interests")
+    return get_interest_index().lookup(
+        api_key,
         list_id,
-        category_id,  # type: ignore
-    )["interests"]
-    # make lookup from name to id
-    interests_by_name = {interest["name"]: interest["id"] for interest in interests}
-    return CategoryInfo(category_id, interests_by_name)
+        lambda found: found.interest_ids(interest_group_label, interests),
+    )
 
 
 def get_member_from_email(
@@ -399,13 +677,9 @@ def batch_add_to_interest_group(
 ):
     client = get_client(api_key)
 
-    avaliable_list_ids = get_interest_group(
-        api_key, internal_list_id, interest_group_collection
+    interests_to_add = get_interest_ids(
+        api_key, internal_list_id, interest_group_collection, interests
     )
-
-    interests_to_add = [
-        avaliable_list_ids.interest_name_to_id[interest] for interest in interests
-    ]
     interests_to_upload = {x: True for x in interests_to_add}
 
     # upload all emails in list to audience id
@@ -476,14 +750,10 @@ def set_user_metadata(
     }
 
     if interests:
-        avaliable_list_ids = get_interest_group(
-            api_key, internal_list_id, interest_group_collection
+        interests_to_add = get_interest_ids(
+            api_key, internal_list_id, interest_group_collection, interests
         )
 
-        interests_to_add = [
-            avaliable_list_ids.interest_name_to_id[interest] for interest in interests
-        ]
-
         details["interests"] = {x: True for x in interests_to_add}
 
     if current_person:
@@ -518,28 +788,50 @@ def set_user_metadata(
         add_user_notes(api_key, internal_list_id, email, notes=notes)
 
 
-def get_all_members(
+def iter_member_pages(
     api_key: MailChimpApiKey,
     internal_list_id: InternalListID,
-    cut_off: Optional[int] = None,
-) -> list[dict[str, Any]]:
+    page_size: int = 1000,
+    fields: Optional[list[str]] = None,
+) -> Iterator[list[dict[str, Any]]]:
+    """
+    Yield the members of a list a page at a time, so callers can process
+    each page as it arrives rather than holding the whole audience.
+    fields limits what the api returns (e.g. ["members.email_address"]).
+    """
     client = get_client(api_key)
-
-    # Get all the members of the list
-    member_count = 1
-    running_members: list[dict[str, Any]] = []
-    size = 1000 if not cut_off else cut_off
+    options: dict[str, Any] = {"count": page_size}
+    if fields:
+        options["fields"] = fields
     offset = 0
-    while member_count > 0:
+    while True:
         reply = client.lists.get_list_members_info(
-            internal_list_id, count=size, offset=0
+            internal_list_id, offset=offset, **options
         )
-        running_members.extend(reply["members"])  # type: ignore
-        member_count = len(reply["members"])  # type: ignore
-        offset += size
-        if cut_off and len(running_members) > cut_off:
+        members: list[dict[str, Any]] = reply["members"]  # type: ignore
+        if members:
+            yield members
+        offset += page_size
+        if len(members) < page_size:
+            # a short page is the last page
             break
-    return running_members
+
+
+def get_all_members(
+    api_key: MailChimpApiKey,
+    internal_list_id: InternalListID,
+    cut_off: Optional[int] = None,
+) -> list[dict[str, Any]]:
+    """
+    Get all the members of a list (or the first cut_off members)
+    """
+    running_members: list[dict[str, Any]] = []
+    size = 1000 if not cut_off else min(cut_off, 1000)
+    for page in iter_member_pages(api_key, internal_list_id, page_size=size):
+        running_members.extend(page)
+        if cut_off and len(running_members) >= cut_off:
+            break
+    return running_members[:cut_off] if cut_off else running_members
 
 
 class MailChimpHandler:
@@ -547,8 +839,8 @@ class MailChimpHandler:
     Shortcut to the mailchimp api to avoid having to remember the api key
     """
 
-    def __init__(self, api_key: str, server: str = "us9"):
-        self.api_settings = MailChimpApiKey(api_key, server)
+    def __init__(self, api_key: str, server: str = "us9", host: Optional[str] = None):
+        self.api_settings = MailChimpApiKey(api_key, server, host)
 
     def get_lists(self) -> pd.DataFrame:
         return get_lists(self.api_settings)
@@ -556,6 +848,9 @@ class MailChimpHandler:
     def list_name_to_unique_id(self, name: str) -> InternalListID:
         return list_name_to_unique_id(self.api_settings, name)
 
+    def list_to_unique_id(self, list_web_id: str) -> InternalListID:
+        return list_to_unique_id(self.api_settings, list_web_id)
+
     def segment_name_to_unique_id(self, list_id: str, name: str) -> int:
         return segment_name_to_unique_id(self.api_settings, list_id, name)
 
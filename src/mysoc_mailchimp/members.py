@@ -0,0 +1,293 @@
+"""
+A compact, typed representation of a list's members as Arrow record batches.
+
+Member records from the api are deeply nested dicts (with stats, location
+and links we don't use). Here each page is flattened as it arrives into
+one row per member: the core fields as typed columns, each merge field as
+a string column (merge_<TAG>), each interest as a boolean column
+(interest_<id>), and the tags as a list column.
+
+Needs pyarrow (the `arrow` extra).
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Any, Iterable, Iterator, Optional
+
+from .mailchimp import InternalListID, MailChimpApiKey, iter_member_pages
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.compute as pc  # type: ignore
+except ImportError:
+    pa = None
+    pc = None
+
+MERGE_PREFIX = "merge_"
+INTEREST_PREFIX = "interest_"
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+# core member fields and their arrow types (by name, so the module
+# imports without pyarrow)
+CORE_FIELDS: dict[str, str] = {
+    "id": "string",
+    "email_address": "string",
+    "status": "category",
+    "email_type": "category",
+    "language": "category",
+    "source": "category",
+    "vip": "bool",
+    "member_rating": "int8",
+    "timestamp_signup": "timestamp",
+    "timestamp_opt": "timestamp",
+    "last_changed": "timestamp",
+}
+
+# ask the api for only what goes into the batches
+MEMBER_API_FIELDS = [f"members.{name}" for name in CORE_FIELDS] + [
+    "members.merge_fields",
+    "members.interests",
+    "members.tags",
+    "total_items",
+]
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("Member tables need pyarrow - install mysoc-mailchimp[arrow]")
+
+
+def _arrow_type(kind: str) -> pa.DataType:
+    return {
+        "string": pa.string(),
+        "category": pa.dictionary(pa.int32(), pa.string()),
+        "bool": pa.bool_(),
+        "int8": pa.int8(),
+        "timestamp": pa.timestamp("s", tz="UTC"),
+    }[kind]
+
+
+@dataclass(frozen=True)
+class MemberSchema:
+    """
+    The columns for a list's members: its merge field tags and interest ids
+    """
+
+    merge_fields: tuple[str, ...] = ()
+    interest_ids: tuple[str, ...] = ()
+
+    @classmethod
+    def from_members(cls, members: Iterable[dict[str, Any]]) -> MemberSchema:
+        """
+        Work out the schema from a page of members. The api returns every
+        merge field and interest of the list on each member.
+        """
+        merge_fields: set[str] = set()
+        interest_ids: set[str] = set()
+        for member in members:
+            merge_fields.update(member.get("merge_fields", {}))
+            interest_ids.update(member.get("interests", {}))
+        return cls(tuple(sorted(merge_fields)), tuple(sorted(interest_ids)))
+
+    @classmethod
+    def from_arrow(cls, schema: pa.Schema) -> MemberSchema:
+        names = schema.names
+        return cls(
+            tuple(n[len(MERGE_PREFIX) :] for n in names if n.startswith(MERGE_PREFIX)),
+            tuple(
+                n[len(INTEREST_PREFIX) :]
+                for n in names
+                if n.startswith(INTEREST_PREFIX)
+            ),
+        )
+
+    def arrow_schema(self) -> pa.Schema:
+        require_pyarrow()
+        fields = [
+            pa.field(name, _arrow_type(kind)) for name, kind in CORE_FIELDS.items()
+        ]
+        fields += [
+            pa.field(MERGE_PREFIX + tag, pa.string()) for tag in self.merge_fields
+        ]
+        fields += [
+            pa.field(INTEREST_PREFIX + interest_id, pa.bool_())
+            for interest_id in self.interest_ids
+        ]
+        fields.append(pa.field("tags", pa.list_(pa.string())))
+        return pa.schema(fields)
+
+
+def _merge_value(value: Any) -> Optional[str]:
+    """
+    Merge fields are mostly strings, but addresses are dicts and
+    numbers are numbers. Empty values become null.
+    """
+    if value == "" or value is None:
+        return None
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return str(value)
+
+
+def _timestamps(values: list[Optional[str]]) -> pa.Array:
+    strings = pa.array([value or None for value in values], pa.string())
+    return pc.strptime(strings, format=TIMESTAMP_FORMAT, unit="s").cast(
+        _arrow_type("timestamp")
+    )
+
+
+def members_to_record_batch(
+    members: list[dict[str, Any]], schema: MemberSchema
+) -> pa.RecordBatch:
+    """
+    Flatten a page of member records into a record batch.
+    Merge fields or interests not in the schema are dropped.
+    """
+    require_pyarrow()
+    arrow_schema = schema.arrow_schema()
+    columns: list[pa.Array] = []
+    for name, kind in CORE_FIELDS.items():
+        values = [member.get(name) for member in members]
+        if kind == "timestamp":
+            columns.append(_timestamps(values))
+        elif kind == "category":
+            columns.append(
+                pa.array(
+                    [value or None for value in values], pa.string()
+                ).dictionary_encode()
+            )
+        else:
+            columns.append(pa.array(values, _arrow_type(kind)))
+    for tag in schema.merge_fields:
+        columns.append(
+            pa.array(
+                [
+                    _merge_value(member.get("merge_fields", {}).get(tag))
+                    for member in members
+                ],
+                pa.string(),
+            )
+        )
+    for interest_id in schema.interest_ids:
+        columns.append(
+            pa.array(
+                [
+                    bool(member.get("interests", {}).get(interest_id))
+                    for member in members
+                ],
+                pa.bool_(),
+            )
+        )
+    columns.append(
+        pa.array(
+            [[tag["name"] for tag in member.get("tags", [])] for member in members],
+            pa.list_(pa.string()),
+        )
+    )
+    return pa.RecordBatch.from_arrays(columns, schema=arrow_schema)
+
+
+def _is_pattern(field: str) -> bool:
+    return any(character in field for character in "*?[")
+
+
+def select_columns(schema: pa.Schema, fields: list[str]) -> list[str]:
+    """
+    The columns matching a projection of column names or patterns
+    (e.g. ["email_address", "merge_*"]), in schema order. The id is
+    always kept. A pattern can match nothing (a list may have no interests),
+    but a name has to be a column.
+    """
+    for field in fields:
+        if _is_pattern(field):
+            continue
+        if not any(fnmatchcase(name, field) for name in schema.names):
+            raise ValueError(f"No member column matches {field!r}")
+    return [
+        name
+        for name in schema.names
+        if name == "id" or any(fnmatchcase(name, field) for field in fields)
+    ]
+
+
+def projected_schema(
+    schema: MemberSchema, fields: Optional[list[str]] = None
+) -> pa.Schema:
+    """
+    The arrow schema of a member table, limited to some columns
+    """
+    arrow_schema = schema.arrow_schema()
+    if not fields:
+        return arrow_schema
+    return pa.schema(
+        [arrow_schema.field(name) for name in select_columns(arrow_schema, fields)]
+    )
+
+
+def api_fields_for(fields: list[str]) -> list[str]:
+    """
+    The api fields needed for a projection of columns
+    """
+    needed = ["members.id", "total_items"]
+    for name in CORE_FIELDS:
+        if any(fnmatchcase(name, field) for field in fields):
+            needed.append(f"members.{name}")
+    for prefix, api_field in [
+        (MERGE_PREFIX, "members.merge_fields"),
+        (INTEREST_PREFIX, "members.interests"),
+        ("tags", "members.tags"),
+    ]:
+        # a pattern like merge_* or merge_FNAME needs all the merge fields
+        if any(
+            field.startswith(prefix) or fnmatchcase(prefix, field) for field in fields
+        ):
+            needed.append(api_field)
+    return needed
+
+
+def iter_member_batches(
+    api_key: MailChimpApiKey,
+    internal_list_id: InternalListID,
+    schema: Optional[MemberSchema] = None,
+    page_size: int = 1000,
+    fields: Optional[list[str]] = None,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Fetch the members of a list, converting each page to a record batch
+    as it arrives. Without a schema, it's worked out from the first page.
+    fields limits the columns (see select_columns).
+    """
+    require_pyarrow()
+    api_fields = api_fields_for(fields) if fields else MEMBER_API_FIELDS
+    columns: Optional[list[str]] = None
+    for page in iter_member_pages(
+        api_key, internal_list_id, page_size=page_size, fields=api_fields
+    ):
+        if schema is None:
+            schema = MemberSchema.from_members(page)
+        batch = members_to_record_batch(page, schema)
+        if fields:
+            columns = columns or select_columns(batch.schema, fields)
+            batch = batch.select(columns)
+        yield batch
+
+
+def get_members_table(
+    api_key: MailChimpApiKey,
+    internal_list_id: InternalListID,
+    schema: Optional[MemberSchema] = None,
+    fields: Optional[list[str]] = None,
+) -> pa.Table:
+    """
+    All the members of a list as an arrow table
+    """
+    require_pyarrow()
+    batches = list(
+        iter_member_batches(api_key, internal_list_id, schema, fields=fields)
+    )
+    if not batches:
+        return projected_schema(schema or MemberSchema(), fields).empty_table()
+    return pa.Table.from_batches(batches)
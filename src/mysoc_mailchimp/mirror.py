@@ -0,0 +1,352 @@
+"""
+A local mirror of a list, for ad-hoc SQL queries without api calls.
+
+mirror_list pulls a list's members, tags, interests, segments (and who is
+in them) and campaigns into a folder of parquet tables, with a SQLite copy.
+query_mirror runs SQL over the mirror with DuckDB if it's installed, or
+SQLite if not.
+
+The tables are:
+
+- members: a row per member (see members.py), without the tags
+- tags: member_id, tag
+- interests: category_id, category, interest_id, interest, column
+  (the interest's column in members)
+- segments: segment_id, name, member_count, type
+- segment_members: segment_id, member_id
+- campaigns: id, web_id, type, content_type, title, status, send_time,
+  recipient_count (the list's campaigns)
+
+Timestamps are UTC. In SQLite they are text ("2024-04-01 10:00:00"),
+so comparing with a date string works in both.
+
+Needs pyarrow (the `arrow` extra).
+"""
+
+from __future__ import annotations
+
+import datetime
+import functools
+import json
+import os
+import shutil
+import sqlite3
+from pathlib import Path
+from typing import Any, Optional
+
+import pandas as pd
+
+from .cache import get_cache_dir
+from .mailchimp import (
+    InternalListID,
+    MailChimpApiKey,
+    campaigns_to_frame,
+    get_client,
+    get_interest_index,
+)
+from .members import INTEREST_PREFIX, require_pyarrow
+from .snapshots import export_members, load_snapshot
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.compute as pc  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:
+    pa = None
+    pc = None
+    pq = None
+
+try:
+    import duckdb  # type: ignore
+except ImportError:
+    duckdb = None
+
+MIRROR_INFO = "mirror.json"
+SQLITE_FILE = "mirror.sqlite"
+TABLES = ["members", "tags", "interests", "segments", "segment_members", "campaigns"]
+# columns to index in the SQLite copy
+SQLITE_INDEXES = {
+    "members": ["id", "email_address"],
+    "tags": ["member_id", "tag"],
+    "segment_members": ["member_id", "segment_id"],
+}
+
+
+class MirrorQueryError(Exception):
+    """
+    Raised when the database rejects a query over the mirror
+    """
+
+
+def get_mirror_dir() -> Path:
+    return get_cache_dir("mirror")
+
+
+def _paged(fetch, key: str, fields: list[str]) -> list[dict[str, Any]]:
+    """
+    Fetch every page of a list endpoint
+    """
+    items: list[dict[str, Any]] = []
+    while True:
+        reply = fetch(count=1000, offset=len(items), fields=fields + ["total_items"])
+        items.extend(reply[key])
+        if not reply[key] or len(items) >= reply["total_items"]:
+            return items
+
+
+def get_interests_frame(
+    api_key: MailChimpApiKey, internal_list_id: InternalListID
+) -> pd.DataFrame:
+    """
+    Every interest of a list with its category (freshly fetched)
+    """
+    interests = get_interest_index().refresh(api_key, internal_list_id)
+    rows = [
+        {
+            "category_id": category.id,
+            "category": category.title,
+            "interest_id": interest_id,
+            "interest": name,
+            "column": INTEREST_PREFIX + interest_id,
+        }
+        for category in interests.categories
+        for name, interest_id in category.interests.items()
+    ]
+    return pd.DataFrame(
+        rows, columns=["category_id", "category", "interest_id", "interest", "column"]
+    )
+
+
+def get_segment_frames(
+    api_key: MailChimpApiKey,
+    internal_list_id: InternalListID,
+    include_members: bool = True,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    The segments of a list, and the ids of the members in each
+    """
+    client = get_client(api_key)
+    segments = _paged(
+        lambda **options: client.lists.list_segments(internal_list_id, **options),
+        "segments",
+        ["segments.id", "segments.name", "segments.member_count", "segments.type"],
+    )
+    segments_df = pd.DataFrame(
+        [
+            {
+                "segment_id": segment["id"],
+                "name": segment["name"],
+                "member_count": segment["member_count"],
+                "type": segment.get("type", ""),
+            }
+            for segment in segments
+        ],
+        columns=["segment_id", "name", "member_count", "type"],
+    )
+    rows = []
+    if include_members:
+        for segment in segments:
+            members = _paged(
+                functools.partial(
+                    client.lists.get_segment_members_list,
+                    internal_list_id,
+                    str(segment["id"]),
+                ),
+                "members",
+                ["members.id"],
+            )
+            rows.extend((segment["id"], member["id"]) for member in members)
+    return segments_df, pd.DataFrame(rows, columns=["segment_id", "member_id"])
+
+
+def get_campaigns_frame(
+    api_key: MailChimpApiKey, internal_list_id: InternalListID
+) -> pd.DataFrame:
+    """
+    Every campaign sent (or to be sent) to a list
+    """
+    client = get_client(api_key)
+    campaigns = _paged(
+        functools.partial(
+            client.campaigns.list,
+            list_id=internal_list_id,
+            sort_field="create_time",
+            sort_dir="DESC",
+        ),
+        "campaigns",
+        [
+            f"campaigns.{field}"
+            for field in [
+                "id",
+                "web_id",
+                "type",
+                "content_type",
+                "settings.title",
+                "settings.subject_line",
+                "status",
+                "send_time",
+                "recipients.recipient_count",
+            ]
+        ],
+    )
+    return campaigns_to_frame(campaigns)
+
+
+def _tags_table(members: pa.Table) -> pa.Table:
+    """
+    Explode the members' tag lists into a row per member and tag
+    """
+    tags = members.column("tags").combine_chunks()
+    return pa.table(
+        {
+            "member_id": pc.take(members.column("id"), pc.list_parent_indices(tags)),
+            "tag": pc.list_flatten(tags),
+        }
+    )
+
+
+def _members_for_query(path: Path) -> pa.Table:
+    members = load_snapshot(path / "members")
+    if "tags" in members.column_names:
+        members = members.drop_columns(["tags"])
+    return members
+
+
+def _sqlite_frame(table: pa.Table) -> pd.DataFrame:
+    """
+    A table as a dataframe SQLite can store: timestamps as text
+    """
+    df = table.to_pandas()
+    for name in df.columns:
+        if isinstance(df[name].dtype, pd.DatetimeTZDtype):
+            text = df[name].dt.strftime("%Y-%m-%d %H:%M:%S").astype(object)
+            df[name] = text.where(df[name].notna(), None)
+        elif isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].astype(object)
+    return df
+
+
+def _write_sqlite(path: Path, tables: dict[str, pa.Table]):
+    connection = sqlite3.connect(path / SQLITE_FILE)
+    try:
+        for name, table in tables.items():
+            _sqlite_frame(table).to_sql(name, connection, index=False)
+            for column in SQLITE_INDEXES.get(name, []):
+                connection.execute(f"CREATE INDEX {name}_{column} ON {name} ({column})")
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def mirror_list(
+    api_key: MailChimpApiKey,
+    internal_list_id: InternalListID,
+    path: Optional[Path] = None,
+    segment_members: bool = True,
+) -> dict[str, int]:
+    """
+    Pull a list into a local mirror (replacing any previous mirror at
+    path), returning the number of rows in each table
+    """
+    require_pyarrow()
+    path = path or get_mirror_dir()
+    if path.exists() and any(path.iterdir()) and not (path / MIRROR_INFO).exists():
+        raise FileExistsError(f"{path} isn't a mirror, so won't be replaced")
+    partial = path.with_name(path.name + ".partial")
+    shutil.rmtree(partial, ignore_errors=True)
+    partial.mkdir(parents=True)
+
+    export_members(api_key, internal_list_id, partial / "members")
+    segments, in_segments = get_segment_frames(
+        api_key, internal_list_id, segment_members
+    )
+    campaigns = get_campaigns_frame(api_key, internal_list_id)
+    tables: dict[str, pa.Table] = {
+        "tags": _tags_table(load_snapshot(partial / "members", ["id", "tags"])),
+        "interests": pa.Table.from_pandas(
+            get_interests_frame(api_key, internal_list_id), preserve_index=False
+        ),
+        "segments": pa.Table.from_pandas(segments, preserve_index=False),
+        "segment_members": pa.Table.from_pandas(in_segments, preserve_index=False),
+        "campaigns": pa.Table.from_pandas(campaigns, preserve_index=False),
+    }
+    for name, table in tables.items():
+        pq.write_table(table, partial / f"{name}.parquet", compression="zstd")
+
+    tables = {"members": _members_for_query(partial), **tables}
+    _write_sqlite(partial, tables)
+    counts = {name: table.num_rows for name, table in tables.items()}
+    (partial / MIRROR_INFO).write_text(
+        json.dumps(
+            {
+                "list_id": internal_list_id,
+                "mirrored_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "tables": counts,
+            }
+        )
+    )
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(partial, path)
+    return counts
+
+
+def mirror_info(path: Optional[Path] = None) -> dict[str, Any]:
+    """
+    The list and time of the mirror at path
+    """
+    path = path or get_mirror_dir()
+    info = path / MIRROR_INFO
+    if not info.exists():
+        raise FileNotFoundError(f"No mirror in {path} - run the mirror command first")
+    return json.loads(info.read_text())
+
+
+def load_mirror_table(name: str, path: Optional[Path] = None) -> pa.Table:
+    """
+    One of the mirror's tables, memory mapped
+    """
+    path = path or get_mirror_dir()
+    if name not in TABLES:
+        raise ValueError(f"No mirror table called {name!r}")
+    if name == "members":
+        return _members_for_query(path)
+    return pq.read_table(path / f"{name}.parquet", memory_map=True)
+
+
+def default_engine() -> str:
+    return "duckdb" if duckdb is not None else "sqlite"
+
+
+def query_mirror(
+    sql: str, path: Optional[Path] = None, engine: str = "auto"
+) -> pd.DataFrame:
+    """
+    Run a query over the mirror with "duckdb" or "sqlite"
+    ("auto" uses DuckDB if it's installed).
+    Bad SQL raises MirrorQueryError.
+    """
+    path = path or get_mirror_dir()
+    mirror_info(path)
+    if engine == "auto":
+        engine = default_engine()
+    if engine == "duckdb":
+        if duckdb is None:
+            raise ImportError("The duckdb engine needs duckdb installed")
+        with duckdb.connect() as connection:
+            # arrow tables are scanned in place, without copying into duckdb
+            for name in TABLES:
+                connection.register(name, load_mirror_table(name, path))
+            try:
+                return connection.execute(sql).df()
+            except duckdb.Error as error:
+                raise MirrorQueryError(str(error)) from error
+    if engine == "sqlite":
+        connection = sqlite3.connect(f"file:{path / SQLITE_FILE}?mode=ro", uri=True)
+        try:
+            return pd.read_sql_query(sql, connection)
+        # pandas wraps sqlite3.Error in its own DatabaseError
+        except (sqlite3.Error, pd.errors.DatabaseError) as error:
+            raise MirrorQueryError(str(error)) from error
+        finally:
+            connection.close()
+    raise ValueError(f"Unknown query engine {engine!r}")
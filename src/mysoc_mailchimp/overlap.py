@@ -0,0 +1,294 @@
+"""
+Overlaps between interest groups, tags and segments.
+
+Membership is held as a bit-packed matrix: a row per group and a bit per
+member, so 100k members take 12.5KB a group. The size of every pairwise
+intersection is then an AND of two rows and a popcount, done for a whole
+row of the matrix at a time.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from .mailchimp import (
+    InternalListID,
+    ListInterests,
+    MailChimpApiKey,
+    get_interest_index,
+)
+from .members import INTEREST_PREFIX, get_members_table, require_pyarrow
+from .mirror import get_segment_frames, load_mirror_table, mirror_info
+from .snapshots import load_snapshot, snapshot_info
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.compute as pc  # type: ignore
+except ImportError:
+    pa = None
+    pc = None
+
+# bits set in each byte value, for numpy without bitwise_count
+POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], np.uint8)
+
+
+def popcount(packed: np.ndarray) -> np.ndarray:
+    """
+    The number of set bits in each byte of a uint8 array
+    """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(packed)
+    return POPCOUNT_TABLE[packed]
+
+
+@dataclass
+class MembershipMatrix:
+    """
+    Which members are in which groups, as packed bits (groups x members)
+    """
+
+    labels: list[str]
+    bits: np.ndarray
+    members: int
+
+    @classmethod
+    def from_masks(cls, labels: list[str], masks: np.ndarray) -> MembershipMatrix:
+        """
+        Pack a boolean array of groups x members
+        """
+        masks = masks.reshape(len(labels), -1)
+        return cls(list(labels), np.packbits(masks, axis=1), masks.shape[1])
+
+    def sizes(self) -> np.ndarray:
+        return popcount(self.bits).sum(axis=1, dtype=np.int64)
+
+    def overlaps(self) -> np.ndarray:
+        """
+        The number of members in both of each pair of groups
+        (the diagonal is the size of each group)
+        """
+        counts = np.zeros((len(self.labels), len(self.labels)), np.int64)
+        for row in range(len(self.labels)):
+            both = np.bitwise_and(self.bits[row], self.bits[row:])
+            counts[row, row:] = popcount(both).sum(axis=1, dtype=np.int64)
+        # the matrix is symmetric, so only the upper triangle was counted
+        return np.triu(counts) + np.triu(counts, 1).T
+
+    def to_frame(self, percent: bool = False) -> pd.DataFrame:
+        """
+        The overlaps as a table, a row and column per group.
+        With percent, each row is the share of that group also in the column's
+        """
+        counts = self.overlaps()
+        if percent:
+            sizes = np.maximum(np.diag(counts), 1)
+            counts = np.round(counts / sizes[:, None] * 100, 1)
+        df = pd.DataFrame(counts, columns=self.labels)
+        df.insert(0, "group", self.labels)
+        df.insert(1, "size", self.sizes())
+        return df
+
+
+def _tag_masks(
+    rows: np.ndarray, tags: pa.Array, members: int, min_size: int
+) -> tuple[list[str], np.ndarray]:
+    """
+    A mask per tag, from the member row and name of each tag given
+    """
+    encoded = tags.dictionary_encode()
+    names = encoded.dictionary.to_pylist()
+    masks = np.zeros((len(names), members), np.bool_)
+    masks[encoded.indices.to_numpy(zero_copy_only=False), rows] = True
+    keep = masks.sum(axis=1) >= min_size
+    return [f"tag: {name}" for name, k in zip(names, keep) if k], masks[keep]
+
+
+def membership_matrix(
+    members: pa.Table,
+    interest_labels: Optional[Mapping[str, str]] = None,
+    segment_members: Optional[Mapping[str, Iterable[str]]] = None,
+    member_tags: Optional[pa.Table] = None,
+    include_tags: bool = True,
+    min_size: int = 1,
+) -> MembershipMatrix:
+    """
+    Build the matrix from a members table (see members.py), with a group
+    for each interest column, tag and segment. interest_labels maps
+    interest ids to names; segment_members maps segment names to the ids
+    of their members. Tags come from the tags column, or member_tags
+    (member_id, tag) if given. Groups smaller than min_size are left out.
+    """
+    require_pyarrow()
+    interest_labels = interest_labels or {}
+    labels: list[str] = []
+    masks: list[np.ndarray] = []
+    for name in members.column_names:
+        if name.startswith(INTEREST_PREFIX):
+            interest_id = name[len(INTEREST_PREFIX) :]
+            mask = (
+                members.column(name)
+                .fill_null(False)
+                .to_numpy()
+                .astype(np.bool_, copy=False)
+            )
+            if mask.sum() >= min_size:
+                labels.append(interest_labels.get(interest_id, interest_id))
+                masks.append(mask)
+    if include_tags and member_tags is not None:
+        rows = pc.index_in(
+            member_tags.column("member_id"), value_set=members.column("id")
+        )
+        known = rows.is_valid()
+        tag_labels, tag_masks = _tag_masks(
+            rows.filter(known).to_numpy(zero_copy_only=False),
+            member_tags.column("tag").filter(known).combine_chunks(),
+            members.num_rows,
+            min_size,
+        )
+        labels += tag_labels
+        masks += list(tag_masks)
+    elif include_tags and "tags" in members.column_names:
+        tags = members.column("tags").combine_chunks()
+        tag_labels, tag_masks = _tag_masks(
+            pc.list_parent_indices(tags).to_numpy(zero_copy_only=False),
+            pc.list_flatten(tags),
+            members.num_rows,
+            min_size,
+        )
+        labels += tag_labels
+        masks += list(tag_masks)
+    for segment, ids in (segment_members or {}).items():
+        rows = pc.index_in(members.column("id"), value_set=pa.array(list(ids)))
+        mask = rows.is_valid().to_numpy(zero_copy_only=False)
+        if mask.sum() >= min_size:
+            labels.append(f"segment: {segment}")
+            masks.append(mask)
+    if not masks:
+        return MembershipMatrix([], np.zeros((0, 0), np.uint8), members.num_rows)
+    return MembershipMatrix.from_masks(labels, np.vstack(masks))
+
+
+def interest_labels_from_frame(interests: pd.DataFrame) -> dict[str, str]:
+    """
+    "Category: Interest" labels from an interests table (see mirror.py)
+    """
+    return {
+        row.interest_id: f"{row.category}: {row.interest}"
+        for row in interests.itertuples()
+    }
+
+
+def segment_members_by_name(
+    segments: pd.DataFrame, segment_members: pd.DataFrame
+) -> dict[str, list[str]]:
+    """
+    The member ids in each segment, from the segments and segment_members
+    tables (see mirror.py)
+    """
+    names = dict(zip(segments["segment_id"], segments["name"]))
+    return {
+        names.get(segment_id, str(segment_id)): group["member_id"].tolist()
+        for segment_id, group in segment_members.groupby("segment_id")
+    }
+
+
+def matrix_from_mirror(path: Optional[Path] = None, **options) -> MembershipMatrix:
+    """
+    Build the matrix from a local mirror (see mirror.py), without any api calls
+    """
+    mirror_info(path)
+    segments = load_mirror_table("segments", path).to_pandas()
+    in_segments = load_mirror_table("segment_members", path).to_pandas()
+    return membership_matrix(
+        load_mirror_table("members", path),
+        interest_labels_from_frame(load_mirror_table("interests", path).to_pandas()),
+        segment_members_by_name(segments, in_segments),
+        member_tags=load_mirror_table("tags", path),
+        **options,
+    )
+
+
+def interest_labels_from_index(
+    api_key: MailChimpApiKey,
+    internal_list_id: InternalListID,
+    interest_ids: Iterable[str],
+) -> dict[str, str]:
+    """
+    "Category: Interest" labels for some interests of a list, from the
+    interest index (refreshed if one is missing). An interest that has
+    since been deleted keeps its id as its label.
+    """
+    interest_ids = list(interest_ids)
+
+    def labels(interests: ListInterests, strict: bool = True) -> dict[str, str]:
+        found: dict[str, str] = {}
+        for interest_id in interest_ids:
+            try:
+                category, name = interests.interest(interest_id)
+            except ValueError:
+                if strict:
+                    raise
+                continue
+            found[interest_id] = f"{category.title}: {name}"
+        return found
+
+    index = get_interest_index()
+    try:
+        return index.lookup(api_key, internal_list_id, labels)
+    except ValueError:
+        return labels(index.get(api_key, internal_list_id), strict=False)
+
+
+def _interest_ids(members: pa.Table) -> list[str]:
+    return [
+        name[len(INTEREST_PREFIX) :]
+        for name in members.column_names
+        if name.startswith(INTEREST_PREFIX)
+    ]
+
+
+def matrix_from_snapshot(
+    path: Path, api_key: Optional[MailChimpApiKey] = None, **options
+) -> MembershipMatrix:
+    """
+    Build the matrix from a snapshot (see snapshots.py). With an api key,
+    interests are labelled by name from the interest index, otherwise by id.
+    """
+    members = load_snapshot(path)
+    labels: dict[str, str] = {}
+    list_id = snapshot_info(path).get("list_id")
+    if api_key is not None and list_id:
+        labels = interest_labels_from_index(
+            api_key, InternalListID(list_id), _interest_ids(members)
+        )
+    return membership_matrix(members, labels, **options)
+
+
+def matrix_from_list(
+    api_key: MailChimpApiKey,
+    internal_list_id: InternalListID,
+    include_segments: bool = False,
+    **options,
+) -> MembershipMatrix:
+    """
+    Build the matrix from one pull of a list's members (only their ids,
+    interests and tags). Segments need a request per segment, so are
+    only included if asked for.
+    """
+    members = get_members_table(
+        api_key, internal_list_id, fields=["tags", INTEREST_PREFIX + "*"]
+    )
+    segment_members: dict[str, list[str]] = {}
+    if include_segments:
+        segment_members = segment_members_by_name(
+            *get_segment_frames(api_key, internal_list_id)
+        )
+    labels = interest_labels_from_index(
+        api_key, internal_list_id, _interest_ids(members)
+    )
+    return membership_matrix(members, labels, segment_members, **options)
@@ -0,0 +1,120 @@
+"""
+Placeholder substitution for campaign templates.
+
+A template is split on its placeholder tokens once, and filling it in is then
+a single join over the pieces - rather than a chain of str.replace calls that
+each copy (and rescan) the whole document.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Mapping, NamedTuple, Optional
+
+# The tokens used in the mySociety auto-blog mailchimp template.
+# Keys are the names used to supply values, values are the literal
+# token that appears in the template html.
+BLOG_PLACEHOLDERS: dict[str, str] = {
+    "content": "[content]",
+    "title": "[main title]",
+    "url": "http://**blog-url**",
+    "image": "https://mcusercontent.com/53d0d2026dea615ed488a8834/images/3cb63c42-5b40-2e48-6955-d2fbf9ed99d6.png",
+    "author": "[author]",
+    "description": "[description]",
+}
+
+
+class RenderResult(NamedTuple):
+    html: str
+    unfilled: list[str]
+
+
+class PlaceholderTemplate:
+    """
+    A template that has been split on a set of placeholder tokens.
+    """
+
+    def __init__(self, template: str, placeholders: Mapping[str, str]):
+        self.placeholders = dict(placeholders)
+        # find every occurrence of every token with str.find (no copying),
+        # then walk them in document order to cut the template into pieces
+        found: list[tuple[int, int, str]] = []
+        for name, token in self.placeholders.items():
+            if not token:
+                continue
+            start = template.find(token)
+            while start != -1:
+                # negative length so the longest token at a position sorts first
+                found.append((start, -len(token), name))
+                start = template.find(token, start + len(token))
+        found.sort()
+
+        self._literals: list[str] = []
+        self._names: list[str] = []
+        position = 0
+        for start, negative_length, name in found:
+            if start < position:
+                # overlaps a token we have already taken
+                continue
+            self._literals.append(template[position:start])
+            self._names.append(name)
+            position = start - negative_length
+        self._literals.append(template[position:])
+
+    @property
+    def present(self) -> set[str]:
+        """
+        Names of the placeholders that appear in the template
+        """
+        return set(self._names)
+
+    def render(self, values: Mapping[str, Optional[str]]) -> RenderResult:
+        """
+        Fill in the template in one pass.
+        Placeholders without a value are left as their original token
+        and reported back in `unfilled`.
+        """
+        fills: list[str] = []
+        unfilled: list[str] = []
+        for name in self._names:
+            value = values.get(name)
+            if value is None:
+                if name not in unfilled:
+                    unfilled.append(name)
+                value = self.placeholders[name]
+            fills.append(value)
+
+        pieces = [self._literals[0]]
+        for fill, literal in zip(fills, self._literals[1:]):
+            pieces.append(fill)
+            pieces.append(literal)
+        return RenderResult("".join(pieces), unfilled)
+
+
+@lru_cache(maxsize=16)
+def _compile_cached(
+    template: str, placeholders: tuple[tuple[str, str], ...]
+) -> PlaceholderTemplate:
+    return PlaceholderTemplate(template, dict(placeholders))
+
+
+def compile_template(
+    template: str, placeholders: Optional[Mapping[str, str]] = None
+) -> PlaceholderTemplate:
+    """
+    Compile (or fetch the already compiled) template for a set of placeholders
+    """
+    if placeholders is None:
+        placeholders = BLOG_PLACEHOLDERS
+    return _compile_cached(template, tuple(sorted(placeholders.items())))
+
+
+def fill_placeholders(
+    template: str,
+    values: Mapping[str, Optional[str]],
+    placeholders: Optional[Mapping[str, str]] = None,
+) -> RenderResult:
+    """
+    Replace the placeholder tokens in a template with values
+    """
+    return compile_template(template, placeholders).render(values)
@@ -0,0 +1,247 @@
+"""
+A sampling CPU profiler for the --profile-cpu option.
+
+A background thread records the stack of every other thread at a fixed
+interval. Each sample is weighted by the time since the previous one, as
+the sampler can't run more often than the GIL lets it. Identical stacks
+are counted together rather than kept one per sample, so memory depends
+on how varied the code is rather than how long it runs. The totals are
+written as a speedscope file (https://www.speedscope.app) and summarised
+as the hottest functions, with time split into waiting on the network,
+pandas, BeautifulSoup, idle threads and everything else.
+
+Only threads in this process are sampled, so work sent to a process
+pool (e.g. image processing) shows up as the main thread waiting.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+from typing import NamedTuple, Optional
+
+from rich import box
+from rich.console import Console
+from rich.table import Table
+
+DEFAULT_INTERVAL = 0.005
+
+# matched against the file path of any frame in the stack, first match wins
+CATEGORY_PATHS: list[tuple[str, tuple[str, ...]]] = [
+    (
+        "network",
+        (
+            "/socket.py",
+            "/ssl.py",
+            "/http/client.py",
+            "/urllib3/",
+            "/requests/",
+            "/httplib2/",
+        ),
+    ),
+    ("pandas", ("/pandas/", "/numpy/")),
+    ("BeautifulSoup", ("/bs4/", "/html/parser.py")),
+]
+# leaf functions that mean the thread is waiting for other work
+IDLE_FUNCTIONS = {"wait", "acquire", "get", "_wait_for_tstate_lock", "select"}
+IDLE_FILES = ("/threading.py", "/queue.py", "/concurrent/futures/", "/selectors.py")
+
+
+class Frame(NamedTuple):
+    name: str
+    file: str
+    line: int
+
+
+def categorise(stack: tuple[Frame, ...]) -> str:
+    """
+    Decide what a sampled stack (root first) was doing
+    """
+    for category, paths in CATEGORY_PATHS:
+        if any(path in frame.file for frame in stack for path in paths):
+            return category
+    leaf = stack[-1]
+    if leaf.name in IDLE_FUNCTIONS and any(path in leaf.file for path in IDLE_FILES):
+        return "idle"
+    return "other"
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads until stopped
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        # every frame seen, stacks refer to them by position
+        self.frames: list[Frame] = []
+        self._frame_index: dict[Frame, int] = {}
+        # per thread name, seconds sampled in each stack (root first)
+        self.stacks: dict[str, Counter[tuple[int, ...]]] = {}
+        self.sample_count = 0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_time = 0.0
+
+    def _index(self, frame: Frame) -> int:
+        index = self._frame_index.get(frame)
+        if index is None:
+            index = self._frame_index[frame] = len(self.frames)
+            self.frames.append(frame)
+        return index
+
+    def _stack(self, frame: Optional[FrameType]) -> tuple[int, ...]:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(
+                self._index(Frame(code.co_name, code.co_filename, code.co_firstlineno))
+            )
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+    def _run(self):
+        own_id = threading.get_ident()
+        last = self._start_time
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                name = names.get(thread_id, str(thread_id))
+                stacks = self.stacks.setdefault(name, Counter())
+                stacks[self._stack(frame)] += now - last
+                self.sample_count += 1
+            last = now
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._start_time
+
+    def _all_stacks(self) -> Counter[tuple[Frame, ...]]:
+        """
+        Seconds sampled in each stack, across all threads
+        """
+        totals: Counter[tuple[Frame, ...]] = Counter()
+        for stacks in self.stacks.values():
+            for stack, weight in stacks.items():
+                totals[tuple(self.frames[index] for index in stack)] += weight
+        return totals
+
+    def category_times(self) -> dict[str, float]:
+        """
+        Sampled seconds per category, across all threads
+        """
+        times: Counter[str] = Counter()
+        for stack, weight in self._all_stacks().items():
+            times[categorise(stack)] += weight
+        return dict(times)
+
+    def hot_functions(self, top: int = 15) -> list[tuple[Frame, float, float]]:
+        """
+        The functions with the most samples at the top of the stack,
+        as (frame, self seconds, total seconds). Idle stacks are left out.
+        """
+        self_times: Counter[Frame] = Counter()
+        total_times: Counter[Frame] = Counter()
+        for stack, weight in self._all_stacks().items():
+            if categorise(stack) == "idle":
+                continue
+            self_times[stack[-1]] += weight
+            # a recursive function only counts once per sample
+            for frame in set(stack):
+                total_times[frame] += weight
+        return [
+            (frame, seconds, total_times[frame])
+            for frame, seconds in self_times.most_common(top)
+        ]
+
+    def write_speedscope(self, path: Path, name: str = "mysoc_mailchimp"):
+        """
+        Write the stacks in speedscope's sampled profile format,
+        one profile per thread. Each distinct stack appears once, weighted
+        by its total time, so the flame graph views are exact but the
+        time order view is not.
+        """
+        profiles = []
+        for thread_name, stacks in self.stacks.items():
+            profiles.append(
+                {
+                    "type": "sampled",
+                    "name": thread_name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(stacks.values()),
+                    "samples": [list(stack) for stack in stacks],
+                    "weights": list(stacks.values()),
+                }
+            )
+        data = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "mysoc_mailchimp",
+            "activeProfileIndex": 0,
+            "shared": {
+                "frames": [
+                    {"name": frame.name, "file": frame.file, "line": frame.line}
+                    for frame in self.frames
+                ]
+            },
+            "profiles": profiles,
+        }
+        path.write_text(json.dumps(data))
+
+    def print_report(self, console: Optional[Console] = None, top: int = 15):
+        console = console or Console(stderr=True)
+        categories = self.category_times()
+        busy = sum(categories.values()) or 1
+        console.print(
+            f"Profiled {self.duration:.2f}s, "
+            f"{self.sample_count} samples across {len(self.stacks)} threads"
+        )
+        table = Table(title="Time by category (all threads)", box=box.SIMPLE)
+        table.add_column("category")
+        table.add_column("seconds")
+        table.add_column("%")
+        for category, seconds in sorted(
+            categories.items(), key=lambda item: item[1], reverse=True
+        ):
+            table.add_row(category, f"{seconds:.2f}", f"{seconds / busy * 100:.0f}")
+        console.print(table)
+
+        table = Table(title="Hot functions (excluding idle threads)", box=box.SIMPLE)
+        for column in ["function", "file", "self s", "total s"]:
+            table.add_column(column)
+        for frame, self_seconds, total_seconds in self.hot_functions(top):
+            table.add_row(
+                frame.name,
+                f"{_short_path(frame.file)}:{frame.line}",
+                f"{self_seconds:.2f}",
+                f"{total_seconds:.2f}",
+            )
+        console.print(table)
+
+
+def _short_path(file: str) -> str:
+    """
+    Trim a file path to the part after site-packages (or the last three parts)
+    """
+    if "site-packages/" in file:
+        return file.split("site-packages/", 1)[1]
+    return "/".join(Path(file).parts[-3:])
@@ -1,9 +1,47 @@
+import re
 from dataclasses import dataclass
+from typing import Any, NamedTuple, Optional
 
-import requests
 from bs4 import BeautifulSoup, NavigableString, Tag
 from typing_extensions import assert_never
 
+from .cache import HttpCache, get_http_cache
+
+# lxml is much faster than building a BeautifulSoup tree
+# it comes in with wordpress-api, but fall back to bs4 if it is missing
+try:
+    import lxml.html as lxml_html  # type: ignore
+except ImportError:
+    lxml_html = None
+
+
+class RemovalSelector(NamedTuple):
+    """
+    Elements with this class (and tag, if given) are removed from the post
+    """
+
+    class_name: str
+    tag: Optional[str] = None
+
+    @property
+    def css(self) -> str:
+        return f"{self.tag or ''}.{self.class_name}"
+
+
+# parts of the post that are for the website only
+REMOVAL_SELECTORS = [
+    RemovalSelector("mailchimp-signup", tag="div"),
+    RemovalSelector("web-only"),
+    RemovalSelector("blog-post-donate"),
+]
+
+# paragraphs containing these phrases are removed
+BANNED_PHRASES = [
+    "You can sign up here and you’ll get an email every time we post:",
+]
+
+MULTIPLE_NEWLINES = re.compile(r"\n{2,}")
+
 
 @dataclass
 class BlogPost:
@@ -32,22 +70,114 @@ def enforce_tag(item: Tag | None | NavigableString) -> Tag:
             assert_never(unreachable)
 
 
-def get_details_from_blog(blog_url: str) -> BlogPost:
+def get_details_from_blog(blog_url: str, cache: Optional[HttpCache] = None) -> BlogPost:
     """
-    From a mySociety blog post, extract properties to put in the email
+    From a mySociety blog post, extract properties to put in the email.
+    The page is fetched through the http cache, so an unchanged post
+    is read from disk.
     """
-    banned_phrases = [
-        "<p>You can sign up here and you’ll get an email every time we post:</p>"
-    ]
-
     # check the url is a mySociety blog
     if not blog_url.startswith("https://www.mysociety.org"):
         raise ValueError("Not a mySociety blog post")
 
-    r = requests.get(blog_url, timeout=10)
-    soup = BeautifulSoup(r.text, "html.parser")
+    page = (cache or get_http_cache()).get_text(blog_url, timeout=10)
+    return extract_blog_details(page, blog_url)
+
+
+def extract_blog_details(page: str, blog_url: str) -> BlogPost:
+    """
+    Extract the email properties from the html of a mySociety blog post
+    """
+    if lxml_html is not None:
+        blog = _extract_with_lxml(page)
+    else:
+        blog = _extract_with_bs4(page)
+    blog.url = blog_url
+    # remove any double new lines
+    blog.content = MULTIPLE_NEWLINES.sub("\n", blog.content)
+    return blog
+
+
+def _image_url_from_style(style: str) -> str:
+    return style.split("url('")[1].split("')")[0]
+
+
+def _with_class(tag: str, class_name: str) -> str:
+    """
+    XPath for elements with a class among their classes, as bs4's class_ matches
+    """
+    return (
+        f"//{tag}[contains(concat(' ', normalize-space(@class), ' '), "
+        f"' {class_name} ')]"
+    )
+
+
+def _extract_with_lxml(page: str) -> BlogPost:
+    """
+    Extraction using lxml, with a single walk over the post content
+    """
+    assert lxml_html is not None
+    doc = lxml_html.document_fromstring(page)
+
+    def first(items: list[Any], description: str) -> Any:
+        if not items:
+            raise TypeError(f"Could not find {description}")
+        return items[0]
+
+    blog = BlogPost()
+    blog.title = first(
+        doc.xpath(_with_class("h1", "mid-heading")), "title"
+    ).text_content()
+    blog.desc = first(
+        doc.xpath("//meta[@property='og:description']/@content"), "description"
+    )
+    blog.author = (
+        first(doc.xpath(_with_class("a", "blog-post-meta__author-name")), "author")
+        .text_content()
+        .strip()
+    )
+    image_item = first(
+        doc.xpath(_with_class("div", "photo-topper--cover-image")),
+        "cover image",
+    )
+    blog.image_url = _image_url_from_style(image_item.get("style", ""))
+
+    contents = first(
+        doc.xpath(_with_class("div", "wordpress-editor-content")), "post content"
+    )
+
+    to_remove = []
+    for item in contents.iter():
+        if not isinstance(item.tag, str):
+            # comments and processing instructions
+            continue
+        classes = item.get("class", "").split()
+        if any(
+            selector.class_name in classes
+            and (selector.tag is None or selector.tag == item.tag)
+            for selector in REMOVAL_SELECTORS
+        ):
+            to_remove.append(item)
+        elif item.tag == "p":
+            text = item.text_content()
+            if any(phrase in text for phrase in BANNED_PHRASES):
+                to_remove.append(item)
+
+    for item in to_remove:
+        # drop_tree keeps any text that follows the element
+        item.drop_tree()
+
+    blog.content = lxml_html.tostring(contents, encoding="unicode", with_tail=False)
+    return blog
+
+
+def _extract_with_bs4(page: str) -> BlogPost:
+    """
+    Extraction using BeautifulSoup and the pure python parser
+    """
+    soup = BeautifulSoup(page, "html.parser")
 
-    blog = BlogPost(url=blog_url)
+    blog = BlogPost()
 
     blog.title = enforce_tag(soup.find("h1", class_="mid-heading")).text
 
@@ -62,38 +192,25 @@ def get_details_from_blog(blog_url: str) -> BlogPost:
 
     contents = enforce_tag(soup.find("div", class_="wordpress-editor-content"))
 
-    # remove any divs with the class "mailchimp-signup"
-    for item in contents.find_all("div", class_="mailchimp-signup"):
-        item.decompose()
-
-    # remove any items with the class "web-only"
-    for item in contents.find_all(class_="web-only"):
-        item.decompose()
-
-    # remove donate box
-    for item in contents.find_all(class_="blog-post-donate"):
+    # remove website-only items in one pass over the content
+    css = ", ".join(selector.css for selector in REMOVAL_SELECTORS)
+    for item in contents.select(css):
         item.decompose()
 
     # remove any paragraphs that contain the banned phrases
-    for phrase in banned_phrases:
-        for item in contents.find_all("p"):
-            if phrase in item.text:
-                item.decompose()
+    for item in contents.find_all("p"):
+        text = item.text
+        if any(phrase in text for phrase in BANNED_PHRASES):
+            item.decompose()
 
     blog.content = str(contents)
 
-    # remove any double new lines
-    while "\n\n" in blog.content:
-        blog.content = blog.content.replace("\n\n", "\n")
-
     blog.author = enforce_tag(
         soup.find("a", class_="blog-post-meta__author-name")
     ).text.strip()
 
-    image_item = enforce_tag(
-        soup.find("div", class_="photo-topper photo-topper--cover-image")
-    )
+    image_item = enforce_tag(soup.find("div", class_="photo-topper--cover-image"))
     image_style: str = image_item["style"]  # type: ignore
-    blog.image_url = image_style.split("url('")[1].split("')")[0]
+    blog.image_url = _image_url_from_style(image_style)
 
     return blog
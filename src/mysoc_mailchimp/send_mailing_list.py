@@ -1,8 +1,10 @@
 import os
+from typing import Optional
 
 from rich import print
 
 from mysoc_mailchimp.mailchimp import MailChimpApiKey, get_client
+from mysoc_mailchimp.placeholders import fill_placeholders
 from mysoc_mailchimp.scraping import get_details_from_blog
 
 # Create campaign from template
@@ -14,10 +16,17 @@ def create_campaign_from_blog(
     segment_id: int,
     template_id: int,
     from_name: str = "",
+    placeholders: Optional[dict[str, str]] = None,
+    api_key: Optional[MailChimpApiKey] = None,
 ) -> tuple[str, str]:
     """
     Given a mysociety blog url, create a campaign in mailchimp that uses a set template.
     Returns the 'web id' of the campaign, which is the id used in the mailchimp url.
+
+    `placeholders` maps value names (content, title, url, image, author,
+    description) to the token used in the template, if the template
+    differs from the default.
+    `api_key` defaults to the MAILCHIMP_API_KEY environment variable.
     """
 
     blog = get_details_from_blog(url)
@@ -39,7 +48,9 @@ def create_campaign_from_blog(
         "segment_opts": {"saved_segment_id": int(segment_id)},
     }
 
-    client = get_client(MailChimpApiKey(os.environ["MAILCHIMP_API_KEY"], "us9"))
+    if api_key is None:
+        api_key = MailChimpApiKey(os.environ["MAILCHIMP_API_KEY"], "us9")
+    client = get_client(api_key)
 
     # first time around we give it a template id so it sets the content
 
@@ -84,16 +95,21 @@ def create_campaign_from_blog(
     unique_id = response["id"]
     web_id = str(response["web_id"])  # type: ignore
 
-    html = known_content
-
     # replace placeholders with actual content
-    html = html.replace("[content]", blog.content)
-    html = html.replace("[main title]", blog.title)
-    html = html.replace("http://**blog-url**", url)
-    html = html.replace(
-        "https://mcusercontent.com/53d0d2026dea615ed488a8834/images/3cb63c42-5b40-2e48-6955-d2fbf9ed99d6.png",
-        blog.image_url,
+    html, unfilled = fill_placeholders(
+        known_content,
+        {
+            "content": blog.content,
+            "title": blog.title,
+            "url": url,
+            "image": blog.image_url,
+            "author": blog.author,
+            "description": blog.desc,
+        },
+        placeholders,
     )
+    if unfilled:
+        print(f"[yellow]Unfilled placeholders: {', '.join(unfilled)}[/yellow]")
 
     # send content back
     response = client.campaigns.set_content(
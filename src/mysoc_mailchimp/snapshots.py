@@ -0,0 +1,245 @@
+"""
+Parquet snapshots of a list's members, for analysis and backups.
+
+A snapshot is a folder of zstd-compressed parquet files, partitioned by
+member status (status=subscribed/part-0.parquet and so on), with the full
+schema in _common_metadata. Pages are written as they arrive, so an export
+never holds the whole audience in memory.
+
+Needs pyarrow (the `arrow` extra).
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+
+from .mailchimp import InternalListID, MailChimpApiKey
+from .members import (
+    MemberSchema,
+    iter_member_batches,
+    projected_schema,
+    require_pyarrow,
+)
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.compute as pc  # type: ignore
+    import pyarrow.dataset as ds  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:
+    pa = None
+    pc = None
+    ds = None
+    pq = None
+
+SNAPSHOT_VERSION = 1
+METADATA_KEY = b"mysoc_mailchimp.snapshot"
+PARTITION_COLUMN = "status"
+COMMON_METADATA = "_common_metadata"
+# rows buffered per partition before writing a row group
+ROW_GROUP_SIZE = 50_000
+
+
+class SnapshotDiff(NamedTuple):
+    """
+    Members added and removed between two snapshots, and the changed values
+    of the members in both (as id, email_address, column, old, new)
+    """
+
+    added: pa.Table
+    removed: pa.Table
+    changed: pa.Table
+
+
+class _PartitionWriter:
+    """
+    Buffers the batches for one status and writes them as row groups
+    """
+
+    def __init__(self, path: Path, schema: pa.Schema, compression: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.writer = pq.ParquetWriter(path, schema, compression=compression)
+        self.batches: list[pa.RecordBatch] = []
+        self.rows = 0
+
+    def write(self, batch: pa.RecordBatch):
+        self.batches.append(batch)
+        self.rows += batch.num_rows
+        if self.rows >= ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.batches:
+            self.writer.write_table(pa.Table.from_batches(self.batches))
+        self.batches = []
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def export_members(
+    api_key: MailChimpApiKey,
+    internal_list_id: InternalListID,
+    path: Path,
+    fields: Optional[list[str]] = None,
+    compression: str = "zstd",
+) -> int:
+    """
+    Write a snapshot of a list's members to the folder at path, returning
+    the number of members. fields limits the columns (names or patterns
+    like merge_*); the id and status are always kept. The snapshot is
+    written beside path and moved into place once complete.
+    """
+    require_pyarrow()
+    if path.exists():
+        raise FileExistsError(f"{path} already exists")
+    if fields and PARTITION_COLUMN not in fields:
+        fields = [*fields, PARTITION_COLUMN]
+
+    partial = path.with_name(path.name + ".partial")
+    shutil.rmtree(partial, ignore_errors=True)
+    metadata = {
+        METADATA_KEY: json.dumps(
+            {
+                "version": SNAPSHOT_VERSION,
+                "list_id": internal_list_id,
+                "exported_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            }
+        )
+    }
+    writers: dict[str, _PartitionWriter] = {}
+    schema: Optional[pa.Schema] = None
+    total = 0
+    try:
+        for batch in iter_member_batches(api_key, internal_list_id, fields=fields):
+            if schema is None:
+                schema = batch.schema.with_metadata(metadata)
+            file_schema = schema.remove(schema.get_field_index(PARTITION_COLUMN))
+            statuses = batch.column(PARTITION_COLUMN).cast(pa.string())
+            for status in pc.unique(statuses).to_pylist():
+                part = batch.filter(pc.equal(statuses, status)).drop_columns(
+                    [PARTITION_COLUMN]
+                )
+                if status not in writers:
+                    writers[status] = _PartitionWriter(
+                        partial / f"{PARTITION_COLUMN}={status}" / "part-0.parquet",
+                        file_schema,
+                        compression,
+                    )
+                writers[status].write(
+                    pa.RecordBatch.from_arrays(part.columns, schema=file_schema)
+                )
+            total += batch.num_rows
+    finally:
+        for writer in writers.values():
+            writer.close()
+    if schema is None:
+        # an empty list still gets a loadable snapshot
+        schema = projected_schema(MemberSchema(), fields).with_metadata(metadata)
+    partial.mkdir(exist_ok=True)
+    pq.write_metadata(schema, partial / COMMON_METADATA)
+    os.replace(partial, path)
+    return total
+
+
+def snapshot_info(path: Path) -> dict[str, Any]:
+    """
+    The list id, export time and version a snapshot was written with
+    """
+    require_pyarrow()
+    metadata = pq.read_schema(path / COMMON_METADATA).metadata or {}
+    return json.loads(metadata.get(METADATA_KEY, b"{}"))
+
+
+def load_snapshot(path: Path, columns: Optional[list[str]] = None) -> pa.Table:
+    """
+    Read a snapshot back (memory mapped), optionally only some columns
+    """
+    require_pyarrow()
+    schema = pq.read_schema(path / COMMON_METADATA)
+    # partition values are read as strings, then cast back
+    status = schema.get_field_index(PARTITION_COLUMN)
+    read_schema = schema.set(status, pa.field(PARTITION_COLUMN, pa.string()))
+    table = pq.read_table(
+        path,
+        columns=columns,
+        schema=read_schema,
+        memory_map=True,
+        partitioning=ds.partitioning(
+            pa.schema([pa.field(PARTITION_COLUMN, pa.string())]), flavor="hive"
+        ),
+    )
+    # parquet renames list items, so take the types from the member schema
+    types = MemberSchema.from_arrow(schema).arrow_schema()
+    return table.cast(pa.schema([types.field(name) for name in table.column_names]))
+
+
+def _comparable(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    """
+    A column as strings, so any two columns can be compared for equality
+    """
+    if pa.types.is_list(column.type):
+        return pc.binary_join(column, "|")
+    return column.cast(pa.string())
+
+
+def diff_snapshots(old: pa.Table, new: pa.Table) -> SnapshotDiff:
+    """
+    Compare two snapshots (or member tables) by member id
+    """
+    require_pyarrow()
+    in_old = pc.is_in(new.column("id"), value_set=old.column("id"))
+    in_new = pc.is_in(old.column("id"), value_set=new.column("id"))
+    added = new.filter(pc.invert(in_old))
+    removed = old.filter(pc.invert(in_new))
+
+    # line up the members in both by sorting on id
+    old_common = old.filter(in_new)
+    new_common = new.filter(in_old)
+    old_common = old_common.take(pc.sort_indices(old_common.column("id")))
+    new_common = new_common.take(pc.sort_indices(new_common.column("id")))
+
+    email_column = "email_address" if "email_address" in new.column_names else "id"
+    changes: list[pa.Table] = []
+    for name in new.column_names:
+        if name == "id" or name not in old.column_names:
+            continue
+        before = _comparable(old_common.column(name))
+        after = _comparable(new_common.column(name))
+        differs = pc.or_(
+            pc.fill_null(pc.not_equal(before, after), False),
+            pc.xor(pc.is_null(before), pc.is_null(after)),
+        )
+        if not pc.any(differs).as_py():
+            continue
+        count = pc.sum(differs).as_py()
+        changes.append(
+            pa.table(
+                {
+                    "id": new_common.column("id").filter(differs),
+                    "email_address": _comparable(
+                        new_common.column(email_column)
+                    ).filter(differs),
+                    "column": pa.array([name] * count, pa.string()),
+                    "old": before.filter(differs),
+                    "new": after.filter(differs),
+                }
+            )
+        )
+    if changes:
+        changed = pa.concat_tables(changes)
+    else:
+        changed = pa.schema(
+            [
+                (name, pa.string())
+                for name in ["id", "email_address", "column", "old", "new"]
+            ]
+        ).empty_table()
+    return SnapshotDiff(added, removed, changed)
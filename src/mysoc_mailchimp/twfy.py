@@ -40,14 +40,32 @@ from __future__ import annotations
 
 import datetime
 import json
-from typing import Literal
-
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Literal, NamedTuple, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
 import rich
+from rich.console import Console
 
+from .cache import HttpCache, OfflineCacheMiss, get_http_cache
 from .scraping import BlogPost, get_details_from_blog
 
 DateOptions = Literal["today", "tomorrow"]
 
+BLOG_FEED_URL = "https://www.mysociety.org/feed/"
+# a WordPress feed only lists the latest posts, so older posts are
+# fetched a page at a time (?paged=2 and so on), up to this many pages
+MAX_FEED_PAGES = 20
+
+
+class FeedPost(NamedTuple):
+    url: str
+    published: Optional[datetime.date]
+
 
 def print_json_config(
     blog_url: str, start: DateOptions = "tomorrow", days_up: int = 14
@@ -82,6 +100,15 @@ def convert_blog_to_announcement(
     """
     Given a blog url, return the json for an announcement
     """
+    return json.dumps(blog_to_announcement(blog, start, days_up))
+
+
+def blog_to_announcement(
+    blog: BlogPost, start: DateOptions = "tomorrow", days_up: int = 14
+) -> dict[str, Any]:
+    """
+    Given a blog, return the announcement config
+    """
 
     blog_url = blog.url
 
@@ -120,7 +147,7 @@ def convert_blog_to_announcement(
         "end_time": end_time,
     }
 
-    return json.dumps(announcement)
+    return announcement
 
 
 def convert_blog_to_banner(
@@ -129,6 +156,15 @@ def convert_blog_to_banner(
     """
     Given a blog url, return the json for a banner
     """
+    return json.dumps(blog_to_banner(blog, start, days_up))
+
+
+def blog_to_banner(
+    blog: BlogPost, start: DateOptions = "tomorrow", days_up: int = 14
+) -> dict[str, Any]:
+    """
+    Given a blog, return the banner config
+    """
 
     blog_url = blog.url
 
@@ -160,4 +196,220 @@ def convert_blog_to_banner(
         "end_time": end_time,
     }
 
-    return json.dumps(banner)
+    return banner
+
+
+def normalise_blog_url(url: str) -> str:
+    """
+    Strip any query (e.g. utm parameters) so urls can be compared
+    """
+    parts = urlsplit(url)
+    path = parts.path if parts.path.endswith("/") else parts.path + "/"
+    return f"{parts.scheme}://{parts.netloc}{path}"
+
+
+def _feed_page_url(feed_url: str, page: int) -> str:
+    parts = urlsplit(feed_url)
+    query = parse_qsl(parts.query) + [("paged", str(page))]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _feed_root(url: str) -> ET.Element:
+    text = get_http_cache().get_text(url, timeout=30)
+    return ET.fromstring(text.encode("utf-8"))
+
+
+def _rss_date(pub_date: str) -> Optional[datetime.date]:
+    """
+    The date of an RFC 822 pubDate, or None if it is missing or malformed
+    """
+    try:
+        return parsedate_to_datetime(pub_date).date() if pub_date else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _rss_posts(root: ET.Element) -> list[FeedPost]:
+    posts: list[FeedPost] = []
+    for item in root.iter("item"):
+        link = item.findtext("link", "").strip()
+        published = _rss_date(item.findtext("pubDate", "").strip())
+        if link:
+            posts.append(FeedPost(link, published))
+    return posts
+
+
+def _sitemap_date(lastmod: str) -> Optional[datetime.date]:
+    return datetime.date.fromisoformat(lastmod[:10]) if lastmod else None
+
+
+def _sitemap_posts(root: ET.Element, since: Optional[datetime.date]) -> list[FeedPost]:
+    """
+    The urls in a sitemap - <urlset><url><loc/><lastmod/></url></urlset> -
+    or in the sitemaps of a sitemap index (e.g. WordPress's /wp-sitemap.xml)
+    """
+    namespace = root.tag.split("}")[0] + "}" if root.tag.startswith("{") else ""
+    posts: list[FeedPost] = []
+    if root.tag == f"{namespace}sitemapindex":
+        for item in root.iter(f"{namespace}sitemap"):
+            link = item.findtext(f"{namespace}loc", "").strip()
+            lastmod = _sitemap_date(item.findtext(f"{namespace}lastmod", "").strip())
+            # a sitemap last changed before since has no newer posts
+            if link and not (since and lastmod and lastmod < since):
+                posts.extend(_sitemap_posts(_feed_root(link), since))
+        return posts
+    for item in root.iter(f"{namespace}url"):
+        link = item.findtext(f"{namespace}loc", "").strip()
+        published = _sitemap_date(item.findtext(f"{namespace}lastmod", "").strip())
+        if link:
+            posts.append(FeedPost(link, published))
+    return posts
+
+
+def _warn(message: str):
+    Console(stderr=True).print(f"[yellow]Warning: {message}[/yellow]")
+
+
+def get_feed_posts(
+    feed_url: str = BLOG_FEED_URL, since: Optional[datetime.date] = None
+) -> list[FeedPost]:
+    """
+    Get the posts listed in an RSS feed or a sitemap.
+    With since, older pages of an RSS feed are fetched until they go back
+    that far, with a warning if they can't.
+    """
+    root = _feed_root(feed_url)
+    if root.tag != "rss":
+        return _sitemap_posts(root, since)
+
+    posts = _rss_posts(root)
+    page = 1
+    while True:
+        dates = [post.published for post in posts if post.published]
+        if since is None or not dates or min(dates) < since:
+            return posts
+        page += 1
+        if page > MAX_FEED_PAGES:
+            break
+        try:
+            older = _rss_posts(_feed_root(_feed_page_url(feed_url, page)))
+        except requests.HTTPError as error:
+            if error.response is not None and error.response.status_code == 404:
+                # past the last page, so there are no older posts
+                return posts
+            raise
+        except OfflineCacheMiss:
+            break
+        seen = {post.url for post in posts}
+        new = [post for post in older if post.url not in seen]
+        if not new:
+            # the feed ignores paging
+            break
+        posts.extend(new)
+    _warn(
+        f"{feed_url} only goes back to {min(dates)}, "
+        f"so posts since {since} may be missing"
+    )
+    return posts
+
+
+def get_existing_config_urls(config_path: Path) -> set[str]:
+    """
+    Get the (normalised) blog urls already in an announcement or banner config.
+    The file can be a list of items, or a dict of lists of items.
+    """
+    data = json.loads(config_path.read_text())
+    if isinstance(data, dict):
+        items = [item for value in data.values() if isinstance(value, list) for item in value]  # type: ignore
+    else:
+        items = data
+    urls: set[str] = set()
+    for item in items:
+        for key in ("url", "button_link"):
+            if item.get(key):
+                urls.add(normalise_blog_url(item[key]))
+    return urls
+
+
+def _fetch_post(url: str, cache: HttpCache) -> Optional[BlogPost]:
+    """
+    Scrape one post for the bulk config, warning and giving None
+    if it can't be fetched or read, so one bad post doesn't stop the rest
+    """
+    try:
+        return get_details_from_blog(url, cache)
+    except Exception as error:
+        _warn(f"Skipping {url}: {error!r}")
+        return None
+
+
+def bulk_json_config(
+    posts: list[str],
+    existing_urls: Optional[set[str]] = None,
+    start: DateOptions = "tomorrow",
+    days_up: int = 14,
+    max_workers: int = 8,
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """
+    Scrape a set of blog posts concurrently, and return the announcement
+    and banner configs for any that aren't already in the existing config.
+    Posts that fail to scrape are skipped with a warning.
+    """
+    existing_urls = existing_urls or set()
+    to_fetch: list[str] = []
+    for url in posts:
+        normalised = normalise_blog_url(url)
+        if normalised not in existing_urls and url not in to_fetch:
+            to_fetch.append(url)
+
+    # the shared http cache holds one session, so connections are reused
+    cache = get_http_cache()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetched = list(executor.map(lambda url: _fetch_post(url, cache), to_fetch))
+    blogs = [blog for blog in fetched if blog is not None]
+
+    announcements = [blog_to_announcement(blog, start, days_up) for blog in blogs]
+    banners = [blog_to_banner(blog, start, days_up) for blog in blogs]
+    return announcements, banners
+
+
+def print_bulk_json_config(
+    feed_url: str = BLOG_FEED_URL,
+    since: Optional[datetime.date] = None,
+    existing_configs: Optional[list[Path]] = None,
+    start: DateOptions = "tomorrow",
+    days_up: int = 14,
+    max_workers: int = 8,
+):
+    """
+    Print the announcement and banner configs for all posts in the feed
+    since a date, skipping any already in the existing config files.
+    """
+    posts = [
+        post.url
+        for post in get_feed_posts(feed_url, since)
+        if since is None or (post.published and post.published >= since)
+    ]
+    existing_urls: set[str] = set()
+    for config_path in existing_configs or []:
+        existing_urls |= get_existing_config_urls(config_path)
+
+    announcements, banners = bulk_json_config(
+        posts, existing_urls, start, days_up, max_workers
+    )
+
+    base_admin_url = "https://www.theyworkforyou.com/admin/banner.php?editorial_option="
+
+    rich.print(f"[blue] {len(banners)} new posts from {feed_url} [/blue]")
+
+    rich.print(
+        f"[blue] Add these here: {base_admin_url}announcements [/blue]",
+    )
+
+    rich.print_json(json.dumps(announcements))
+
+    rich.print(
+        f"[blue] Add these here: {base_admin_url}banner [/blue]",
+    )
+
+    rich.print_json(json.dumps(banners))
@@ -1,10 +1,22 @@
+import hashlib
+import json
 import os
+import re
+import threading
+import time
 from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from typing import Literal
+from typing import Any, Literal, NamedTuple, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from rich import print
 from typing_extensions import Self
+from urllib3.exceptions import NewConnectionError
+
+from .cache import atomic_write, get_cache_dir
+from .instrumentation import ApiEvent, record_event
 
 # WordPress API configuration
 # Application password (5 four letter words seperated by spaces, get from profile page)
@@ -16,21 +28,271 @@ PASSWORD = os.environ.get("WORDPRESS_PASSWORD")
 DraftOptions = Literal["draft", "publish", "future", "pending", "private"]
 
 
+class WordPressApiError(Exception):
+    """
+    Raised when WordPress returns an error response
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"WordPress error {status}: {message}")
+        self.status = status
+
+
+class RateLimiter:
+    """
+    Spaces out calls so no more than `rate` start each second,
+    across all threads sharing it.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _not_sent(error: requests.RequestException) -> bool:
+    """
+    Whether a request failed before reaching the server
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class WordPressClient:
+    """
+    Client for the WordPress REST API.
+    Holds a keep-alive session, retries with backoff on 429/5xx and
+    records an ApiEvent for every request.
+    A POST might have been carried out before a timeout or gateway error,
+    so it is only retried when it never reached WordPress or was refused
+    (429/503), never creating a duplicate post or media item.
+    """
+
+    retry_statuses = {429, 500, 502, 503, 504}
+    unsafe_retry_statuses = {429, 503}
+    idempotent_methods = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+        timeout: int = 60,
+        pool_size: int = 10,
+    ):
+        self.base_url = base_url or WORDPRESS_URL or ""
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.auth = (username or USERNAME or "", password or PASSWORD or "")
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.rate_limiter: Optional[RateLimiter] = None
+
+    def request(
+        self, method: str, endpoint: str, check: bool = True, **kwargs: Any
+    ) -> requests.Response:
+        """
+        Make a request to wp-json/wp/v2/{endpoint}.
+        Unless check is False, an error response raises WordPressApiError.
+        """
+        url = f"{self.base_url}wp-json/wp/v2/{endpoint}"
+        kwargs.setdefault("timeout", self.timeout)
+        # a file body needs rewinding before it can be sent again
+        body = kwargs.get("data")
+        start_position = body.tell() if hasattr(body, "seek") else None
+
+        idempotent = method.upper() in self.idempotent_methods
+        retry_statuses = (
+            self.retry_statuses if idempotent else self.unsafe_retry_statuses
+        )
+
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            if start_position is not None:
+                body.seek(start_position)  # type: ignore
+            if self.rate_limiter:
+                self.rate_limiter.wait()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if attempt > self.max_retries or not (idempotent or _not_sent(error)):
+                    record_event(
+                        ApiEvent(
+                            "wordpress",
+                            method,
+                            re.sub(r"/\d+", "/{id}", endpoint),
+                            0,
+                            time.perf_counter() - start,
+                            attempt - 1,
+                        )
+                    )
+                    raise
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+                continue
+            if response.status_code in retry_statuses and attempt <= self.max_retries:
+                retry_after = response.headers.get("Retry-After", "")
+                delay = (
+                    float(retry_after)
+                    if retry_after.isdigit()
+                    else self.backoff * 2 ** (attempt - 1)
+                )
+                time.sleep(delay)
+                continue
+            break
+
+        record_event(
+            ApiEvent(
+                "wordpress",
+                method,
+                re.sub(r"/\d+", "/{id}", endpoint),
+                response.status_code,
+                time.perf_counter() - start,
+                attempt - 1,
+                len(response.content),
+            )
+        )
+
+        if check and not response.ok:
+            try:
+                message = response.json().get("message", response.text)
+            except ValueError:
+                message = response.text
+            raise WordPressApiError(response.status_code, message)
+        return response
+
+    def get(self, endpoint: str, **kwargs: Any) -> Any:
+        return self.request("GET", endpoint, **kwargs).json()
+
+    def post(self, endpoint: str, **kwargs: Any) -> Any:
+        return self.request("POST", endpoint, **kwargs).json()
+
+
+@lru_cache
+def get_wordpress_client() -> WordPressClient:
+    """
+    The client shared by all WordPress calls in this process
+    """
+    return WordPressClient()
+
+
+# how long (seconds) the cached categories and users are trusted for
+TAXONOMY_TTL = 24 * 60 * 60
+
+
+def get_all_pages(endpoint: str) -> list[dict[str, Any]]:
+    """
+    Get every item from a paginated WordPress list endpoint
+    """
+    client = get_wordpress_client()
+    items: list[dict[str, Any]] = []
+    page = 1
+    while True:
+        response = client.request(
+            "GET", endpoint, params={"per_page": 100, "page": page}
+        )
+        items.extend(response.json())
+        total_pages = int(response.headers.get("X-WP-TotalPages", 1))
+        if page >= total_pages:
+            break
+        page += 1
+    return items
+
+
+class TaxonomyIndex:
+    """
+    Category name and user slug to id lookups for each WordPress site,
+    kept on disk so a post doesn't page through every category and user.
+    Fetched again after a day, or once per process for a name that's missing
+    (e.g. a category added since).
+    """
+
+    def __init__(self, path: Optional[Path] = None, ttl: float = TAXONOMY_TTL):
+        self.path = path or get_cache_dir("wordpress") / "taxonomy.json"
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._refreshed = False
+        try:
+            self._sites: dict[str, dict[str, Any]] = json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._sites = {}
+
+    def _site(self) -> dict[str, Any]:
+        return self._sites.get(get_wordpress_client().base_url, {})
+
+    def _is_stale(self) -> bool:
+        return time.time() - self._site().get("fetched", 0) > self.ttl
+
+    def refresh(self):
+        """
+        Fetch all categories and users from WordPress
+        """
+        categories = get_all_pages("categories")
+        users = get_all_pages("users")
+        self._sites[get_wordpress_client().base_url] = {
+            "fetched": time.time(),
+            "categories": {c["name"]: c["id"] for c in categories},
+            "users": {u["slug"]: u["id"] for u in users},
+        }
+        atomic_write(self.path, json.dumps(self._sites, indent=2).encode("utf-8"))
+        self._refreshed = True
+
+    def _lookup(self, kind: str, names: list[str]) -> dict[str, int]:
+        with self._lock:
+            if self._is_stale():
+                self.refresh()
+            lookup: dict[str, int] = self._site()[kind]
+            if not self._refreshed and any(name not in lookup for name in names):
+                # might be new since the cache was filled
+                self.refresh()
+                lookup = self._site()[kind]
+        return {name: lookup[name] for name in names if name in lookup}
+
+    def category_ids(self, category_names: list[str]) -> list[int]:
+        found = self._lookup("categories", category_names)
+        missing = [name for name in category_names if name not in found]
+        if missing:
+            print(
+                f"[yellow]Categories not found in WordPress: {', '.join(missing)}[/yellow]"
+            )
+        return list(found.values())
+
+    def author_id(self, username: str) -> int:
+        found = self._lookup("users", [username])
+        if username not in found:
+            raise ValueError(f"User {username} not found")
+        return found[username]
+
+
+@lru_cache
+def get_taxonomy_index() -> TaxonomyIndex:
+    """
+    The taxonomy index shared by all posts in this process
+    """
+    return TaxonomyIndex()
+
+
 def get_category_id_from_name(category_names: list[str]) -> list[int]:
     """
-    convert a list of category slugs to a list of category IDs
+    convert a list of category names to a list of category IDs
     """
-    api_url = f"{WORDPRESS_URL}wp-json/wp/v2/categories"
-    data = {
-        "per_page": 50,
-    }
-    response = requests.get(api_url, auth=(USERNAME, PASSWORD), params=data, timeout=60)
-    result = response.json()
-    category_ids = []
-    for category in result:
-        if category["name"] in category_names:
-            category_ids.append(category["id"])
-    return category_ids
+    return get_taxonomy_index().category_ids(category_names)
 
 
 def get_author_id_from_username(username: str) -> int:
@@ -43,16 +305,81 @@ def get_author_id_from_username(username: str) -> int:
     Returns:
         int: The author ID.
     """
-    api_url = f"{WORDPRESS_URL}wp-json/wp/v2/users"
-    data = {
-        "per_page": 50,
-    }
-    response = requests.get(api_url, auth=(USERNAME, PASSWORD), params=data, timeout=60)
-    result = response.json()
-    for user in result:
-        if user["slug"] == username:
-            return user["id"]
-    raise ValueError(f"User {username} not found")
+    return get_taxonomy_index().author_id(username)
+
+
+class MediaRecord(NamedTuple):
+    id: int
+    media_url: str
+
+
+def hash_file(path: Path) -> str:
+    """
+    sha256 of the contents of a file
+    """
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaIndex:
+    """
+    Local index of image content hashes to media already uploaded to WordPress,
+    so re-running an upload doesn't add the same image to the library again.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or get_cache_dir("wordpress") / "media_index.json"
+        self._lock = threading.Lock()
+        try:
+            self._sites: dict[str, dict[str, list]] = json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._sites = {}
+
+    def _save(self):
+        atomic_write(self.path, json.dumps(self._sites, indent=2).encode("utf-8"))
+
+    def get(self, content_hash: str) -> Optional[MediaRecord]:
+        with self._lock:
+            record = self._sites.get(get_wordpress_client().base_url, {}).get(
+                content_hash
+            )
+        return MediaRecord(*record) if record else None
+
+    def add(self, content_hash: str, record: MediaRecord):
+        with self._lock:
+            self._sites.setdefault(get_wordpress_client().base_url, {})[
+                content_hash
+            ] = list(record)
+            self._save()
+
+    def remove(self, content_hash: str):
+        with self._lock:
+            self._sites.get(get_wordpress_client().base_url, {}).pop(content_hash, None)
+            self._save()
+
+
+@lru_cache
+def get_media_index() -> MediaIndex:
+    """
+    The media index shared by all uploads in this process
+    """
+    return MediaIndex()
+
+
+def media_exists(media_id: int) -> bool:
+    """
+    Check a media item is still in the WordPress library
+    """
+    response = get_wordpress_client().request(
+        "GET",
+        f"media/{media_id}",
+        check=False,
+        params={"context": "edit", "_fields": "id"},
+    )
+    return response.ok
 
 
 @dataclass
@@ -65,13 +392,38 @@ class BlogImage:
     id: int = -1
     media_url: str = ""
 
-    def upload_image(self) -> Self:
+    def media_key(self, content_hash: str) -> str:
+        """
+        The media index key for this image: its content, plus any
+        metadata given, as WordPress keeps alt text and titles on the
+        media item rather than where it is used
+        """
+        metadata = [self.title, self.alt_text, self.caption, self.description]
+        if not any(metadata):
+            return content_hash
+        digest = hashlib.sha256(json.dumps(metadata).encode("utf-8")).hexdigest()
+        return f"{content_hash}-{digest[:16]}"
+
+    def upload_image(
+        self, verify: bool = True, content_hash: Optional[str] = None
+    ) -> Self:
         """
         Upload an image to WordPress.
+
+        If an image with the same content and metadata has been uploaded
+        before, the existing media item is used instead.
+        With verify, the existing item is checked to still exist in WordPress.
+        Pass content_hash if the file has already been hashed.
         """
+        index = get_media_index()
+        key = self.media_key(content_hash or hash_file(self.image_path))
+        existing = index.get(key)
+        if existing and (not verify or media_exists(existing.id)):
+            self.id, self.media_url = existing
+            return self
+        if existing:
+            index.remove(key)
 
-        api_url = f"{WORDPRESS_URL}wp-json/wp/v2/media"
-        image_file = self.image_path.read_bytes()
         # construct headers based on path type time and extension
         filename = self.image_path.name
         headers = {}
@@ -80,35 +432,37 @@ class BlogImage:
                 headers["Content-Type"] = "image/png"
             case ".jpg" | ".jpeg":
                 headers["Content-Type"] = "image/jpeg"
+            case ".webp":
+                headers["Content-Type"] = "image/webp"
             case _:
                 raise ValueError(f"File type {self.image_path.suffix} not supported")
 
         headers["Content-Disposition"] = f'attachment; filename="{filename}"'
 
-        json_data = {
+        # WordPress reads the metadata from the query string when the body
+        # is the raw file, so this only needs one request
+        params = {
             "title": self.title or self.image_path.name,
             "alt_text": self.alt_text or self.image_path.name,
         }
-        response = requests.post(
-            api_url,
-            auth=(USERNAME, PASSWORD),
-            headers=headers,
-            data=image_file,
-            timeout=60,
-        )
-        result = response.json()
-        self.id = result["id"]
+        if self.caption:
+            params["caption"] = self.caption
+        if self.description:
+            params["description"] = self.description
 
-        # update the image with the rest of the data
-        api_url = f"{WORDPRESS_URL}wp-json/wp/v2/media/{self.id}"
-        response = requests.post(
-            api_url,
-            auth=(USERNAME, PASSWORD),
-            json=json_data,
-            timeout=60,
-        )
+        # passing the file handle streams the upload rather than
+        # holding the whole image in memory
+        with self.image_path.open("rb") as image_file:
+            result = get_wordpress_client().post(
+                "media",
+                headers=headers,
+                params=params,
+                data=image_file,
+            )
+        self.id = result["id"]
 
         self.media_url = result["source_url"]
+        index.add(key, MediaRecord(self.id, self.media_url))
         return self
 
 
@@ -127,7 +481,6 @@ class BlogPost:
 
         # convert cateogires to comma seperated string
         category_ids = ",".join([str(i) for i in category_ids])
-        api_url = f"{WORDPRESS_URL}wp-json/wp/v2/posts"
         data = {
             "title": self.title,
             "content": self.content,
@@ -141,8 +494,5 @@ class BlogPost:
                 self.featured_media.upload_image()
             data["featured_media"] = self.featured_media.id
 
-        response = requests.post(
-            api_url, auth=(USERNAME, PASSWORD), json=data, timeout=60
-        )
-        result = response.json()
+        result = get_wordpress_client().post("posts", json=data)
         return result["id"]
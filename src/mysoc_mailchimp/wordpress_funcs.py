@@ -1,35 +1,114 @@
+import copy
+import csv
+import json
 import os
 import re
 import tempfile
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
+from typing import Literal, get_args
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, PageElement
 from PIL import Image
+from rich import print
 from ruamel.yaml import YAML
 from typing_extensions import Self
 from unsplash.api import Api as unsplash_api
 from unsplash.auth import Auth
 
-from .gdoc import gdoc_to_html
-from .wordpress_api import BlogImage, BlogPost
+from .gdoc import DriveDocument, export_and_convert, gdoc_to_soup, mammoth_html_to_soup
+from .images import ImageManifest
+from .wordpress_api import (
+    BlogImage,
+    BlogPost,
+    RateLimiter,
+    get_wordpress_client,
+    hash_file,
+)
+from .workspace import get_workspace
 
 # Unsplash API configuration
 UNSPLASH_ACCESS_KEY = os.environ.get("UNSPLASH_CLIENT_ID")
 
+# how many images to upload to wordpress at once
+UPLOAD_WORKERS = 4
+
+# size and quality of the featured image requested from unsplash
+FEATURED_IMAGE_WIDTH = 1200
+FEATURED_IMAGE_QUALITY = 80
+
+
+InjectionPosition = Literal[
+    "start_of_document",
+    "before_first_h2",
+    "before_h2",
+    "after_paragraph",
+    "end_of_document",
+]
+INJECTION_POSITIONS: tuple[InjectionPosition, ...] = get_args(InjectionPosition)
+
+
+@dataclass
+class InjectionRule:
+    """
+    A piece of html to inject at a position in the document.
+    before_h2 is every h2 but the first, and after_paragraph
+    needs the paragraph number (n, counting from 1).
+    The html is parsed once, when the rule is created.
+    """
+
+    position: InjectionPosition
+    html: str
+    n: int = 0
+    fragment: BeautifulSoup = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.position not in INJECTION_POSITIONS:
+            raise ValueError(
+                f"Unknown injection position {self.position}, "
+                f"expected one of {', '.join(INJECTION_POSITIONS)}"
+            )
+        if self.position == "after_paragraph" and self.n < 1:
+            raise ValueError("after_paragraph injections need n (from 1)")
+        self.fragment = BeautifulSoup(self.html, "html.parser")
+
+    def nodes(self) -> list[PageElement]:
+        """
+        A fresh copy of the parsed fragment, to insert into a document
+        """
+        return [copy.copy(node) for node in self.fragment.contents]
+
 
 @dataclass
 class WordpressConfig:
     """
     Dataclass for storing the injection phrases.
+    The before_first_h2, before_h2 and end_of_document keys are
+    shorthand for injection rules at those positions.
     """
 
-    before_first_h2: str
-    before_h2: str
-    end_of_document: str
     categories: list[str]
     author: str
+    before_first_h2: str = ""
+    before_h2: str = ""
+    end_of_document: str = ""
+    injections: list[InjectionRule] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.injections = [
+            rule if isinstance(rule, InjectionRule) else InjectionRule(**rule)
+            for rule in self.injections
+        ]
+        # the shorthand keys come first, so they keep their old order
+        legacy = [
+            InjectionRule("before_first_h2", self.before_first_h2),
+            InjectionRule("before_h2", self.before_h2),
+            InjectionRule("end_of_document", self.end_of_document),
+        ]
+        self.rules = legacy + self.injections
 
     @classmethod
     def from_yaml(cls, path: Path) -> Self:
@@ -54,67 +133,196 @@ class UnsplashData:
     alt_text: str
 
 
-def download_image(image_url: str, image_ext: str) -> Path:
+def download_image(image_url: str, dest: Path) -> Path:
     """
-    Download the image from the given URL.
+    Download the image from the given URL to dest.
 
-    Write to a temporary file and return the path to the file.
+    The image is streamed to a temporary file next to dest, which is
+    renamed once complete, so dest is never a partial download.
     """
-    response = requests.get(image_url)
-    # get filename from response
+    fd, temp_name = tempfile.mkstemp(dir=dest.parent, prefix=f".{dest.name}.")
+    try:
+        with requests.get(image_url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            with os.fdopen(fd, "wb") as temp_file:
+                for chunk in response.iter_content(chunk_size=256 * 1024):
+                    temp_file.write(chunk)
+        os.replace(temp_name, dest)
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+    return dest
+
+
+def sized_unsplash_url(
+    raw_url: str,
+    width: int = FEATURED_IMAGE_WIDTH,
+    quality: int = FEATURED_IMAGE_QUALITY,
+) -> str:
+    """
+    Unsplash serves images through imgix, so the raw url takes parameters
+    to get a resized jpeg rather than the full size original.
+    """
+    parts = urlsplit(raw_url)
+    query = dict(parse_qsl(parts.query))
+    query.update({"w": str(width), "q": str(quality), "fm": "jpg", "fit": "max"})
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
 
-    # write to temporary file that includes the filename - do not delete
-    # the file when it is closed
-    temp_file = tempfile.NamedTemporaryFile(suffix=image_ext, delete=False)
-    temp_file.write(response.content)
-    temp_file.close()
-    return Path(temp_file.name)
+def shrink_image(path: Path, width: int = FEATURED_IMAGE_WIDTH):
+    """
+    Resize an image in place so it is never wider than width.
+    Only used if the server didn't already resize it.
+    """
+    with Image.open(path) as image:
+        if image.width <= width:
+            return
+        # for jpegs, decode at a reduced scale rather than the full image
+        image.draft("RGB", (width, width))
+        # preserve aspect ratio, use anti-aliasing
+        image.thumbnail((width, width), Image.BICUBIC)
+        image.save(path, quality=FEATURED_IMAGE_QUALITY)
 
 
 def inject_content(
     soup: BeautifulSoup, config: WordpressConfig, unsplash_data: UnsplashData
 ) -> BeautifulSoup:
-    """ """
-    # Custom content to be injected
-    before_first_h2 = config.before_first_h2
-    before_h2 = config.before_h2
-    end_of_document = config.end_of_document
-
-    unsplash_url = unsplash_data.url
-    unsplash_author = unsplash_data.author
-
-    html = str(soup)
-
-    # inject before first h2
-    html = re.sub(
-        r"<h2>(.*?)</h2>",
-        before_first_h2 + r"\n\n<h2 pos=1>\1</h2>",
-        html,
-        count=1,
-    )
-
-    # inject before each h2 that isn't the first one
-    html = re.sub(
-        r"<h2>(.*?)</h2>",
-        before_h2 + r"\n\n<h2>\1</h2>\n\n",
-        html,
-    )
+    """
+    Inject the custom content from the config into the tree,
+    along with a credit for the unsplash image.
+    The headings and paragraphs are found in a single walk of the tree.
+    """
+    rules: dict[InjectionPosition, list[InjectionRule]] = {
+        position: [] for position in INJECTION_POSITIONS
+    }
+    for rule in config.rules:
+        rules[rule.position].append(rule)
+    after_paragraph: dict[int, list[InjectionRule]] = {}
+    for rule in rules["after_paragraph"]:
+        after_paragraph.setdefault(rule.n, []).append(rule)
+
+    h2_count = 0
+    paragraph_count = 0
+    for tag in soup.find_all(["h2", "p"]):
+        if tag.name == "p":
+            paragraph_count += 1
+            for rule in reversed(after_paragraph.get(paragraph_count, [])):
+                tag.insert_after("\n\n", *rule.nodes())
+            continue
+
+        h2_count += 1
+        if h2_count == 1:
+            # inject before first h2
+            for rule in rules["before_first_h2"]:
+                tag.insert_before(*rule.nodes(), "\n\n")
+        else:
+            # inject before each h2 that isn't the first one
+            for rule in rules["before_h2"]:
+                tag.insert_before(*rule.nodes(), "\n\n")
+            tag.insert_after("\n\n")
+
+    for rule in reversed(rules["start_of_document"]):
+        soup.insert(0, "\n\n")
+        for node in reversed(rule.nodes()):
+            soup.insert(0, node)
 
     # Create footer content with Unsplash image details
-    footer_content = (
-        f'<p>Image: <a href="{unsplash_url}">{unsplash_author}</a> on Unsplash.</p>'
+    footer_content = BeautifulSoup(
+        f'<p>Image: <a href="{unsplash_data.url}">{unsplash_data.author}</a>'
+        " on Unsplash.</p>",
+        "html.parser",
     )
 
     # inject at end of document
-    html += "\n\n" + end_of_document
-    html += "\n\n" + footer_content
-
-    soup = BeautifulSoup(html, "html.parser")
+    for rule in rules["end_of_document"]:
+        soup.extend(["\n\n", *rule.nodes()])
+    soup.extend(["\n\n", *footer_content.contents])
 
     return soup
 
 
-def get_unsplash_image(url: str) -> UnsplashData:
+def pop_unsplash_url(soup: BeautifulSoup) -> str | None:
+    """
+    check if any a tags in the document are a link to unsplash
+    if so, assume this is the unsplash_url we want, capture that
+    and decompose the tag
+    """
+    for a in soup.find_all("a"):
+        if a.get("href", "").startswith("https://unsplash.com/photos/"):
+            unsplash_url = a["href"]
+            a.decompose()
+            return unsplash_url
+    return None
+
+
+def pop_title(soup: BeautifulSoup) -> str:
+    """
+    get first h1 as title, and remove it from the content
+    """
+    title = "Placeholder title"
+    for h1 in soup.find_all("h1"):
+        title = h1.text
+        h1.decompose()
+        break
+    return title
+
+
+def upload_images(
+    soup: BeautifulSoup, manifest: ImageManifest, featured_image: BlogImage
+):
+    """
+    Upload the images (and the featured image) to WordPress at the same time
+    and point the images in the tree at their new source.
+    An image used more than once with the same alt text and title
+    is only uploaded once.
+    """
+    image_tags = soup.find_all("img")
+    # one upload per distinct image content and metadata,
+    # with the content hash so it isn't worked out again
+    images: dict[str, tuple[BlogImage, str]] = {}
+    hashes: dict[Path, str] = {}
+    tag_keys: list[str] = []
+    for image_tag in image_tags:
+        image = BlogImage(
+            image_path=Path(image_tag["src"]),
+            title=image_tag.get("title") or "",
+            alt_text=image_tag.get("alt") or "",
+        )
+        if image.image_path not in hashes:
+            hashes[image.image_path] = hash_file(image.image_path)
+        content_hash = hashes[image.image_path]
+        key = image.media_key(content_hash)
+        images.setdefault(key, (image, content_hash))
+        tag_keys.append(key)
+    featured_hash = hash_file(featured_image.image_path)
+    featured_key = featured_image.media_key(featured_hash)
+    uploads = list(images.values())
+    if featured_key not in images:
+        uploads.append((featured_image, featured_hash))
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        for upload in [
+            executor.submit(image.upload_image, content_hash=content_hash)
+            for image, content_hash in uploads
+        ]:
+            upload.result()
+    if featured_key in images:
+        shared = images[featured_key][0]
+        featured_image.id, featured_image.media_url = shared.id, shared.media_url
+
+    # Once everything is uploaded, point the images at their new source
+    for image_tag, key in zip(image_tags, tag_keys):
+        image = images[key][0]
+        image_tag["src"] = image.media_url
+        # if the image is wider than 800 set the image width to 800,
+        # and the height to auto
+        processed = manifest.get(str(image.image_path))
+        if processed and processed.width > 800:
+            image_tag["width"] = "800"
+            image_tag["height"] = "auto"
+
+
+def get_unsplash_image(url: str, working_folder: Path) -> UnsplashData:
     # Extract photo ID from the Unsplash URL
     photo_id = url.split("/")[-1]
 
@@ -128,116 +336,78 @@ def get_unsplash_image(url: str) -> UnsplashData:
     if not photo:
         raise ValueError("Invalid Unsplash URL")
 
-    temp_path = download_image(photo.urls.raw, ".jpg")  # type: ignore
+    # download a resized version, rather than the full size original
+    image_url = sized_unsplash_url(photo.urls.raw)  # type: ignore
+    image_path = download_image(image_url, working_folder / f"unsplash-{photo_id}.jpg")
 
-    # todo: resize image here
-    image = Image.open(temp_path)
-    # resize so never wider than 1200px, preserve aspect ratio, use anti-aliasing
-    if image.width > 1200:
-        image.thumbnail((1200, 1200), Image.BICUBIC)
-
-    image.save(temp_path)
+    shrink_image(image_path)
 
     return UnsplashData(
         url=url,
         author=photo.user.name,  # type: ignore
-        path=temp_path,
+        path=image_path,
         title=photo.description or "",  # type: ignore
         alt_text=photo.alt_description or "",  # type: ignore
     )
 
 
-def load_blog_to_wordpress(
-    google_url: str, unsplash_url: str | None, config_path: Path
-):
+def document_id_from_url(google_url: str) -> str:
     """
-    Main function to download a Google Doc, extract images,
-    and upload them as a new post to WordPress.
+    Get the Drive file id from a Google Doc url (or a bare id)
     """
+    match = re.search(r"/d/([A-Za-z0-9_-]+)", google_url)
+    if match:
+        return match.group(1)
+    if re.fullmatch(r"[A-Za-z0-9_-]+", google_url):
+        return google_url
+    raise ValueError(f"Could not find a document id in {google_url}")
 
-    config = WordpressConfig.from_yaml(config_path)
-
-    # get document_id from google_url
-    document_id = google_url.split("/")[-2]
-
-    working_folder = Path("temp")
 
-    html_content = gdoc_to_html(document_id, working_folder)
+def edit_post_url(post_id: int) -> str:
+    return f"https://blogs.mysociety.org/mysociety/wp-admin/post.php?post={post_id}&action=edit&classic-editor__forget&classic-editor"
 
-    # Parse HTML content
-    soup = BeautifulSoup(html_content, "html.parser")
 
-    # check if any a tags in the document are a link to unsplash
-    # if so, assume this is the unsplash_url we want, capture that
-    # and decompose the tag
-    for a in soup.find_all("a"):
-        if a.get("href", "").startswith("https://unsplash.com/photos/"):
-            unsplash_url = a["href"]
-            a.decompose()
-            break
+def publish_soup(
+    soup: BeautifulSoup,
+    working_folder: Path,
+    config: WordpressConfig,
+    unsplash_url: str | None = None,
+) -> tuple[int, str]:
+    """
+    Run the WordPress stages on a parsed document and create the post.
+    working_folder is the document's folder, holding its image manifest.
+    Returns the post id and title.
+    """
+    unsplash_url = pop_unsplash_url(soup) or unsplash_url
 
     if not unsplash_url:
         raise ValueError("No Unsplash URL found in arguments or document")
 
     # Get Unsplash image and its details
-    unsplash_data = get_unsplash_image(unsplash_url)
+    unsplash_data = get_unsplash_image(unsplash_url, working_folder)
 
     # Inject custom content
-    soup = inject_content(
-        soup,
-        config,
-        unsplash_data,
-    )
-
-    html = str(soup)
-    html = re.sub(r"(</h\d>|</p>|</img>)", r"\1\n\n", html)
+    inject_content(soup, config, unsplash_data)
 
-    # Extract images and upload them to WordPress
-    images = []
-    for image_tag in soup.find_all("img"):
-        image_path = Path(image_tag["src"])
-
-        # get extention from image url
-        i = BlogImage(
-            image_path=image_path,
-            title=image_tag.get("title") or "",
-            alt_text=image_tag.get("alt") or "",
-        ).upload_image()
-        images.append(i)
+    featured_image = BlogImage(
+        image_path=unsplash_data.path,
+        title=unsplash_data.title,
+        alt_text=unsplash_data.alt_text,
+    )
 
-        # Modify image source to point to the newly uploaded image
-        image_tag["src"] = i.media_url
-        # if the image is wider than 800 set the image width to 800,
-        # and the height to auto
-        image = Image.open(i.image_path)
-        width, _ = image.size
-        if width > 800:
-            image_tag["width"] = "800"
-            image_tag["height"] = "auto"
-        image.close()
+    # details of the images extracted from the document
+    manifest = ImageManifest.load(working_folder)
+    upload_images(soup, manifest, featured_image)
 
-    # get first h1 as title
-    title = "Placeholder title"
-    for h1 in soup.find_all("h1"):
-        title = h1.text
-        h1.decompose()
-        break
+    title = pop_title(soup)
 
     # Prepare post content
     content = str(soup)
 
-    html = re.sub(r"(</h\d>|</p>|</img>|</div>)", r"\1\n\n", html)
-
     # Create new post on WordPress
     categories = config.categories
     author_username = config.author
 
-    featured_image = BlogImage(
-        image_path=unsplash_data.path,
-        title=unsplash_data.title,
-        alt_text=unsplash_data.alt_text,
-    )
-
     blog = BlogPost(
         title=title,
         content=content,
@@ -246,8 +416,124 @@ def load_blog_to_wordpress(
         featured_media=featured_image,
     )
 
-    post_id = blog.publish()
+    return blog.publish(), title
+
+
+def load_blog_to_wordpress(
+    google_url: str, unsplash_url: str | None, config_path: Path
+) -> int:
+    """
+    Main function to download a Google Doc, extract images,
+    and upload them as a new post to WordPress.
+    """
+
+    config = WordpressConfig.from_yaml(config_path)
+
+    document_id = document_id_from_url(google_url)
+
+    workspace = get_workspace()
+    working_folder = workspace.document_dir(document_id)
+
+    # the document is parsed once, and each stage works on the same tree
+    soup = gdoc_to_soup(document_id, working_folder, workspace)
+
+    post_id, _ = publish_soup(soup, working_folder, config, unsplash_url)
+    workspace.evict()
 
     print("New post created with ID:", post_id)
-    url = f"https://blogs.mysociety.org/mysociety/wp-admin/post.php?post={post_id}&action=edit&classic-editor__forget&classic-editor"
-    print("Edit post at:", url)
+    print("Edit post at:", edit_post_url(post_id))
+    return post_id
+
+
+@dataclass
+class BatchResult:
+    """
+    Outcome of importing one document in a batch
+    """
+
+    document_id: str
+    name: str = ""
+    title: str = ""
+    post_id: int | None = None
+    edit_url: str = ""
+    error: str = ""
+
+
+def batch_load_blogs_to_wordpress(
+    documents: list[DriveDocument],
+    config_path: Path,
+    workers: int = 4,
+    requests_per_second: float = 5.0,
+) -> list[BatchResult]:
+    """
+    Import a set of Google Docs as WordPress posts.
+    Documents are exported and converted in a process pool, then published
+    concurrently, with all WordPress requests sharing one rate limit.
+    A failure in one document is recorded rather than stopping the batch.
+    """
+    config = WordpressConfig.from_yaml(config_path)
+    get_wordpress_client().rate_limiter = RateLimiter(requests_per_second)
+
+    results = {doc.id: BatchResult(doc.id, doc.name) for doc in documents}
+
+    # each document works in its own folder, so they can't collide
+    workspace = get_workspace()
+    folder_for = workspace.document_dir
+
+    # export and mammoth conversion are cpu heavy, so use processes
+    converted: dict[str, str] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(export_and_convert, doc.id, folder_for(doc.id)): doc.id
+            for doc in documents
+        }
+        for future in as_completed(futures):
+            document_id = futures[future]
+            try:
+                converted[document_id] = future.result()
+            except Exception as e:
+                results[document_id].error = f"conversion failed: {e}"
+
+    # images are processed in a process pool per document, so this is done
+    # before starting the publishing threads (forking a threaded process
+    # can deadlock)
+    soups: dict[str, BeautifulSoup] = {}
+    for document_id, html in converted.items():
+        try:
+            soups[document_id] = mammoth_html_to_soup(
+                html, folder_for(document_id), workspace
+            )
+        except Exception as e:
+            results[document_id].error = f"image extraction failed: {e}"
+
+    def publish(document_id: str):
+        result = results[document_id]
+        try:
+            folder = folder_for(document_id)
+            soup = soups[document_id]
+            result.post_id, result.title = publish_soup(soup, folder, config)
+            result.edit_url = edit_post_url(result.post_id)
+            print(f"Created post {result.post_id}: {result.title}")
+        except Exception as e:
+            result.error = str(e)
+            print(f"[red]Failed to import {document_id}: {e}[/red]")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(publish, soups))
+
+    workspace.evict()
+    return [results[doc.id] for doc in documents]
+
+
+def write_batch_report(results: list[BatchResult], report_path: Path):
+    """
+    Write the outcome of a batch import as json or csv (by extension)
+    """
+    rows = [asdict(result) for result in results]
+    if report_path.suffix == ".csv":
+        with report_path.open("w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else [])
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        report_path.write_text(json.dumps(rows, indent=2))
@@ -0,0 +1,119 @@
+"""
+Working files for the Google Doc -> WordPress pipeline.
+
+Each document gets its own folder (docx export, image manifest, featured
+image), so several imports can run at once without sharing files.
+Extracted images are stored once, by the sha256 of their decoded bytes,
+in a shared images folder.
+
+The workspace lives in the cache folder and is kept under a size limit
+by removing the least recently used documents and images.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from .cache import get_cache_dir
+
+WORKSPACE_MAX_BYTES = 500 * 1024 * 1024
+# anything used more recently than this may belong to a running import
+EVICTION_MIN_AGE = 60 * 60
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _touch(path: Path):
+    """
+    Mark a file or folder as recently used
+    """
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def _size(path: Path) -> int:
+    if path.is_dir():
+        return sum(item.stat().st_size for item in path.rglob("*") if item.is_file())
+    return path.stat().st_size
+
+
+class Workspace:
+    """
+    A folder per document, plus a content addressed image store
+    """
+
+    def __init__(
+        self, root: Optional[Path] = None, max_bytes: int = WORKSPACE_MAX_BYTES
+    ):
+        self.root = root or get_cache_dir("workspace")
+        self.max_bytes = max_bytes
+        self.documents = self.root / "documents"
+        self.images = self.root / "images"
+        self.documents.mkdir(parents=True, exist_ok=True)
+        self.images.mkdir(parents=True, exist_ok=True)
+
+    def document_dir(self, document_id: str) -> Path:
+        """
+        Get (and create) the folder for a document
+        """
+        folder = self.documents / document_id
+        folder.mkdir(exist_ok=True)
+        _touch(folder)
+        return folder
+
+    def image_stem(self, digest: str) -> Path:
+        """
+        Where an image with this hash is stored (without the extension).
+        Images are spread over subfolders by the first two characters.
+        """
+        folder = self.images / digest[:2]
+        folder.mkdir(exist_ok=True)
+        return folder / digest
+
+    def mark_used(self, path: Path):
+        """
+        Record that a stored image was used, so it is evicted last
+        """
+        _touch(path)
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for folder in self.documents.iterdir():
+            entries.append((folder.stat().st_mtime, _size(folder), folder))
+        for path in self.images.glob("*/*"):
+            entries.append((path.stat().st_mtime, path.stat().st_size, path))
+        return entries
+
+    def evict(self, min_age: float = EVICTION_MIN_AGE) -> int:
+        """
+        Remove the least recently used documents and images until the
+        workspace is under max_bytes. Returns the number of bytes freed.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[0])
+        total = sum(size for _, size, _ in entries)
+        cutoff = time.time() - min_age
+        freed = 0
+        for mtime, size, path in entries:
+            if total - freed <= self.max_bytes or mtime > cutoff:
+                break
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+            freed += size
+        return freed
+
+
+@lru_cache
+def get_workspace() -> Workspace:
+    return Workspace()
@@ -0,0 +1,158 @@
+"""
+Time the Mailchimp code paths against a local fake of the API
+(see tests/fakes/mailchimp.py), at realistic audience sizes.
+
+Run with `pytest tests/benchmarks --benchmark-enable`, adding `--run-slow`
+for the 100k member audience. The fake can add latency per request
+(FakeMailchimp(latency=...)) to model the real round trip.
+"""
+
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+from mysoc_mailchimp import scraping
+from mysoc_mailchimp.cache import HttpCache
+from mysoc_mailchimp.mailchimp import (
+    InternalListID,
+    MemberAndInterests,
+    batch_add_to_different_interest_groups,
+    batch_add_to_interest_group,
+    get_all_members,
+    get_recent_email_count,
+    set_user_metadata,
+)
+from mysoc_mailchimp.members import get_members_table
+from mysoc_mailchimp.send_mailing_list import create_campaign_from_blog
+
+from ..fakes.mailchimp import (
+    CATEGORY_NAME,
+    INTERESTS,
+    LIST_ID,
+    LIST_WEB_ID,
+    SEGMENT_ID,
+    FakeMailchimp,
+)
+
+FIXTURES = Path(__file__).parents[1] / "fixtures"
+BLOG_URL = "https://www.mysociety.org/2025/03/27/devolved-registers/"
+LIST = InternalListID(LIST_ID)
+# how many people the per-member loops update
+LOOP_SIZE = 200
+
+AUDIENCES = [
+    pytest.param(10_000, id="10k"),
+    pytest.param(100_000, id="100k", marks=pytest.mark.slow),
+]
+
+
+@pytest.fixture(params=AUDIENCES)
+def fake_members(request) -> int:
+    return request.param
+
+
+def emails(count: int) -> list[str]:
+    return [f"person{index}@example.com" for index in range(count)]
+
+
+@pytest.mark.benchmark(group="mailchimp-members")
+def test_get_all_members(benchmark, fake: FakeMailchimp):
+    members = benchmark(get_all_members, fake.api_key, LIST)
+    assert len(members) == len(fake.members)
+
+
+def peak_memory(function, *args) -> tuple[object, int]:
+    """
+    The result of a call and the peak memory it allocated
+    """
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.benchmark(group="mailchimp-members")
+def test_get_members_table(benchmark, fake: FakeMailchimp):
+    pytest.importorskip("pyarrow")
+    table = benchmark(get_members_table, fake.api_key, LIST)
+    assert table.num_rows == len(fake.members)
+    if benchmark.disabled:
+        # tracing allocations is slow, so only compare when benchmarking
+        return
+
+    _, dicts_peak = peak_memory(get_all_members, fake.api_key, LIST)
+    _, table_peak = peak_memory(get_members_table, fake.api_key, LIST)
+    benchmark.extra_info["table_bytes"] = table.nbytes
+    benchmark.extra_info["dicts_peak_bytes"] = dicts_peak
+    benchmark.extra_info["table_peak_bytes"] = table_peak
+    assert table_peak < dicts_peak
+
+
+@pytest.mark.benchmark(group="mailchimp-members")
+def test_get_recent_email_count(benchmark, fake: FakeMailchimp):
+    count = benchmark(
+        get_recent_email_count, fake.api_key, str(LIST_WEB_ID), str(SEGMENT_ID), 7
+    )
+    assert 0 < count < len(fake.members)
+
+
+@pytest.mark.benchmark(group="mailchimp-updates")
+def test_set_user_metadata_loop(benchmark, fake: FakeMailchimp):
+    def update_all():
+        for email in emails(LOOP_SIZE):
+            set_user_metadata(
+                fake.api_key,
+                LIST,
+                email,
+                merge_data={"FNAME": "Updated"},
+                tags=["newsletter"],
+                interest_group_collection=CATEGORY_NAME,
+                interests=["Democracy"],
+            )
+
+    benchmark.pedantic(update_all, rounds=1, iterations=1)
+
+
+@pytest.mark.benchmark(group="mailchimp-updates")
+def test_batch_add_to_interest_group(benchmark, fake: FakeMailchimp):
+    benchmark(
+        batch_add_to_interest_group,
+        fake.api_key,
+        LIST,
+        CATEGORY_NAME,
+        emails(len(fake.members)),
+        ["Climate"],
+    )
+
+
+@pytest.mark.benchmark(group="mailchimp-updates")
+def test_batch_add_to_different_interest_groups(benchmark, fake: FakeMailchimp):
+    interest_ids = list(INTERESTS.values())
+    members = [
+        MemberAndInterests(email, [interest_ids[index % 2]])
+        for index, email in enumerate(emails(len(fake.members)))
+    ]
+    benchmark(batch_add_to_different_interest_groups, fake.api_key, LIST, members)
+
+
+@pytest.mark.benchmark(group="mailchimp-campaign")
+def test_create_campaign_from_blog(
+    benchmark, fake: FakeMailchimp, tmp_path, monkeypatch
+):
+    cache = HttpCache(tmp_path, offline=True)
+    cache.store(BLOG_URL, (FIXTURES / "mysociety_blog_post.html").read_bytes())
+    monkeypatch.setattr(scraping, "get_http_cache", lambda: cache)
+
+    _, web_id = benchmark(
+        create_campaign_from_blog,
+        BLOG_URL,
+        LIST_ID,
+        SEGMENT_ID,
+        1,
+        api_key=fake.api_key,
+    )
+    campaign = next(c for c in fake.campaigns.values() if str(c["web_id"]) == web_id)
+    assert "Devolved parliamentary registers" in campaign["html"]
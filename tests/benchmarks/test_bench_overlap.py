@@ -0,0 +1,34 @@
+"""
+Time the pairwise overlap counts for a 100k member x 50 group matrix.
+"""
+
+import numpy as np
+import pytest
+
+from mysoc_mailchimp.overlap import MembershipMatrix
+
+MEMBERS = 100_000
+GROUPS = 50
+
+
+@pytest.fixture(scope="module")
+def masks() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    # groups from very small to most of the audience
+    rates = np.linspace(0.001, 0.9, GROUPS)[:, None]
+    return rng.random((GROUPS, MEMBERS)) < rates
+
+
+@pytest.mark.benchmark(group="overlap")
+def test_pack_matrix(benchmark, masks: np.ndarray):
+    labels = [f"group {n}" for n in range(GROUPS)]
+    matrix = benchmark(MembershipMatrix.from_masks, labels, masks)
+    assert matrix.bits.shape == (GROUPS, MEMBERS // 8)
+
+
+@pytest.mark.benchmark(group="overlap")
+def test_overlaps(benchmark, masks: np.ndarray):
+    matrix = MembershipMatrix.from_masks([str(n) for n in range(GROUPS)], masks)
+    overlaps = benchmark(matrix.overlaps)
+    assert (np.diag(overlaps) == masks.sum(axis=1)).all()
+    assert overlaps[3, 7] == (masks[3] & masks[7]).sum()
@@ -0,0 +1,59 @@
+"""
+Compare the single-pass placeholder engine with chained str.replace calls.
+
+Run with `pytest tests/benchmarks --benchmark-enable`.
+"""
+
+import pytest
+
+from mysoc_mailchimp.placeholders import BLOG_PLACEHOLDERS, PlaceholderTemplate
+
+IMAGE = BLOG_PLACEHOLDERS["image"]
+
+TEMPLATE = (
+    "<html><body>"
+    + "<table><tr><td style='padding:10px'>layout</td></tr></table>\n" * 2000
+    + f"<h1>[main title]</h1><a href='http://**blog-url**'><img src='{IMAGE}'></a>"
+    + "<div>[content]</div>"
+    + "<p>footer text and legal small print</p>\n" * 2000
+    + "</body></html>"
+)
+
+CONTENT = "<p>A long paragraph of blog content about democracy.</p>\n" * 5000
+
+VALUES = {
+    "content": CONTENT,
+    "title": "A blog title",
+    "url": "https://www.mysociety.org/2025/01/01/a-post/",
+    "image": "https://www.mysociety.org/files/2025/01/image.jpg",
+    "author": "mySociety",
+    "description": "A description",
+}
+
+
+def chained_replace(html: str) -> str:
+    html = html.replace("[content]", VALUES["content"])
+    html = html.replace("[main title]", VALUES["title"])
+    html = html.replace("http://**blog-url**", VALUES["url"])
+    html = html.replace(IMAGE, VALUES["image"])
+    return html
+
+
+@pytest.mark.benchmark(group="placeholders")
+def test_chained_replace(benchmark):
+    benchmark(chained_replace, TEMPLATE)
+
+
+@pytest.mark.benchmark(group="placeholders")
+def test_single_pass(benchmark):
+    def render():
+        return PlaceholderTemplate(TEMPLATE, BLOG_PLACEHOLDERS).render(VALUES).html
+
+    assert render() == chained_replace(TEMPLATE)
+    benchmark(render)
+
+
+@pytest.mark.benchmark(group="placeholders")
+def test_precompiled_render(benchmark):
+    template = PlaceholderTemplate(TEMPLATE, BLOG_PLACEHOLDERS)
+    benchmark(template.render, VALUES)
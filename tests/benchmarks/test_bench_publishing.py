@@ -0,0 +1,97 @@
+"""
+Time load_blog_to_wordpress from docx to post creation, against local
+fakes of Drive and WordPress (see tests/fakes), and report how long
+each stage took.
+
+Run with `pytest tests/benchmarks --benchmark-enable -s`, adding
+`--run-slow` for the large document. The stage timings are printed
+and saved in the benchmark's extra_info.
+"""
+
+import time
+from collections import defaultdict
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable
+
+import pytest
+
+from mysoc_mailchimp import gdoc, wordpress_api, wordpress_funcs, workspace
+from mysoc_mailchimp.wordpress_api import BlogPost
+from mysoc_mailchimp.wordpress_funcs import load_blog_to_wordpress
+
+from ..conftest import PublishingFakes
+from ..fakes.docx import make_docx
+
+CONFIG = Path(__file__).parents[2] / "config" / "repower-democracy.yaml"
+
+# stage name: (owner, attribute) of the function doing that stage
+STAGES: dict[str, tuple[Any, str]] = {
+    "drive export": (gdoc, "get_docx_from_file_id"),
+    "mammoth conversion": (gdoc, "convert_docx_to_html"),
+    "image extraction": (gdoc, "extract_images"),
+    "content injection": (wordpress_funcs, "inject_content"),
+    "image upload": (wordpress_funcs, "upload_images"),
+    "post creation": (BlogPost, "publish"),
+}
+
+CORPUS = {
+    "small": dict(sections=4, images_per_section=2, image_size=(800, 600)),
+    "large": dict(sections=20, images_per_section=3, image_size=(1600, 1000)),
+}
+
+
+class StageTimer:
+    """
+    Wraps the stage functions to total the time spent in each
+    """
+
+    def __init__(self, monkeypatch):
+        self.totals: dict[str, float] = defaultdict(float)
+        for stage, (owner, name) in STAGES.items():
+            monkeypatch.setattr(owner, name, self.timed(stage, getattr(owner, name)))
+
+    def timed(self, stage: str, func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.totals[stage] += time.perf_counter() - start
+
+        return wrapper
+
+
+@pytest.mark.benchmark(group="publishing")
+@pytest.mark.parametrize(
+    "size", ["small", pytest.param("large", marks=pytest.mark.slow)]
+)
+def test_load_blog_to_wordpress(
+    benchmark, publishing: PublishingFakes, monkeypatch, tmp_path: Path, size: str
+):
+    docx = make_docx(publishing.corpus / f"{size}.docx", **CORPUS[size])
+    publishing.drive.add_document("doc1", docx)
+    timer = StageTimer(monkeypatch)
+    runs = 0
+
+    def cold_caches():
+        # each round starts with no cached conversion, images or media
+        round_dir = tmp_path / f"round{runs}"
+        monkeypatch.setenv("MYSOC_MAILCHIMP_CACHE", str(round_dir / "cache"))
+        workspace.get_workspace.cache_clear()
+        wordpress_api.get_media_index.cache_clear()
+
+    def run():
+        nonlocal runs
+        runs += 1
+        return load_blog_to_wordpress("doc1", None, CONFIG)
+
+    post_id = benchmark.pedantic(run, setup=cold_caches, rounds=3)
+    assert post_id in publishing.wordpress.posts
+
+    stages = {stage: total / runs for stage, total in timer.totals.items()}
+    benchmark.extra_info["stages"] = stages
+    print(f"\nload_blog_to_wordpress stages ({size} document, mean of {runs}):")
+    for stage, seconds in stages.items():
+        print(f"  {stage:<20} {seconds * 1000:8.1f} ms")
@@ -0,0 +1,56 @@
+"""
+Compare blog extraction with the previous multi-sweep html.parser approach,
+over the saved mySociety blog page (padded out to a long post).
+
+Run with `pytest tests/benchmarks --benchmark-enable`.
+"""
+
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup
+
+from mysoc_mailchimp.scraping import enforce_tag, extract_blog_details
+
+FIXTURES = Path(__file__).parents[1] / "fixtures"
+BLOG_URL = "https://www.mysociety.org/2025/03/27/devolved-registers/"
+
+SAVED_PAGE = (FIXTURES / "mysociety_blog_post.html").read_text()
+CONTENT_START = '<div class="wordpress-editor-content">'
+# repeat the body of the post to simulate a long post
+_body = SAVED_PAGE.split(CONTENT_START)[1].split("</div>\n</div>\n</main>")[0]
+LONG_PAGE = SAVED_PAGE.replace(_body, _body * 40)
+
+
+def previous_extraction(page: str) -> str:
+    banned_phrases = [
+        "You can sign up here and you’ll get an email every time we post:"
+    ]
+    soup = BeautifulSoup(page, "html.parser")
+    contents = enforce_tag(soup.find("div", class_="wordpress-editor-content"))
+    for item in contents.find_all("div", class_="mailchimp-signup"):
+        item.decompose()
+    for item in contents.find_all(class_="web-only"):
+        item.decompose()
+    for item in contents.find_all(class_="blog-post-donate"):
+        item.decompose()
+    for phrase in banned_phrases:
+        for item in contents.find_all("p"):
+            if phrase in item.text:
+                item.decompose()
+    content = str(contents)
+    while "\n\n" in content:
+        content = content.replace("\n\n", "\n")
+    return content
+
+
+@pytest.mark.benchmark(group="scraping")
+@pytest.mark.parametrize("page", [SAVED_PAGE, LONG_PAGE], ids=["saved", "long"])
+def test_previous_extraction(benchmark, page):
+    benchmark(previous_extraction, page)
+
+
+@pytest.mark.benchmark(group="scraping")
+@pytest.mark.parametrize("page", [SAVED_PAGE, LONG_PAGE], ids=["saved", "long"])
+def test_extract_blog_details(benchmark, page):
+    benchmark(extract_blog_details, page, BLOG_URL)
@@ -0,0 +1,96 @@
+"""
+Compare the single-tree WordPress pipeline with the previous approach,
+which serialised and re-parsed the document between stages.
+
+Covers the stages that don't talk to a server, on a long document.
+
+Run with `pytest tests/benchmarks --benchmark-enable`.
+"""
+
+import re
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup
+
+from mysoc_mailchimp.gdoc import add_block_spacing, strip_bookmark_anchors
+from mysoc_mailchimp.wordpress_funcs import (
+    UnsplashData,
+    WordpressConfig,
+    inject_content,
+    pop_title,
+    pop_unsplash_url,
+)
+
+CONFIG = WordpressConfig.from_yaml(
+    Path(__file__).parents[2] / "config" / "repower-democracy.yaml"
+)
+UNSPLASH = UnsplashData(
+    "https://unsplash.com/photos/abc", "", "Jo", Path("image.jpg"), ""
+)
+
+SECTION = (
+    "<h2>A section heading</h2>"
+    + "<p>Some <strong>paragraph</strong> text with a <a href='https://www.mysociety.org'>link</a>.</p>"
+    * 8
+    + "<ul><li>item one</li><li>item two</li></ul>"
+)
+LONG_DOC = (
+    "<h1>The title</h1><p><a id='_bookmark'></a>"
+    "<a href='https://unsplash.com/photos/abc'>photo</a></p>" + SECTION * 150
+)
+
+
+def previous_pipeline(html: str) -> str:
+    # gdoc stage
+    soup = BeautifulSoup(html, "html.parser")
+    for a in soup.find_all("a"):
+        if a.get("id", "").startswith("_"):
+            a.decompose()
+    html = str(soup)
+    html = re.sub(r"(</h\d>|</p>|</img>)", r"\1\n\n", html)
+    # wordpress stage
+    soup = BeautifulSoup(html, "html.parser")
+    for a in soup.find_all("a"):
+        if a.get("href", "").startswith("https://unsplash.com/photos/"):
+            a.decompose()
+            break
+    html = str(soup)
+    html = re.sub(
+        r"<h2>(.*?)</h2>",
+        CONFIG.before_first_h2 + r"\n\n<h2 pos=1>\1</h2>",
+        html,
+        count=1,
+    )
+    html = re.sub(r"<h2>(.*?)</h2>", CONFIG.before_h2 + r"\n\n<h2>\1</h2>\n\n", html)
+    html += "\n\n" + CONFIG.end_of_document
+    html += "\n\n<p>Image: <a href='https://unsplash.com/photos/abc'>Jo</a></p>"
+    soup = BeautifulSoup(html, "html.parser")
+    html = str(soup)
+    html = re.sub(r"(</h\d>|</p>|</img>)", r"\1\n\n", html)
+    for h1 in soup.find_all("h1"):
+        h1.decompose()
+        break
+    content = str(soup)
+    html = re.sub(r"(</h\d>|</p>|</img>|</div>)", r"\1\n\n", html)
+    return content
+
+
+def single_tree_pipeline(html: str) -> str:
+    soup = BeautifulSoup(html, "html.parser")
+    strip_bookmark_anchors(soup)
+    add_block_spacing(soup)
+    pop_unsplash_url(soup)
+    inject_content(soup, CONFIG, UNSPLASH)
+    pop_title(soup)
+    return str(soup)
+
+
+@pytest.mark.benchmark(group="wordpress-pipeline")
+def test_previous_pipeline(benchmark):
+    benchmark(previous_pipeline, LONG_DOC)
+
+
+@pytest.mark.benchmark(group="wordpress-pipeline")
+def test_single_tree_pipeline(benchmark):
+    benchmark(single_tree_pipeline, LONG_DOC)
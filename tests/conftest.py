@@ -0,0 +1,147 @@
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+import pytest
+from PIL import Image
+
+from mysoc_mailchimp import gdoc, mailchimp, wordpress_api, wordpress_funcs, workspace
+from mysoc_mailchimp.wordpress_funcs import UnsplashData
+
+from .fakes.drive import FakeDrive
+from .fakes.mailchimp import FakeMailchimp
+from .fakes.wordpress import FakeWordPress
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--run-slow",
+        action="store_true",
+        default=False,
+        help="run slow tests (e.g. benchmarks against a 100k member audience)",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: only run with --run-slow")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-slow"):
+        return
+    skip_slow = pytest.mark.skip(reason="needs --run-slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def isolated_cache(tmp_path_factory) -> Iterator[Path]:
+    """
+    Keep everything the tests cache (including from module scoped fixtures)
+    out of the real cache folder
+    """
+    path = tmp_path_factory.mktemp("cache")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("MYSOC_MAILCHIMP_CACHE", str(path))
+        mailchimp.get_interest_index.cache_clear()
+        yield path
+
+
+@pytest.fixture(autouse=True)
+def interest_index(tmp_path: Path, monkeypatch) -> Iterator[mailchimp.InterestIndex]:
+    """
+    Give each test a new interest index, in its own cache folder
+    """
+    monkeypatch.setenv("MYSOC_MAILCHIMP_CACHE", str(tmp_path))
+    mailchimp.get_interest_index.cache_clear()
+    yield mailchimp.get_interest_index()
+    mailchimp.get_interest_index.cache_clear()
+
+
+def clear_mailchimp_lookups():
+    """
+    Lookups are cached by api key, and each fake server has a new address
+    """
+    mailchimp.get_lists.cache_clear()
+    mailchimp.get_segments.cache_clear()
+    mailchimp.get_recent_campaigns.cache_clear()
+    mailchimp.get_templates.cache_clear()
+
+
+def clear_wordpress_lookups():
+    """
+    The client and indexes are shared by the process, and each fake
+    WordPress has a new address
+    """
+    wordpress_api.get_wordpress_client.cache_clear()
+    wordpress_api.get_media_index.cache_clear()
+    wordpress_api.get_taxonomy_index.cache_clear()
+
+
+def use_wordpress(monkeypatch, base_url: str):
+    """
+    Point the shared WordPress client at a local server
+    """
+    monkeypatch.setattr(wordpress_api, "WORDPRESS_URL", base_url)
+    monkeypatch.setattr(wordpress_api, "USERNAME", "user")
+    monkeypatch.setattr(wordpress_api, "PASSWORD", "password")
+    clear_wordpress_lookups()
+
+
+@pytest.fixture(autouse=True)
+def wordpress_lookups() -> Iterator[None]:
+    """
+    Don't let one test's WordPress client or indexes leak into the next
+    """
+    yield
+    clear_wordpress_lookups()
+
+
+@pytest.fixture
+def fake_members() -> int:
+    """
+    The size of the fake audience (override in a module for another size)
+    """
+    return 2500
+
+
+@pytest.fixture
+def fake(fake_members: int) -> Iterator[FakeMailchimp]:
+    """
+    A local fake of the Mailchimp api with one list
+    """
+    with FakeMailchimp(members=fake_members) as server:
+        yield server
+    clear_mailchimp_lookups()
+
+
+class PublishingFakes(NamedTuple):
+    wordpress: FakeWordPress
+    drive: FakeDrive
+    corpus: Path
+
+
+@pytest.fixture
+def publishing(tmp_path: Path, monkeypatch) -> Iterator[PublishingFakes]:
+    """
+    Point the Google Doc -> WordPress pipeline at local fakes of
+    WordPress, Drive and Unsplash, with caches in tmp_path.
+    """
+    monkeypatch.setenv("MYSOC_MAILCHIMP_CACHE", str(tmp_path / "cache"))
+    workspace.get_workspace.cache_clear()
+
+    def fake_unsplash(url: str, working_folder: Path) -> UnsplashData:
+        path = working_folder / "unsplash.jpg"
+        Image.new("RGB", (1200, 800), "teal").save(path)
+        return UnsplashData(url, "A photo", "Jo Bloggs", path, "alt text")
+
+    monkeypatch.setattr(wordpress_funcs, "get_unsplash_image", fake_unsplash)
+
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    with FakeWordPress() as wordpress, FakeDrive() as drive:
+        # the media and taxonomy indexes are in the cache folder above
+        use_wordpress(monkeypatch, wordpress.base_url)
+        monkeypatch.setattr(gdoc, "get_drive_service", drive.service)
+        yield PublishingFakes(wordpress, drive, corpus)
+    workspace.get_workspace.cache_clear()
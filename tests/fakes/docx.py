@@ -0,0 +1,156 @@
+"""
+Generate .docx files shaped like the blog drafts in Google Docs:
+a title, an Unsplash link, then sections of paragraphs with images.
+
+Only the parts mammoth reads are written, so no docx library is needed.
+"""
+
+import io
+import random
+import zipfile
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from PIL import Image
+
+W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+WP = "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"
+A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+PIC = "http://schemas.openxmlformats.org/drawingml/2006/picture"
+IMAGE_REL = R + "/image"
+HYPERLINK_REL = R + "/hyperlink"
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Default Extension="png" ContentType="image/png"/>
+<Default Extension="jpeg" ContentType="image/jpeg"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>
+</Types>"""
+
+STYLES = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:styles xmlns:w="{W}">
+<w:style w:type="paragraph" w:styleId="Heading1"><w:name w:val="heading 1"/></w:style>
+<w:style w:type="paragraph" w:styleId="Heading2"><w:name w:val="heading 2"/></w:style>
+</w:styles>"""
+
+ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+UNSPLASH_URL = "https://unsplash.com/photos/abc123"
+
+
+def _paragraph(text: str, style: str = "") -> str:
+    style_xml = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    return f"<w:p>{style_xml}<w:r><w:t>{escape(text)}</w:t></w:r></w:p>"
+
+
+def _hyperlink(rel_id: str, text: str) -> str:
+    return (
+        f'<w:p><w:hyperlink r:id="{rel_id}"><w:r><w:t>{escape(text)}</w:t></w:r>'
+        "</w:hyperlink></w:p>"
+    )
+
+
+def _image(rel_id: str, number: int, width: int, height: int) -> str:
+    # sizes are in EMUs (9525 per pixel at 96dpi)
+    cx, cy = width * 9525, height * 9525
+    return (
+        "<w:p><w:r><w:drawing>"
+        f'<wp:inline><wp:extent cx="{cx}" cy="{cy}"/>'
+        f'<wp:docPr id="{number}" name="Picture {number}" descr="Chart {number}"/>'
+        f'<a:graphic><a:graphicData uri="{PIC}"><pic:pic>'
+        f'<pic:nvPicPr><pic:cNvPr id="{number}" name="image{number}.png"/>'
+        "<pic:cNvPicPr/></pic:nvPicPr>"
+        f'<pic:blipFill><a:blip r:embed="{rel_id}"/></pic:blipFill>'
+        "</pic:pic></a:graphicData></a:graphic></wp:inline>"
+        "</w:drawing></w:r></w:p>"
+    )
+
+
+def make_image(width: int, height: int, seed: int, noisy: bool = False) -> bytes:
+    """
+    A png: flat colour (like a chart) or noise (like a photo)
+    """
+    if noisy:
+        image = Image.effect_noise((width, height), 40 + seed % 20).convert("RGB")
+    else:
+        rng = random.Random(seed)
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        image = Image.new("RGB", (width, height), colour)  # type: ignore
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def make_docx(
+    path: Path,
+    sections: int = 10,
+    paragraphs_per_section: int = 5,
+    images_per_section: int = 2,
+    image_size: tuple[int, int] = (1200, 800),
+    seed: int = 0,
+) -> Path:
+    """
+    Write a blog draft to path, with sections * images_per_section
+    distinct images (every third is noisy, like a photo).
+    """
+    rels = [
+        f'<Relationship Id="rStyles" Type="{R}/styles" Target="styles.xml"/>',
+        f'<Relationship Id="rLink" Type="{HYPERLINK_REL}" '
+        f'Target="{UNSPLASH_URL}" TargetMode="External"/>',
+    ]
+    media: dict[str, bytes] = {}
+    body = [
+        _paragraph(f"Generated blog post {seed}", "Heading1"),
+        _hyperlink("rLink", "Header photo"),
+    ]
+    number = 0
+    for section in range(sections):
+        body.append(_paragraph(f"Section {section + 1}", "Heading2"))
+        for paragraph in range(paragraphs_per_section):
+            body.append(
+                _paragraph(
+                    f"Paragraph {paragraph + 1} of section {section + 1}. "
+                    + "Some text about democracy and technology. " * 8
+                )
+            )
+        for _ in range(images_per_section):
+            number += 1
+            rel_id = f"rImg{number}"
+            name = f"image{number}.png"
+            media[name] = make_image(
+                *image_size, seed=seed * 1000 + number, noisy=number % 3 == 0
+            )
+            rels.append(
+                f'<Relationship Id="{rel_id}" Type="{IMAGE_REL}" Target="media/{name}"/>'
+            )
+            body.append(_image(rel_id, number, *image_size))
+
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<w:document xmlns:w="{W}" xmlns:r="{R}" xmlns:wp="{WP}" '
+        f'xmlns:a="{A}" xmlns:pic="{PIC}"><w:body>'
+        + "".join(body)
+        + "</w:body></w:document>"
+    )
+    document_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        + "".join(rels)
+        + "</Relationships>"
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", CONTENT_TYPES)
+        docx.writestr("_rels/.rels", ROOT_RELS)
+        docx.writestr("word/document.xml", document)
+        docx.writestr("word/styles.xml", STYLES)
+        docx.writestr("word/_rels/document.xml.rels", document_rels)
+        for name, data in media.items():
+            docx.writestr(f"word/media/{name}", data)
+    return path
@@ -0,0 +1,69 @@
+"""
+A local stand-in for the Google Drive endpoints used to fetch documents:
+file metadata, files.list and export_media (as docx).
+"""
+
+from pathlib import Path
+from typing import Any
+
+from google.auth.credentials import AnonymousCredentials
+
+from mysoc_mailchimp.gdoc import DOCX_MIME_TYPE, build_drive_service
+
+from .server import FakeServer, Request, Response
+
+FOLDER_ID = "folder0001"
+
+
+class FakeDrive(FakeServer):
+    """
+    Fake Drive holding docx files, all in one folder
+    """
+
+    prefix = "/drive/v3"
+
+    def __init__(self, latency: float = 0.0, rate_limit_every: int = 0):
+        super().__init__(latency=latency, rate_limit_every=rate_limit_every)
+        self.files: dict[str, dict[str, Any]] = {}
+        self.route("GET", "/files", self.list_files)
+        self.route("GET", r"/files/([\w-]+)", self.get_file)
+        self.route("GET", r"/files/([\w-]+)/export", self.export_file)
+
+    def add_document(self, file_id: str, docx_path: Path, name: str = ""):
+        self.files[file_id] = {
+            "id": file_id,
+            "name": name or docx_path.stem,
+            "version": "1",
+            "modifiedTime": "2025-01-01T00:00:00.000Z",
+            "data": docx_path.read_bytes(),
+        }
+
+    def edit_document(self, file_id: str):
+        """
+        Bump the version, as an edit in Google Docs would
+        """
+        self.files[file_id]["version"] = str(int(self.files[file_id]["version"]) + 1)
+
+    def service(self) -> Any:
+        """
+        A Drive client (as from gdoc.get_drive_service) that talks to this server
+        """
+        return build_drive_service(AnonymousCredentials(), self.url + "/")
+
+    def _metadata(self, file: dict[str, Any]) -> dict[str, Any]:
+        return {key: value for key, value in file.items() if key != "data"}
+
+    def list_files(self, request: Request):
+        return {"files": [self._metadata(file) for file in self.files.values()]}
+
+    def get_file(self, request: Request, file_id: str):
+        file = self.files.get(file_id)
+        if file is None:
+            return Response({"error": {"code": 404}}, status=404)
+        return self._metadata(file)
+
+    def export_file(self, request: Request, file_id: str):
+        file = self.files.get(file_id)
+        if file is None:
+            return Response({"error": {"code": 404}}, status=404)
+        return Response(file["data"], content_type=DOCX_MIME_TYPE)
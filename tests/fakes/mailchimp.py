@@ -0,0 +1,401 @@
+"""
+A local stand-in for the parts of the Mailchimp marketing API this package uses.
+
+The audience is generated up front (deterministically), and the server
+answers list, member, segment, tag, note, interest and campaign requests
+from memory.
+"""
+
+import datetime
+import hashlib
+from typing import Any, Optional
+
+from mysoc_mailchimp.mailchimp import MailChimpApiKey
+from mysoc_mailchimp.placeholders import BLOG_PLACEHOLDERS
+
+from .server import FakeServer, Request, Response
+
+LIST_ID = "abc123def4"
+LIST_WEB_ID = 1001
+LIST_NAME = "Newsletter"
+SEGMENT_ID = 42
+SEGMENT_NAME = "Donors"
+CATEGORY_ID = "cat0000001"
+CATEGORY_NAME = "Topics"
+INTERESTS = {"Democracy": "int0000001", "Climate": "int0000002"}
+
+TEMPLATE_HTML = (
+    "<html><body>"
+    f"<h1>{BLOG_PLACEHOLDERS['title']}</h1>"
+    f"<p>{BLOG_PLACEHOLDERS['author']}</p>"
+    f"<img src=\"{BLOG_PLACEHOLDERS['image']}\">"
+    f"<div>{BLOG_PLACEHOLDERS['content']}</div>"
+    f"<a href=\"{BLOG_PLACEHOLDERS['url']}\">Read on the blog</a>"
+    "</body></html>"
+)
+
+
+def subscriber_hash(email: str) -> str:
+    return hashlib.md5(email.lower().encode("utf-8")).hexdigest()
+
+
+def make_member(index: int, today: datetime.date) -> dict[str, Any]:
+    email = f"person{index}@example.com"
+    joined = today - datetime.timedelta(days=index % 60)
+    return {
+        "id": subscriber_hash(email),
+        "email_address": email,
+        "status": "subscribed",
+        "merge_fields": {"FNAME": f"Person{index}", "LNAME": "Example"},
+        "interests": {
+            interest_id: (index + n) % 3 == 0
+            for n, interest_id in enumerate(INTERESTS.values())
+        },
+        "tags": [{"id": 1, "name": "donor"}] if index % 10 == 0 else [],
+        # some members only have an opt-in time
+        "timestamp_signup": "" if index % 4 == 0 else f"{joined}T10:00:00+00:00",
+        "timestamp_opt": f"{joined}T10:00:00+00:00",
+        "last_changed": f"{joined}T10:00:00+00:00",
+        "list_id": LIST_ID,
+        # the rest of a real member record, which the package doesn't use
+        "unique_email_id": subscriber_hash(email)[:10],
+        "web_id": 100000 + index,
+        "full_name": f"Person{index} Example",
+        "email_type": "html",
+        "language": "en" if index % 5 else "",
+        "vip": index % 50 == 0,
+        "member_rating": 2 + index % 4,
+        "source": "API - Generic" if index % 2 else "Admin Add",
+        "ip_signup": "",
+        "ip_opt": "192.0.2.1",
+        "stats": {
+            "avg_open_rate": (index % 100) / 100,
+            "avg_click_rate": (index % 20) / 100,
+        },
+        "location": {
+            "latitude": 51.5,
+            "longitude": -0.1,
+            "gmtoff": 0,
+            "dstoff": 0,
+            "country_code": "GB",
+            "timezone": "Europe/London",
+            "region": "",
+        },
+        "tags_count": 1 if index % 10 == 0 else 0,
+        "_links": [
+            {
+                "rel": rel,
+                "href": f"https://us9.api.mailchimp.com/3.0/lists/{LIST_ID}/members/{subscriber_hash(email)}",
+                "method": "GET",
+                "targetSchema": "https://us9.api.mailchimp.com/schema/3.0/Definitions/Lists/Members/Response.json",
+            }
+            for rel in [
+                "self",
+                "parent",
+                "update",
+                "upsert",
+                "delete",
+                "activity",
+                "goals",
+                "notes",
+                "events",
+                "delete_permanent",
+            ]
+        ],
+    }
+
+
+def select_fields(member: dict[str, Any], fields: str) -> dict[str, Any]:
+    """
+    Apply the api's fields parameter (e.g. "members.id,members.status")
+    """
+    keep = {field.split(".")[1] for field in fields.split(",") if "." in field}
+    return {key: value for key, value in member.items() if key in keep}
+
+
+class FakeMailchimp(FakeServer):
+    """
+    Fake Mailchimp API with an audience of `members` people
+    """
+
+    prefix = "/3.0"
+
+    def __init__(
+        self,
+        members: int = 1000,
+        latency: float = 0.0,
+        rate_limit_every: int = 0,
+        max_page_size: int = 1000,
+    ):
+        super().__init__(latency=latency, rate_limit_every=rate_limit_every)
+        self.max_page_size = max_page_size
+        today = datetime.date.today()
+        self.members: dict[str, dict[str, Any]] = {}
+        for index in range(members):
+            member = make_member(index, today)
+            self.members[member["id"]] = member
+        self.notes: dict[str, list[dict[str, Any]]] = {}
+        # interest category id -> title and interests (name -> id)
+        self.categories: dict[str, tuple[str, dict[str, str]]] = {
+            CATEGORY_ID: (CATEGORY_NAME, dict(INTERESTS))
+        }
+        self.campaigns: dict[str, dict[str, Any]] = {}
+        for number in range(1, 3):
+            self.campaigns[f"sent{number:06d}"] = {
+                "id": f"sent{number:06d}",
+                "web_id": 4000 + number,
+                "type": "regular",
+                "settings": {"title": f"Newsletter {number}", "subject_line": "News"},
+                "recipients": {"list_id": LIST_ID},
+                "status": "sent",
+                "send_time": f"{today}T09:00:00+00:00",
+                "html": TEMPLATE_HTML,
+            }
+
+        member = r"/lists/(\w+)/members/(\w+)"
+        self.route("GET", r"/lists", self.get_lists)
+        self.route("GET", r"/lists/(\w+)/members", self.get_members)
+        self.route("POST", r"/lists/(\w+)/members", self.add_member)
+        self.route("GET", member, self.get_member)
+        self.route("PATCH", member, self.update_member)
+        self.route("GET", member + "/tags", self.get_tags)
+        self.route("POST", member + "/tags", self.update_tags)
+        self.route("GET", member + "/notes", self.get_notes)
+        self.route("POST", member + "/notes", self.add_note)
+        self.route("GET", r"/lists/(\w+)/segments", self.get_segments)
+        self.route(
+            "GET", r"/lists/(\w+)/segments/(\w+)/members", self.get_segment_members
+        )
+        self.route("GET", r"/lists/(\w+)/interest-categories", self.get_categories)
+        self.route(
+            "GET",
+            r"/lists/(\w+)/interest-categories/(\w+)/interests",
+            self.get_interests,
+        )
+        self.route("POST", r"/lists/(\w+)", self.batch_members)
+        self.route("GET", r"/campaigns", self.get_campaigns)
+        self.route("POST", r"/campaigns", self.create_campaign)
+        self.route("DELETE", r"/campaigns/(\w+)", self.remove_campaign)
+        self.route("GET", r"/campaigns/(\w+)/content", self.get_content)
+        self.route("PUT", r"/campaigns/(\w+)/content", self.set_content)
+
+    @property
+    def api_key(self) -> MailChimpApiKey:
+        return MailChimpApiKey("fake-key-us9", "us9", host=self.url)
+
+    def _page(self, request: Request) -> tuple[int, int]:
+        count = min(int(request.query.get("count", 10)), self.max_page_size)
+        return count, int(request.query.get("offset", 0))
+
+    def _missing(self) -> Response:
+        return Response(
+            {"title": "Resource Not Found", "status": 404, "detail": "not found"},
+            status=404,
+        )
+
+    def get_lists(self, request: Request):
+        return {
+            "lists": [
+                {
+                    "id": LIST_ID,
+                    "web_id": LIST_WEB_ID,
+                    "name": LIST_NAME,
+                    "stats": {"member_count": len(self.members)},
+                }
+            ],
+            "total_items": 1,
+        }
+
+    def segment_members(self) -> list[dict[str, Any]]:
+        """
+        The one segment holds the members tagged as donors
+        """
+        return [
+            member
+            for member in self.members.values()
+            if any(tag["name"] == "donor" for tag in member["tags"])
+        ]
+
+    def get_segments(self, request: Request, list_id: str):
+        return {
+            "segments": [
+                {
+                    "id": SEGMENT_ID,
+                    "name": SEGMENT_NAME,
+                    "member_count": len(self.segment_members()),
+                    "type": "static",
+                    "list_id": LIST_ID,
+                }
+            ],
+            "total_items": 1,
+        }
+
+    def get_segment_members(self, request: Request, list_id: str, segment_id: str):
+        return self.get_members(request, list_id, self.segment_members())
+
+    def get_members(
+        self,
+        request: Request,
+        list_id: str,
+        members: Optional[list[dict[str, Any]]] = None,
+    ):
+        count, offset = self._page(request)
+        if members is None:
+            members = list(self.members.values())
+        total = len(members)
+        members = members[offset : offset + count]
+        if "fields" in request.query:
+            members = [
+                select_fields(member, request.query["fields"]) for member in members
+            ]
+        return {
+            "members": members,
+            "total_items": total,
+        }
+
+    def get_member(self, request: Request, list_id: str, member_hash: str):
+        return self.members.get(member_hash) or self._missing()
+
+    def update_member(self, request: Request, list_id: str, member_hash: str):
+        member = self.members.get(member_hash)
+        if member is None:
+            return self._missing()
+        details = request.json()
+        member["merge_fields"].update(details.get("merge_fields", {}))
+        member["interests"].update(details.get("interests", {}))
+        return member
+
+    def add_member(self, request: Request, list_id: str):
+        return self._create_member(request.json())
+
+    def _create_member(self, details: dict[str, Any]) -> dict[str, Any]:
+        email = details["email_address"]
+        member = {
+            "id": subscriber_hash(email),
+            "email_address": email,
+            "status": details.get("status", "subscribed"),
+            "merge_fields": details.get("merge_fields", {}),
+            "interests": details.get("interests", {}),
+            "tags": [{"id": 1, "name": tag} for tag in details.get("tags", [])],
+            "timestamp_signup": "",
+            "timestamp_opt": f"{datetime.date.today()}T10:00:00+00:00",
+            "list_id": LIST_ID,
+        }
+        self.members[member["id"]] = member
+        return member
+
+    def get_tags(self, request: Request, list_id: str, member_hash: str):
+        member = self.members.get(member_hash)
+        if member is None:
+            return self._missing()
+        return {"tags": member["tags"], "total_items": len(member["tags"])}
+
+    def update_tags(self, request: Request, list_id: str, member_hash: str):
+        member = self.members.get(member_hash)
+        if member is None:
+            return self._missing()
+        for tag in request.json()["tags"]:
+            names = [existing["name"] for existing in member["tags"]]
+            if tag["status"] == "active" and tag["name"] not in names:
+                member["tags"].append({"id": len(names) + 1, "name": tag["name"]})
+            if tag["status"] == "inactive" and tag["name"] in names:
+                member["tags"].pop(names.index(tag["name"]))
+        return Response(status=204, content_type="text/plain")
+
+    def get_notes(self, request: Request, list_id: str, member_hash: str):
+        notes = self.notes.get(member_hash, [])
+        return {"notes": notes, "total_items": len(notes)}
+
+    def add_note(self, request: Request, list_id: str, member_hash: str):
+        note = {"id": len(self.notes.get(member_hash, [])), **request.json()}
+        self.notes.setdefault(member_hash, []).append(note)
+        return note
+
+    def get_categories(self, request: Request, list_id: str):
+        return {
+            "categories": [
+                {"id": category_id, "title": title}
+                for category_id, (title, _) in self.categories.items()
+            ],
+            "total_items": len(self.categories),
+        }
+
+    def get_interests(self, request: Request, list_id: str, category_id: str):
+        _, interests = self.categories[category_id]
+        return {
+            "interests": [
+                {"id": interest_id, "name": name, "category_id": category_id}
+                for name, interest_id in interests.items()
+            ],
+            "total_items": len(interests),
+        }
+
+    def batch_members(self, request: Request, list_id: str):
+        created, updated = [], []
+        for details in request.json()["members"]:
+            member_hash = subscriber_hash(details["email_address"])
+            if member_hash in self.members:
+                self.members[member_hash]["interests"].update(
+                    details.get("interests", {})
+                )
+                updated.append(member_hash)
+            else:
+                created.append(self._create_member(details)["id"])
+        return {
+            "new_members": [{"id": member_hash} for member_hash in created],
+            "updated_members": [{"id": member_hash} for member_hash in updated],
+            "errors": [],
+            "total_created": len(created),
+            "total_updated": len(updated),
+            "error_count": 0,
+        }
+
+    def get_campaigns(self, request: Request):
+        count, offset = self._page(request)
+        campaigns = [
+            {
+                "type": "regular",
+                "content_type": "template",
+                "status": "save",
+                "send_time": "",
+                **{key: value for key, value in campaign.items() if key != "html"},
+                "recipients": {"recipient_count": 0, **campaign["recipients"]},
+            }
+            for campaign in self.campaigns.values()
+            if request.query.get("list_id")
+            in (None, campaign["recipients"].get("list_id"))
+        ]
+        return {
+            "campaigns": campaigns[offset : offset + count],
+            "total_items": len(campaigns),
+        }
+
+    def create_campaign(self, request: Request):
+        number = len(self.campaigns) + 1
+        campaign = {
+            "id": f"camp{number:06d}",
+            "web_id": 5000 + number,
+            **request.json(),
+            "html": (
+                TEMPLATE_HTML if "template_id" in request.json()["settings"] else ""
+            ),
+        }
+        self.campaigns[campaign["id"]] = campaign
+        return {key: value for key, value in campaign.items() if key != "html"}
+
+    def remove_campaign(self, request: Request, campaign_id: str):
+        self.campaigns.pop(campaign_id, None)
+        return Response(status=204, content_type="text/plain")
+
+    def get_content(self, request: Request, campaign_id: str):
+        campaign = self.campaigns.get(campaign_id)
+        if campaign is None:
+            return self._missing()
+        return {"html": campaign["html"]}
+
+    def set_content(self, request: Request, campaign_id: str):
+        campaign = self.campaigns.get(campaign_id)
+        if campaign is None:
+            return self._missing()
+        campaign["html"] = request.json()["html"]
+        return {"html": campaign["html"]}
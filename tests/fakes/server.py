@@ -0,0 +1,147 @@
+"""
+A small threaded http server for standing in for remote APIs in tests.
+
+Subclasses register routes as (method, regex) pairs; the server can add
+latency to every request and answer every nth request with a 429.
+"""
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+Handler = Callable[..., Any]
+
+
+class Response:
+    """
+    A non-json response (or a json response with a particular status)
+    """
+
+    def __init__(
+        self,
+        body: bytes | Any = b"",
+        status: int = 200,
+        content_type: str = "application/json",
+        headers: Optional[dict[str, str]] = None,
+    ):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.body = body
+        self.status = status
+        self.content_type = content_type
+        self.headers = headers or {}
+
+
+class Request:
+    def __init__(self, method: str, path: str, query: dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.body = body
+
+    def json(self) -> Any:
+        return json.loads(self.body or b"null")
+
+
+class FakeServer:
+    """
+    Base class for fake API servers. Use as a context manager.
+    """
+
+    prefix = ""
+
+    def __init__(self, latency: float = 0.0, rate_limit_every: int = 0):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.requests: list[tuple[str, str]] = []
+        self._lock = threading.Lock()
+        self._routes: list[tuple[str, re.Pattern[str], Handler]] = []
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def route(self, method: str, pattern: str, handler: Handler):
+        self._routes.append((method, re.compile(pattern + "$"), handler))
+
+    @property
+    def url(self) -> str:
+        assert self._server is not None, "server not started"
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.prefix}"
+
+    def count(self, method: str, pattern: str = "") -> int:
+        """
+        Number of requests made with a method (and path matching pattern)
+        """
+        regex = re.compile(pattern)
+        return sum(1 for m, path in self.requests if m == method and regex.search(path))
+
+    def _dispatch(self, request: Request) -> Response:
+        with self._lock:
+            self.requests.append((request.method, request.path))
+            number = len(self.requests)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.rate_limit_every and number % self.rate_limit_every == 0:
+            return Response(
+                {"title": "Too Many Requests", "status": 429},
+                status=429,
+                headers={"Retry-After": "0"},
+            )
+        path = request.path[len(self.prefix) :]
+        for method, pattern, handler in self._routes:
+            match = pattern.match(path)
+            if method == request.method and match:
+                result = handler(request, *match.groups())
+                return result if isinstance(result, Response) else Response(result)
+        return Response({"title": "Resource Not Found", "status": 404}, status=404)
+
+    def start(self):
+        fake = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self):
+                parts = urlsplit(self.path)
+                query = {
+                    key: values[-1] for key, values in parse_qs(parts.query).items()
+                }
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                response = fake._dispatch(
+                    Request(self.command, parts.path, query, body)
+                )
+                self.send_response(response.status)
+                self.send_header("Content-Type", response.content_type)
+                self.send_header("Content-Length", str(len(response.body)))
+                for key, value in response.headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(response.body)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
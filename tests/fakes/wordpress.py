@@ -0,0 +1,88 @@
+"""
+A local stand-in for the WordPress REST endpoints the publishing pipeline
+uses: users, categories, media and posts.
+"""
+
+import math
+from typing import Any
+
+from mysoc_mailchimp.wordpress_api import WordPressClient
+
+from .server import FakeServer, Request, Response
+
+API = "/wp-json/wp/v2"
+
+
+class FakeWordPress(FakeServer):
+    """
+    Fake WordPress site. Uploaded media and created posts are kept
+    in memory for checking.
+    """
+
+    def __init__(
+        self,
+        users: list[str] = ["admin", "repoweringdemocracy"],
+        categories: list[str] = ["Democracy", "Repowering Democracy"],
+        latency: float = 0.0,
+        rate_limit_every: int = 0,
+    ):
+        super().__init__(latency=latency, rate_limit_every=rate_limit_every)
+        self.users = [
+            {"id": index + 1, "slug": slug, "name": slug}
+            for index, slug in enumerate(users)
+        ]
+        self.categories = [
+            {"id": index + 10, "name": name} for index, name in enumerate(categories)
+        ]
+        self.media: dict[int, dict[str, Any]] = {}
+        self.posts: dict[int, dict[str, Any]] = {}
+
+        self.route("GET", API + "/users", self.list_of(self.users))
+        self.route("GET", API + "/categories", self.list_of(self.categories))
+        self.route("POST", API + "/media", self.upload_media)
+        self.route("GET", API + r"/media/(\d+)", self.get_media)
+        self.route("POST", API + "/posts", self.create_post)
+
+    @property
+    def base_url(self) -> str:
+        return self.url + "/"
+
+    def client(self, **kwargs) -> WordPressClient:
+        return WordPressClient(self.base_url, "user", "password", **kwargs)
+
+    def list_of(self, items: list[dict[str, Any]]):
+        def handler(request: Request):
+            per_page = int(request.query.get("per_page", 10))
+            page = int(request.query.get("page", 1))
+            start = (page - 1) * per_page
+            return Response(
+                items[start : start + per_page],
+                headers={
+                    "X-WP-Total": str(len(items)),
+                    "X-WP-TotalPages": str(max(1, math.ceil(len(items) / per_page))),
+                },
+            )
+
+        return handler
+
+    def upload_media(self, request: Request):
+        media_id = 100 + len(self.media)
+        self.media[media_id] = {
+            "id": media_id,
+            "source_url": f"{self.url}/wp-content/uploads/{media_id}",
+            "title": request.query.get("title", ""),
+            "alt_text": request.query.get("alt_text", ""),
+            "bytes": len(request.body),
+        }
+        return Response(self.media[media_id], status=201)
+
+    def get_media(self, request: Request, media_id: str):
+        media = self.media.get(int(media_id))
+        if media is None:
+            return Response({"code": "rest_post_invalid_id"}, status=404)
+        return {"id": media["id"]}
+
+    def create_post(self, request: Request):
+        post_id = 1000 + len(self.posts)
+        self.posts[post_id] = {"id": post_id, **request.json()}
+        return Response({"id": post_id}, status=201)
@@ -0,0 +1,92 @@
+import base64
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+from PIL import Image
+
+from mysoc_mailchimp import gdoc
+from mysoc_mailchimp.gdoc import ConversionCache, mammoth_html_to_soup
+from mysoc_mailchimp.images import ImageManifest, process_image
+
+
+def data_uri(width: int, height: int, image_format: str = "PNG") -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, format=image_format)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f"data:image/{image_format.lower()};base64,{encoded}"
+
+
+def noisy_png_data_uri(width: int, height: int) -> str:
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert("RGB").save(buffer, "PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_extract_writes_manifest(tmp_path: Path):
+    html = (
+        f'<p>Text</p><img src="{data_uri(1000, 50)}" alt="wide">'
+        f'<img src="{data_uri(20, 10, "JPEG")}" alt="small">'
+    )
+    soup = mammoth_html_to_soup(html, tmp_path)
+    manifest = ImageManifest.load(tmp_path)
+    sizes = []
+    for image in soup.find_all("img"):
+        assert Path(image["src"]).exists()
+        processed = manifest[image["src"]]
+        sizes.append((processed.width, processed.height))
+    assert sizes == [(1000, 50), (20, 10)]
+
+
+def test_wide_images_are_shrunk(tmp_path: Path):
+    processed = process_image(data_uri(3200, 1600, "JPEG"), str(tmp_path / "a"))
+    assert (processed.width, processed.height) == (1600, 800)
+    with Image.open(processed.path) as image:
+        assert image.size == (1600, 800)
+
+
+def test_large_pngs_are_recompressed(tmp_path: Path):
+    processed = process_image(noisy_png_data_uri(800, 600), str(tmp_path / "b"))
+    assert processed.original_bytes > 300_000
+    assert processed.bytes < processed.original_bytes
+    assert not processed.path.endswith(".png")
+
+
+def test_conversion_cache_is_keyed_by_revision(tmp_path: Path):
+    cache = ConversionCache(tmp_path)
+    assert cache.get("1-2024-01-01") is None
+    cache.store("1-2024-01-01", "<p>v1</p>")
+    assert cache.get("1-2024-01-01") == "<p>v1</p>"
+    assert cache.get("2-2024-01-02") is None
+
+
+def test_images_are_not_reprocessed(tmp_path: Path):
+    html = f'<img src="{data_uri(30, 20)}">'
+    first = str(mammoth_html_to_soup(html, tmp_path))
+    path = Path(BeautifulSoup(first, "html.parser").find("img")["src"])  # type: ignore
+    modified = path.stat().st_mtime_ns
+    assert str(mammoth_html_to_soup(html, tmp_path)) == first
+    assert path.stat().st_mtime_ns == modified
+
+
+def shares_drive_service(parent_service: object) -> bool:
+    return gdoc.get_drive_service() is parent_service
+
+
+def test_forked_workers_build_their_own_drive_service(monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLIENT_JSON", "{}")
+    monkeypatch.setattr(gdoc, "_drive_services", {})
+    monkeypatch.setattr(
+        gdoc.service_account.Credentials,
+        "from_service_account_info",
+        lambda info: None,
+    )
+    monkeypatch.setattr(gdoc, "build_drive_service", lambda credentials: object())
+    service = gdoc.get_drive_service()
+    assert gdoc.get_drive_service() is service
+
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        assert not executor.submit(shares_drive_service, service).result()
@@ -0,0 +1,96 @@
+import json
+import socket
+from pathlib import Path
+
+import pytest
+
+from mysoc_mailchimp import instrumentation
+from mysoc_mailchimp.instrumentation import (
+    ApiEvent,
+    ApiSummary,
+    JsonLinesWriter,
+    StatsdSender,
+    collapse_ids,
+)
+from mysoc_mailchimp.mailchimp import InternalListID, get_member_from_email
+from mysoc_mailchimp.wordpress_funcs import load_blog_to_wordpress
+
+from .conftest import PublishingFakes
+from .fakes.docx import make_docx
+from .fakes.mailchimp import LIST_ID, FakeMailchimp
+from .test_publishing import CONFIG
+
+
+@pytest.fixture
+def summary():
+    summary = ApiSummary()
+    instrumentation.add_hook(summary)
+    yield summary
+    instrumentation.remove_hook(summary)
+
+
+def test_mailchimp_calls_are_recorded_with_retries(summary: ApiSummary):
+    with FakeMailchimp(members=10, rate_limit_every=2) as fake:
+        get_member_from_email(
+            fake.api_key, InternalListID(LIST_ID), "person1@example.com"
+        )
+        get_member_from_email(
+            fake.api_key, InternalListID(LIST_ID), "person2@example.com"
+        )
+
+    first, second = summary.events
+    assert first.service == "mailchimp"
+    assert first.endpoint == "/lists/{list_id}/members/{subscriber_hash}"
+    assert (first.status, first.retries) == (200, 0)
+    # the second call was rate limited once, then succeeded
+    assert (second.status, second.retries) == (200, 1)
+    assert second.response_bytes > 0
+
+    [row] = summary.rows()
+    assert (row["calls"], row["errors"], row["retries"]) == (2, 0, 1)
+
+
+def test_collapse_ids():
+    path = "/drive/v3/files/1CYfTKBwP2PgPcV0HasjbuXuh599GbATKUMVFBnfV_gk/export"
+    assert collapse_ids(path) == "/drive/v3/files/{id}/export"
+    assert collapse_ids("/wp-json/wp/v2/media/123") == "/wp-json/wp/v2/media/{id}"
+
+
+def test_json_lines(tmp_path: Path):
+    path = tmp_path / "events.jsonl"
+    writer = JsonLinesWriter(path)
+    writer(ApiEvent("wordpress", "POST", "media", 201, 0.5, response_bytes=10))
+    writer(ApiEvent("drive", "GET", "/files/{id}", 200, 0.1))
+    writer.close()
+    events = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [event["service"] for event in events] == ["wordpress", "drive"]
+    assert events[0]["status"] == 201
+
+
+def test_statsd_metrics():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(5)
+    sender = StatsdSender("127.0.0.1", receiver.getsockname()[1])
+    sender(ApiEvent("wordpress", "POST", "media/{id}", 201, 0.25, retries=2))
+    lines = receiver.recv(4096).decode().splitlines()
+    receiver.close()
+    assert lines == [
+        "mysoc_mailchimp.wordpress.post.media_id.time:250.000|ms",
+        "mysoc_mailchimp.wordpress.post.media_id.calls:1|c",
+        "mysoc_mailchimp.wordpress.post.media_id.status_201:1|c",
+        "mysoc_mailchimp.wordpress.post.media_id.retries:2|c",
+    ]
+
+
+def test_publishing_calls_are_recorded(
+    publishing: PublishingFakes, summary: ApiSummary
+):
+    docx = make_docx(publishing.corpus / "post.docx", sections=1, image_size=(40, 30))
+    publishing.drive.add_document("doc1", docx)
+    load_blog_to_wordpress("doc1", None, CONFIG)
+
+    endpoints = {(row["service"], row["endpoint"]) for row in summary.rows()}
+    assert ("drive", "/drive/v3/files/doc1/export") in endpoints
+    assert ("wordpress", "posts") in endpoints
+    assert ("wordpress", "media") in endpoints
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+from mailchimp_marketing.api_client import ApiClientError
+
+from mysoc_mailchimp import mailchimp
+from mysoc_mailchimp.mailchimp import (
+    InterestIndex,
+    InternalListID,
+    get_all_members,
+    get_member_from_email,
+    set_user_metadata,
+)
+
+from .fakes.mailchimp import (
+    CATEGORY_ID,
+    CATEGORY_NAME,
+    INTERESTS,
+    LIST_ID,
+    FakeMailchimp,
+)
+
+LIST = InternalListID(LIST_ID)
+
+
+def test_get_all_members_pages_through_the_list(fake: FakeMailchimp):
+    members = get_all_members(fake.api_key, LIST)
+    assert len(members) == 2500
+    assert len({member["id"] for member in members}) == 2500
+    assert fake.count("GET", "/members$") == 3
+
+
+def test_get_all_members_cut_off(fake: FakeMailchimp):
+    assert len(get_all_members(fake.api_key, LIST, cut_off=10)) == 10
+    assert fake.count("GET", "/members$") == 1
+
+
+def test_set_user_metadata_creates_and_updates(fake: FakeMailchimp):
+    set_user_metadata(
+        fake.api_key,
+        LIST,
+        "new.person@example.com",
+        merge_data={"FNAME": "New"},
+        tags=["newsletter"],
+        interest_group_collection=CATEGORY_NAME,
+        interests=["Climate"],
+    )
+    member = get_member_from_email(fake.api_key, LIST, "new.person@example.com")
+    assert member["merge_fields"] == {"FNAME": "New"}
+    assert member["interests"] == {INTERESTS["Climate"]: True}
+    assert [tag["name"] for tag in member["tags"]] == ["newsletter"]
+
+    set_user_metadata(fake.api_key, LIST, "person1@example.com", tags=["donor2"])
+    member = get_member_from_email(fake.api_key, LIST, "person1@example.com")
+    assert "donor2" in [tag["name"] for tag in member["tags"]]
+
+
+def test_rate_limited_requests_fail(fake: FakeMailchimp):
+    fake.rate_limit_every = 1
+    with pytest.raises(ApiClientError) as error:
+        get_member_from_email(fake.api_key, LIST, "person1@example.com")
+    assert error.value.status_code == 429
+
+
+def test_interest_index_looks_up_both_ways(fake: FakeMailchimp):
+    interests = mailchimp.get_interest_index().get(fake.api_key, LIST)
+    assert interests.category(CATEGORY_NAME).id == CATEGORY_ID
+    assert interests.interest_ids(CATEGORY_NAME, ["Climate"]) == [INTERESTS["Climate"]]
+    category, name = interests.interest(INTERESTS["Democracy"])
+    assert (category.title, name) == (CATEGORY_NAME, "Democracy")
+
+
+def test_interest_index_is_persisted(fake: FakeMailchimp, interest_index):
+    interest_index.get(fake.api_key, LIST)
+    assert fake.count("GET", "/interest-categories$") == 1
+
+    reloaded = InterestIndex(interest_index.path)
+    group = reloaded.lookup(
+        fake.api_key, LIST, lambda interests: interests.category(CATEGORY_NAME)
+    )
+    assert group.interests == INTERESTS
+    assert fake.count("GET", "/interest-categories$") == 1
+
+
+def test_interest_index_refreshes(fake: FakeMailchimp, tmp_path):
+    index = InterestIndex(tmp_path / "interests.json", ttl=-1)
+    index.get(fake.api_key, LIST)
+    index.get(fake.api_key, LIST)
+    # stale after the ttl
+    assert fake.count("GET", "/interest-categories$") == 2
+
+    index.ttl = 60
+    fake.categories["cat0000002"] = ("Events", {"Conference": "int0000003"})
+    ids = index.lookup(
+        fake.api_key,
+        LIST,
+        lambda interests: interests.interest_ids("Events", ["Conference"]),
+    )
+    # a new category is found by refreshing once
+    assert ids == ["int0000003"]
+    assert fake.count("GET", "/interest-categories$") == 3
+
+
+def test_interest_typo_suggests_a_name(fake: FakeMailchimp):
+    with pytest.raises(ValueError, match="did you mean 'Climate'"):
+        set_user_metadata(
+            fake.api_key,
+            LIST,
+            "person1@example.com",
+            interest_group_collection=CATEGORY_NAME,
+            interests=["Climat"],
+        )
+    with pytest.raises(ValueError, match=f"did you mean {CATEGORY_NAME!r}"):
+        mailchimp.get_interest_group(fake.api_key, LIST, "Topic")
+
+
+def test_interest_categories_are_fetched_at_once(fake: FakeMailchimp):
+    for number in range(2, 9):
+        fake.categories[f"cat{number:07d}"] = (f"Category {number}", {})
+    fake.latency = 0.05
+    start = time.perf_counter()
+    interests = mailchimp.fetch_list_interests(fake.api_key, LIST)
+    assert len(interests.categories) == 8
+    # one request for the categories, then the interests together
+    # (one at a time would take at least nine round trips)
+    assert time.perf_counter() - start < 0.05 * 8
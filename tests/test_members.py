@@ -0,0 +1,82 @@
+import pytest
+
+from mysoc_mailchimp.mailchimp import InternalListID, get_all_members
+from mysoc_mailchimp.members import (
+    MemberSchema,
+    api_fields_for,
+    get_members_table,
+    iter_member_batches,
+    members_to_record_batch,
+)
+
+from .fakes.mailchimp import INTERESTS, LIST_ID, FakeMailchimp
+
+pa = pytest.importorskip("pyarrow")
+
+LIST = InternalListID(LIST_ID)
+
+
+def test_schema_from_members():
+    members = [
+        {"merge_fields": {"LNAME": "", "FNAME": "A"}, "interests": {"b": True}},
+        {"merge_fields": {"FNAME": "B"}, "interests": {"a": False}},
+    ]
+    schema = MemberSchema.from_members(members)
+    assert schema == MemberSchema(("FNAME", "LNAME"), ("a", "b"))
+    assert MemberSchema.from_arrow(schema.arrow_schema()) == schema
+
+
+def test_members_table_matches_api_records(fake: FakeMailchimp):
+    table = get_members_table(fake.api_key, LIST)
+    members = get_all_members(fake.api_key, LIST)
+    assert table.num_rows == len(members)
+
+    interest = "interest_" + INTERESTS["Democracy"]
+    assert table.column(interest).type == pa.bool_()
+    assert table.column(interest).to_pylist() == [
+        member["interests"][INTERESTS["Democracy"]] for member in members
+    ]
+    assert table.column("merge_FNAME").to_pylist()[:2] == ["Person0", "Person1"]
+    assert table.column("tags").to_pylist()[:2] == [["donor"], []]
+    assert table.column("status").type == pa.dictionary(pa.int32(), pa.string())
+    # members without a signup time have a null rather than ""
+    signup = table.column("timestamp_signup")
+    assert signup.null_count == sum(1 for m in members if not m["timestamp_signup"])
+    # unused parts of the record aren't kept
+    assert "stats" not in table.column_names
+    assert "location" not in table.column_names
+
+
+def test_batches_arrive_per_page(fake: FakeMailchimp):
+    batches = list(iter_member_batches(fake.api_key, LIST, page_size=1000))
+    assert [batch.num_rows for batch in batches] == [1000, 1000, 500]
+    assert len({batch.schema for batch in batches}) == 1
+
+
+def test_schema_is_kept_for_unexpected_fields():
+    schema = MemberSchema(("FNAME",), ("x",))
+    batch = members_to_record_batch(
+        [
+            {
+                "id": "1",
+                "email_address": "a@example.com",
+                "merge_fields": {"FNAME": "A", "ADDRESS": {"addr1": "1 Street"}},
+                "interests": {"x": True, "y": True},
+                "tags": [],
+            }
+        ],
+        schema,
+    )
+    assert batch.schema == schema.arrow_schema()
+    assert batch.column(batch.schema.get_field_index("interest_x"))[0].as_py()
+
+
+def test_api_fields_for_projection():
+    assert api_fields_for(["email_address", "merge_F*"]) == [
+        "members.id",
+        "total_items",
+        "members.email_address",
+        "members.merge_fields",
+    ]
+    assert "members.interests" in api_fields_for(["interest_*"])
+    assert "members.tags" in api_fields_for(["tags"])
@@ -0,0 +1,172 @@
+import datetime
+import importlib
+import json
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+from pytest import MonkeyPatch
+
+from mysoc_mailchimp.mailchimp import InternalListID, MailChimpHandler
+
+from .conftest import clear_mailchimp_lookups
+from .fakes.mailchimp import (
+    INTERESTS,
+    LIST_ID,
+    LIST_WEB_ID,
+    SEGMENT_ID,
+    FakeMailchimp,
+)
+
+pytest.importorskip("pyarrow")
+
+from mysoc_mailchimp.mirror import (  # noqa: E402
+    MirrorQueryError,
+    mirror_info,
+    mirror_list,
+    query_mirror,
+)
+
+LIST = InternalListID(LIST_ID)
+ENGINES = [
+    "sqlite",
+    pytest.param(
+        "duckdb",
+        marks=pytest.mark.skipif(
+            importlib.util.find_spec("duckdb") is None, reason="needs duckdb"
+        ),
+    ),
+]
+# donors who joined in the last fortnight and are interested in democracy
+QUESTION = f"""
+    SELECT count(*) AS people
+    FROM members
+    JOIN tags ON tags.member_id = members.id
+    WHERE tags.tag = 'donor'
+    AND members.timestamp_opt >= '{datetime.date.today() - datetime.timedelta(days=14)}'
+    AND members.interest_{INTERESTS["Democracy"]}
+"""
+
+
+@pytest.fixture(scope="module")
+def mirrored(tmp_path_factory):
+    path = tmp_path_factory.mktemp("mirror") / "mirror"
+    with FakeMailchimp(members=600) as fake:
+        # a campaign to another list isn't mirrored
+        fake.campaigns["other0001"] = {
+            **fake.campaigns["sent000001"],
+            "id": "other0001",
+            "recipients": {"list_id": "otherlist"},
+        }
+        counts = mirror_list(fake.api_key, LIST, path)
+        yield fake, path, counts
+    clear_mailchimp_lookups()
+
+
+def expected_answer(fake: FakeMailchimp) -> int:
+    since = datetime.date.today() - datetime.timedelta(days=14)
+    return sum(
+        1
+        for member in fake.members.values()
+        if any(tag["name"] == "donor" for tag in member["tags"])
+        and member["timestamp_opt"][:10] >= since.isoformat()
+        and member["interests"][INTERESTS["Democracy"]]
+    )
+
+
+def test_mirror_tables(mirrored):
+    fake, path, counts = mirrored
+    assert counts == {
+        "members": 600,
+        "tags": 60,
+        "interests": len(INTERESTS),
+        "segments": 1,
+        "segment_members": 60,
+        "campaigns": 2,
+    }
+    assert mirror_info(path)["list_id"] == LIST_ID
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_query_without_api_calls(mirrored, engine: str):
+    fake, path, _ = mirrored
+    requests_before = len(fake.requests)
+    df = query_mirror(QUESTION, path, engine)
+    assert df["people"].tolist() == [expected_answer(fake)]
+
+    df = query_mirror(
+        f"""
+        SELECT interests.interest, count(*) AS people
+        FROM segment_members
+        JOIN members ON members.id = segment_members.member_id
+        JOIN interests ON interests.interest_id = '{INTERESTS["Climate"]}'
+        WHERE segment_members.segment_id = {SEGMENT_ID}
+        AND members.interest_{INTERESTS["Climate"]}
+        GROUP BY interests.interest
+        """,
+        path,
+        engine,
+    )
+    assert df["interest"].tolist() == ["Climate"]
+    assert len(fake.requests) == requests_before
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_bad_sql_is_a_query_error(mirrored, engine: str):
+    _, path, _ = mirrored
+    with pytest.raises(MirrorQueryError):
+        query_mirror("SELECT nothing FROM nowhere", path, engine)
+
+
+def test_mirror_only_replaces_a_mirror(mirrored, tmp_path: Path):
+    fake, _, _ = mirrored
+    folder = tmp_path / "documents"
+    folder.mkdir()
+    (folder / "notes.txt").write_text("important")
+    with pytest.raises(FileExistsError):
+        mirror_list(fake.api_key, LIST, folder)
+    assert (folder / "notes.txt").exists()
+
+
+def test_query_needs_a_mirror(tmp_path: Path):
+    with pytest.raises(FileNotFoundError):
+        query_mirror("SELECT 1", tmp_path)
+
+
+def test_mirror_and_query_commands(tmp_path: Path, monkeypatch: MonkeyPatch):
+    monkeypatch.setenv("MAILCHIMP_API_KEY", "fake-key-us9")
+    main = importlib.import_module("mysoc_mailchimp.__main__")
+    runner = CliRunner()
+    path = str(tmp_path / "mirror")
+    with FakeMailchimp(members=100) as fake:
+        handler = MailChimpHandler(fake.api_key.api_key, "us9", host=fake.url)
+        monkeypatch.setattr(main, "mailchimp_handler", handler)
+        result = runner.invoke(
+            main.cli, ["mirror", "-l", str(LIST_WEB_ID), "--path", path]
+        )
+        assert result.exit_code == 0, result.output
+    clear_mailchimp_lookups()
+
+    result = runner.invoke(
+        main.cli,
+        [
+            "query",
+            "SELECT status, count(*) AS people FROM members GROUP BY status",
+            "--path",
+            path,
+            "--engine",
+            "sqlite",
+            "--json",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output) == {
+        "rows": [{"status": "subscribed", "people": 100}]
+    }
+
+    result = runner.invoke(
+        main.cli, ["query", "SELEC 1", "--path", path, "--engine", "sqlite"]
+    )
+    assert result.exit_code == 2
+    assert "syntax error" in result.output
+    assert "Traceback" not in result.output
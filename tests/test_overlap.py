@@ -0,0 +1,148 @@
+import importlib
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+from pytest import MonkeyPatch
+
+from mysoc_mailchimp import mailchimp
+from mysoc_mailchimp.mailchimp import InternalListID, MailChimpHandler
+from mysoc_mailchimp.overlap import POPCOUNT_TABLE, MembershipMatrix, popcount
+
+from .fakes.mailchimp import (
+    CATEGORY_ID,
+    CATEGORY_NAME,
+    INTERESTS,
+    LIST_ID,
+    LIST_WEB_ID,
+    SEGMENT_NAME,
+    FakeMailchimp,
+)
+
+LIST = InternalListID(LIST_ID)
+
+
+def expected_overlaps(masks: np.ndarray) -> np.ndarray:
+    return masks.astype(np.int64) @ masks.T.astype(np.int64)
+
+
+def test_popcount_matches_lookup_table():
+    values = np.arange(256, dtype=np.uint8)
+    assert (popcount(values) == POPCOUNT_TABLE[values]).all()
+
+
+def test_overlaps_match_boolean_counts():
+    rng = np.random.default_rng(0)
+    # a member count that isn't a multiple of 8 checks the padding bits
+    masks = rng.random((7, 1003)) < [[0.5], [0.1], [0.9], [0.0], [1.0], [0.3], [0.2]]
+    matrix = MembershipMatrix.from_masks([str(n) for n in range(7)], masks)
+    assert (matrix.overlaps() == expected_overlaps(masks)).all()
+    assert (matrix.sizes() == masks.sum(axis=1)).all()
+
+    df = matrix.to_frame(percent=True)
+    assert df.loc[4, "4"] == 100.0
+    assert df.loc[3, "1"] == 0.0
+
+
+@pytest.fixture
+def fake_members() -> int:
+    return 300
+
+
+def fake_masks(fake: FakeMailchimp) -> dict[str, np.ndarray]:
+    members = list(fake.members.values())
+    masks = {
+        f"{CATEGORY_NAME}: {name}": np.array(
+            [member["interests"][interest_id] for member in members]
+        )
+        for name, interest_id in INTERESTS.items()
+    }
+    donors = np.array(
+        [any(tag["name"] == "donor" for tag in member["tags"]) for member in members]
+    )
+    masks["tag: donor"] = donors
+    masks[f"segment: {SEGMENT_NAME}"] = donors
+    return masks
+
+
+def test_matrix_from_list_and_mirror(fake: FakeMailchimp, tmp_path: Path):
+    pytest.importorskip("pyarrow")
+    from mysoc_mailchimp.mirror import mirror_list
+    from mysoc_mailchimp.overlap import matrix_from_list, matrix_from_mirror
+
+    masks = fake_masks(fake)
+    expected = expected_overlaps(np.vstack(list(masks.values())))
+
+    live = matrix_from_list(fake.api_key, LIST, include_segments=True)
+    assert live.labels == list(masks)
+    assert (live.overlaps() == expected).all()
+
+    mirror_list(fake.api_key, LIST, tmp_path / "mirror")
+    requests_before = len(fake.requests)
+    mirrored = matrix_from_mirror(tmp_path / "mirror")
+    assert mirrored.labels == list(masks)
+    assert (mirrored.overlaps() == expected).all()
+    assert len(fake.requests) == requests_before
+
+    # a donor tag on one member is dropped by min_size
+    fake.members[next(iter(fake.members))]["tags"].append({"id": 9, "name": "once"})
+    assert "tag: once" not in matrix_from_list(fake.api_key, LIST, min_size=2).labels
+
+
+def test_matrix_from_list_without_interests(fake: FakeMailchimp):
+    pytest.importorskip("pyarrow")
+    from mysoc_mailchimp.overlap import matrix_from_list
+
+    fake.categories.clear()
+    for member in fake.members.values():
+        member["interests"] = {}
+    matrix = matrix_from_list(fake.api_key, LIST, include_segments=True)
+    assert matrix.labels == ["tag: donor", f"segment: {SEGMENT_NAME}"]
+
+    fake.members.clear()
+    assert matrix_from_list(fake.api_key, LIST).labels == []
+
+
+def test_matrix_from_snapshot_labels_interests(fake: FakeMailchimp, tmp_path: Path):
+    pytest.importorskip("pyarrow")
+    from mysoc_mailchimp.overlap import matrix_from_snapshot
+    from mysoc_mailchimp.snapshots import export_members
+
+    export_members(fake.api_key, LIST, tmp_path / "snapshot")
+    labels = [f"{CATEGORY_NAME}: {name}" for name in INTERESTS]
+    matrix = matrix_from_snapshot(tmp_path / "snapshot", fake.api_key)
+    assert matrix.labels == labels + ["tag: donor"]
+
+    # an interest deleted since the snapshot keeps its id
+    fake.categories[CATEGORY_ID][1].pop("Climate")
+    mailchimp.get_interest_index().refresh(fake.api_key, LIST)
+    matrix = matrix_from_snapshot(tmp_path / "snapshot", fake.api_key)
+    assert matrix.labels[:2] == [labels[0], INTERESTS["Climate"]]
+
+    # without an api key, interests are labelled by id
+    matrix = matrix_from_snapshot(tmp_path / "snapshot")
+    assert matrix.labels[:2] == sorted(INTERESTS.values())
+
+
+def test_overlap_report_command(
+    fake: FakeMailchimp, tmp_path: Path, monkeypatch: MonkeyPatch
+):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setenv("MAILCHIMP_API_KEY", "fake-key-us9")
+    main = importlib.import_module("mysoc_mailchimp.__main__")
+    handler = MailChimpHandler(fake.api_key.api_key, "us9", host=fake.url)
+    monkeypatch.setattr(main, "mailchimp_handler", handler)
+
+    result = CliRunner().invoke(
+        main.cli, ["overlap-report", "-l", str(LIST_WEB_ID), "--no-tags", "--json"]
+    )
+    assert result.exit_code == 0, result.output
+    rows = json.loads(result.output)["overlaps"]
+    masks = fake_masks(fake)
+    democracy = f"{CATEGORY_NAME}: Democracy"
+    climate = f"{CATEGORY_NAME}: Climate"
+    assert [row["group"] for row in rows] == [democracy, climate]
+    assert rows[0]["size"] == masks[democracy].sum()
+    assert rows[0][climate] == (masks[democracy] & masks[climate]).sum()
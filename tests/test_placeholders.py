@@ -0,0 +1,46 @@
+from mysoc_mailchimp.placeholders import (
+    BLOG_PLACEHOLDERS,
+    compile_template,
+    fill_placeholders,
+)
+
+
+def test_fills_all_blog_tokens():
+    template = (
+        "<h1>[main title]</h1><a href='http://**blog-url**'>"
+        f"<img src='{BLOG_PLACEHOLDERS['image']}'></a>[content]"
+    )
+    result = fill_placeholders(
+        template,
+        {
+            "title": "Title",
+            "url": "https://www.mysociety.org/post/",
+            "image": "https://example.com/a.png",
+            "content": "<p>Body</p>",
+        },
+    )
+    assert result.html == (
+        "<h1>Title</h1><a href='https://www.mysociety.org/post/'>"
+        "<img src='https://example.com/a.png'></a><p>Body</p>"
+    )
+    assert result.unfilled == []
+
+
+def test_inserted_content_is_not_rescanned():
+    result = fill_placeholders(
+        "[content] [main title]",
+        {"content": "mentions [main title]", "title": "T"},
+    )
+    assert result.html == "mentions [main title] T"
+
+
+def test_reports_unfilled_placeholders():
+    result = fill_placeholders("[author] wrote [content]", {"content": "x"})
+    assert result.html == "[author] wrote x"
+    assert result.unfilled == ["author"]
+
+
+def test_custom_placeholders():
+    template = compile_template("Hi {{name}}", {"name": "{{name}}"})
+    assert template.present == {"name"}
+    assert template.render({"name": "Ada"}).html == "Hi Ada"
@@ -0,0 +1,98 @@
+import importlib
+import inspect
+import json
+import socket
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+from click.testing import CliRunner
+from pytest import MonkeyPatch
+
+from mysoc_mailchimp.mailchimp import MailChimpHandler
+from mysoc_mailchimp.profiling import Frame, SamplingProfiler, categorise
+
+from .fakes.mailchimp import FakeMailchimp
+
+
+def busy_soup(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        BeautifulSoup("<p>" + "<b>text</b>" * 200 + "</p>", "html.parser")
+
+
+def test_categorise():
+    def stack(*files: str) -> tuple[Frame, ...]:
+        return tuple(Frame("f", file, 1) for file in files)
+
+    main = "/src/mysoc_mailchimp/mailchimp.py"
+    assert categorise(stack(main, "/lib/python3.11/ssl.py")) == "network"
+    assert categorise(stack(main, "/site-packages/pandas/core/frame.py")) == "pandas"
+    assert categorise(stack(main, "/site-packages/bs4/__init__.py")) == "BeautifulSoup"
+    assert categorise(stack(main)) == "other"
+    idle = (Frame("wait", "/lib/python3.11/threading.py", 1),)
+    assert categorise(stack(main) + idle) == "idle"
+
+
+def test_profiler_separates_soup_and_network(tmp_path: Path):
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    client = socket.create_connection(listener.getsockname())
+    client.settimeout(0.3)
+
+    profiler = SamplingProfiler(interval=0.002)
+    profiler.start()
+    busy_soup(0.3)
+    try:
+        # nothing is ever sent, so this waits for the timeout
+        # (reading through a file, as http.client does)
+        client.makefile("rb").read(1)
+    except socket.timeout:
+        pass
+    profiler.stop()
+    client.close()
+    listener.close()
+
+    categories = profiler.category_times()
+    assert categories["BeautifulSoup"] > 0.1
+    assert categories.get("network", 0) > 0.1
+    hot = [frame.name for frame, _, _ in profiler.hot_functions()]
+    assert hot
+    # the wait on the socket is one stack sampled many times
+    distinct = sum(len(stacks) for stacks in profiler.stacks.values())
+    assert distinct < profiler.sample_count / 2
+
+    output = tmp_path / "profile.json"
+    profiler.write_speedscope(output)
+    data = json.loads(output.read_text())
+    frames = data["shared"]["frames"]
+    profile = data["profiles"][0]
+    assert profile["type"] == "sampled"
+    assert len(profile["samples"]) == len(profile["weights"])
+    assert len(profile["samples"]) == len(set(map(tuple, profile["samples"])))
+    assert all(index < len(frames) for sample in profile["samples"] for index in sample)
+    assert "busy_soup" in {frame["name"] for frame in frames}
+
+
+def test_profile_cpu_option(tmp_path: Path, monkeypatch: MonkeyPatch):
+    monkeypatch.setenv("MAILCHIMP_API_KEY", "fake-key-us9")
+    main = importlib.import_module("mysoc_mailchimp.__main__")
+    output = tmp_path / "cli.speedscope.json"
+    with FakeMailchimp(members=10) as fake:
+        handler = MailChimpHandler(fake.api_key.api_key, "us9", host=fake.url)
+        monkeypatch.setattr(main, "mailchimp_handler", handler)
+        # click 8.1 mixes stderr into the output unless told not to
+        separate = "mix_stderr" in inspect.signature(CliRunner).parameters
+        runner = CliRunner(**({"mix_stderr": False} if separate else {}))
+        result = runner.invoke(
+            main.cli,
+            ["--profile-cpu", "--profile-cpu-output", str(output), "lists", "--json"],
+        )
+    assert result.exit_code == 0, result.output
+    # the report goes to stderr so --json output stays parseable
+    assert json.loads(result.stdout)
+    assert "Profile written" in result.stderr
+    data = json.loads(output.read_text())
+    assert data["name"] == "lists"
+    assert data["profiles"]
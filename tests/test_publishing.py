@@ -0,0 +1,162 @@
+import os
+import threading
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+from PIL import Image
+
+from mysoc_mailchimp import gdoc, wordpress_api, wordpress_funcs
+from mysoc_mailchimp.gdoc import (
+    CONVERSION_NAME,
+    DriveDocument,
+    list_folder_documents,
+)
+from mysoc_mailchimp.images import ImageManifest
+from mysoc_mailchimp.wordpress_api import BlogImage, hash_file
+from mysoc_mailchimp.wordpress_funcs import (
+    batch_load_blogs_to_wordpress,
+    load_blog_to_wordpress,
+    upload_images,
+)
+from mysoc_mailchimp.workspace import get_workspace
+
+from .conftest import PublishingFakes
+from .fakes.docx import make_docx
+from .fakes.drive import FOLDER_ID
+
+CONFIG = Path(__file__).parents[1] / "config" / "repower-democracy.yaml"
+
+
+def test_load_blog_to_wordpress(publishing: PublishingFakes):
+    docx = make_docx(
+        publishing.corpus / "post.docx",
+        sections=3,
+        images_per_section=2,
+        image_size=(400, 300),
+    )
+    publishing.drive.add_document("doc1", docx)
+
+    post_id = load_blog_to_wordpress("doc1", None, CONFIG)
+
+    post = publishing.wordpress.posts[post_id]
+    assert post["title"] == "Generated blog post 0"
+    assert post["author"] == 2
+    assert post["categories"] == "11,10"
+    assert post["content"].count("/wp-content/uploads/") == 6
+    assert "unsplash.com/photos/abc123" in post["content"]
+    assert "mailchimp-signup" in post["content"]
+    # six images from the document, and the featured image
+    assert len(publishing.wordpress.media) == 7
+    assert post["featured_media"] in publishing.wordpress.media
+
+
+def test_unchanged_document_is_not_exported_again(publishing: PublishingFakes):
+    docx = make_docx(publishing.corpus / "post.docx", sections=1, image_size=(40, 30))
+    publishing.drive.add_document("doc1", docx)
+
+    load_blog_to_wordpress("doc1", None, CONFIG)
+    load_blog_to_wordpress("doc1", None, CONFIG)
+    assert publishing.drive.count("GET", "/export$") == 1
+    # images already in the library aren't uploaded twice
+    assert len(publishing.wordpress.media) == 3
+
+    publishing.drive.edit_document("doc1")
+    load_blog_to_wordpress("doc1", None, CONFIG)
+    assert publishing.drive.count("GET", "/export$") == 2
+
+
+def test_repeated_images_are_uploaded_once(publishing: PublishingFakes):
+    image = publishing.corpus / "chart.png"
+    Image.new("RGB", (40, 30), "red").save(image)
+    copy = publishing.corpus / "chart-copy.png"
+    copy.write_bytes(image.read_bytes())
+    featured = publishing.corpus / "featured.png"
+    Image.new("RGB", (40, 30), "blue").save(featured)
+    soup = BeautifulSoup(
+        f'<img src="{image}"><p>text</p><img src="{image}"><img src="{copy}">',
+        "html.parser",
+    )
+
+    upload_images(soup, ImageManifest(), BlogImage(featured))
+
+    assert len(publishing.wordpress.media) == 2
+    sources = {tag["src"] for tag in soup.find_all("img")}
+    assert len(sources) == 1
+
+
+def test_images_are_hashed_once_per_file(publishing: PublishingFakes, monkeypatch):
+    image = publishing.corpus / "chart.png"
+    Image.new("RGB", (40, 30), "red").save(image)
+    featured = publishing.corpus / "featured.png"
+    Image.new("RGB", (40, 30), "blue").save(featured)
+    soup = BeautifulSoup(
+        f'<img src="{image}" alt="A chart"><img src="{image}" alt="The chart again">',
+        "html.parser",
+    )
+    hashed: list[Path] = []
+
+    def counting_hash_file(path: Path) -> str:
+        hashed.append(path)
+        return hash_file(path)
+
+    monkeypatch.setattr(wordpress_funcs, "hash_file", counting_hash_file)
+    monkeypatch.setattr(wordpress_api, "hash_file", counting_hash_file)
+    upload_images(soup, ImageManifest(), BlogImage(featured))
+
+    assert sorted(hashed) == [image, featured]
+    # WordPress keeps the alt text on the media item, so each gets its own
+    alt_texts = [media["alt_text"] for media in publishing.wordpress.media.values()]
+    assert sorted(alt_texts) == ["A chart", "The chart again", "featured.png"]
+
+
+def test_batch_load_blogs_to_wordpress(publishing: PublishingFakes, monkeypatch):
+    for number in range(3):
+        docx = make_docx(
+            publishing.corpus / f"post{number}.docx",
+            sections=1,
+            image_size=(40, 30),
+            seed=number,
+        )
+        publishing.drive.add_document(f"doc{number}", docx)
+
+    # images are processed (in a process pool) before any threads start
+    threads: list[str] = []
+    process_images = gdoc.process_images
+
+    def recording_process_images(jobs, *args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return process_images(jobs, *args, **kwargs)
+
+    monkeypatch.setattr(gdoc, "process_images", recording_process_images)
+
+    documents = list_folder_documents(FOLDER_ID)
+    assert [doc.id for doc in documents] == ["doc0", "doc1", "doc2"]
+    results = batch_load_blogs_to_wordpress(
+        documents + [DriveDocument("missing")], CONFIG, workers=2
+    )
+
+    assert [result.title for result in results[:3]] == [
+        f"Generated blog post {number}" for number in range(3)
+    ]
+    assert all(result.post_id in publishing.wordpress.posts for result in results[:3])
+    assert results[3].post_id is None
+    assert results[3].error.startswith("conversion failed")
+    assert set(threads) == {threading.main_thread().name}
+
+
+def test_conversions_are_kept_in_the_workspace(publishing: PublishingFakes):
+    docx = make_docx(publishing.corpus / "post.docx", sections=1, image_size=(40, 30))
+    publishing.drive.add_document("doc1", docx)
+    load_blog_to_wordpress("doc1", None, CONFIG)
+
+    workspace = get_workspace()
+    assert (workspace.documents / "doc1" / CONVERSION_NAME).exists()
+    cache = Path(os.environ["MYSOC_MAILCHIMP_CACHE"])
+    # next to the WordPress indexes, with nothing else left in the cache
+    assert sorted(path.name for path in cache.iterdir()) == ["wordpress", "workspace"]
+
+    # evicting the document's folder also drops its conversion
+    workspace.max_bytes = 0
+    workspace.evict(min_age=0)
+    load_blog_to_wordpress("doc1", None, CONFIG)
+    assert publishing.drive.count("GET", "/export$") == 2
@@ -0,0 +1,123 @@
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from mysoc_mailchimp import scraping
+from mysoc_mailchimp.cache import HttpCache, OfflineCacheMiss
+from mysoc_mailchimp.scraping import get_details_from_blog
+
+FIXTURES = Path(__file__).parent / "fixtures"
+BLOG_URL = "https://www.mysociety.org/2025/03/27/devolved-registers/"
+
+
+@pytest.fixture
+def offline_cache(tmp_path: Path) -> HttpCache:
+    """
+    A cache preloaded with the recorded blog post that never hits the network
+    """
+    cache = HttpCache(tmp_path / "http", offline=True)
+    cache.store(
+        BLOG_URL,
+        (FIXTURES / "mysociety_blog_post.html").read_bytes(),
+        etag='"abc123"',
+    )
+    return cache
+
+
+def test_blog_details_from_recorded_page(offline_cache: HttpCache):
+    blog = get_details_from_blog(BLOG_URL, cache=offline_cache)
+    assert blog.title.startswith("Devolved parliamentary registers")
+    assert blog.author == "Alex Parsons"
+    assert blog.desc.startswith("You can now see the registers")
+    assert (
+        blog.image_url == "https://www.mysociety.org/files/2025/03/register-cover.jpg"
+    )
+    assert "mailchimp-signup" not in blog.content
+    assert "Share this post" not in blog.content
+    assert "Donate to keep" not in blog.content
+    assert "You can sign up here" not in blog.content
+    assert "Thanks to everyone" in blog.content
+    assert "\n\n" not in blog.content
+
+
+def test_offline_miss_raises(tmp_path: Path):
+    cache = HttpCache(tmp_path, offline=True)
+    with pytest.raises(OfflineCacheMiss):
+        cache.get_text(BLOG_URL)
+
+
+class ETagHandler(SimpleHTTPRequestHandler):
+    requests_seen: list[str] = []
+
+    def do_GET(self):
+        self.requests_seen.append(self.headers.get("If-None-Match", ""))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = b"<html>page</html>"
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_conditional_get_revalidates(tmp_path: Path):
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(ETagHandler, directory=str(tmp_path))
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/post/"
+        cache = HttpCache(tmp_path / "http", offline=False)
+        assert cache.get_text(url) == "<html>page</html>"
+        assert cache.get_text(url) == "<html>page</html>"
+        assert ETagHandler.requests_seen == ["", '"v1"']
+    finally:
+        server.shutdown()
+
+
+def test_bs4_fallback_matches_lxml(monkeypatch: pytest.MonkeyPatch):
+    page = (FIXTURES / "mysociety_blog_post.html").read_text()
+    fast = scraping.extract_blog_details(page, BLOG_URL)
+    monkeypatch.setattr(scraping, "lxml_html", None)
+    slow = scraping.extract_blog_details(page, BLOG_URL)
+    assert (fast.title, fast.desc, fast.author, fast.image_url) == (
+        slow.title,
+        slow.desc,
+        slow.author,
+        slow.image_url,
+    )
+    for blog in (fast, slow):
+        assert "web-only" not in blog.content
+        assert "You can sign up here" not in blog.content
+        assert "register-screenshot.png" in blog.content
+
+
+def test_both_backends_match_class_tokens(monkeypatch: pytest.MonkeyPatch):
+    page = (FIXTURES / "mysociety_blog_post.html").read_text()
+    for original, extra in [
+        ('class="mid-heading"', 'class="mid-heading mid-heading--blog"'),
+        (
+            'class="blog-post-meta__author-name"',
+            'class=" blog-post-meta__author-name  link"',
+        ),
+        ('class="wordpress-editor-content"', 'class="wordpress-editor-content prose"'),
+    ]:
+        page = page.replace(original, extra)
+    fast = scraping.extract_blog_details(page, BLOG_URL)
+    monkeypatch.setattr(scraping, "lxml_html", None)
+    slow = scraping.extract_blog_details(page, BLOG_URL)
+    for blog in (fast, slow):
+        assert blog.title.startswith("Devolved parliamentary registers")
+        assert blog.author == "Alex Parsons"
+        assert "Thanks to everyone" in blog.content
@@ -0,0 +1,119 @@
+import importlib
+import json
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+from pytest import MonkeyPatch
+
+from mysoc_mailchimp.mailchimp import InternalListID, MailChimpHandler
+from mysoc_mailchimp.members import get_members_table
+
+from .fakes.mailchimp import INTERESTS, LIST_ID, LIST_WEB_ID, FakeMailchimp
+
+pytest.importorskip("pyarrow")
+
+from mysoc_mailchimp.snapshots import (  # noqa: E402
+    diff_snapshots,
+    export_members,
+    load_snapshot,
+    snapshot_info,
+)
+
+LIST = InternalListID(LIST_ID)
+
+
+def test_export_and_load_round_trip(fake: FakeMailchimp, tmp_path: Path):
+    path = tmp_path / "snapshot"
+    fake.members["0" * 32] = {
+        **next(iter(fake.members.values())),
+        "id": "0" * 32,
+        "email_address": "gone@example.com",
+        "status": "unsubscribed",
+    }
+    assert export_members(fake.api_key, LIST, path) == 2501
+
+    assert (path / "status=subscribed" / "part-0.parquet").exists()
+    assert (path / "status=unsubscribed" / "part-0.parquet").exists()
+    assert snapshot_info(path)["list_id"] == LIST_ID
+
+    loaded = load_snapshot(path)
+    live = get_members_table(fake.api_key, LIST)
+    assert loaded.schema.remove_metadata() == live.schema
+    assert loaded.num_rows == live.num_rows
+    assert sorted(loaded.column("id").to_pylist()) == sorted(
+        live.column("id").to_pylist()
+    )
+    assert load_snapshot(path, columns=["id", "status"]).column_names == [
+        "id",
+        "status",
+    ]
+    with pytest.raises(FileExistsError):
+        export_members(fake.api_key, LIST, path)
+
+
+def test_export_fields(fake: FakeMailchimp, tmp_path: Path):
+    path = tmp_path / "snapshot"
+    export_members(fake.api_key, LIST, path, fields=["email_address", "interest_*"])
+    loaded = load_snapshot(path)
+    assert loaded.column_names == [
+        "id",
+        "email_address",
+        "status",
+        *[f"interest_{interest_id}" for interest_id in sorted(INTERESTS.values())],
+    ]
+    with pytest.raises(ValueError):
+        export_members(fake.api_key, LIST, tmp_path / "other", fields=["missing"])
+
+
+def test_diff_snapshots(fake: FakeMailchimp, tmp_path: Path):
+    export_members(fake.api_key, LIST, tmp_path / "old")
+    members = list(fake.members.values())
+    members[0]["merge_fields"]["FNAME"] = "Renamed"
+    members[1]["tags"].append({"id": 2, "name": "volunteer"})
+    del fake.members[members[2]["id"]]
+    fake._create_member({"email_address": "new@example.com"})
+    export_members(fake.api_key, LIST, tmp_path / "new")
+
+    diff = diff_snapshots(
+        load_snapshot(tmp_path / "old"), load_snapshot(tmp_path / "new")
+    )
+    assert diff.added.column("email_address").to_pylist() == ["new@example.com"]
+    assert diff.removed.column("email_address").to_pylist() == [
+        members[2]["email_address"]
+    ]
+    changes = {
+        (row["email_address"], row["column"]): (row["old"], row["new"])
+        for row in diff.changed.to_pylist()
+    }
+    assert changes == {
+        (members[0]["email_address"], "merge_FNAME"): ("Person0", "Renamed"),
+        (members[1]["email_address"], "tags"): ("", "volunteer"),
+    }
+
+
+def test_export_and_diff_commands(
+    fake: FakeMailchimp, tmp_path: Path, monkeypatch: MonkeyPatch
+):
+    monkeypatch.setenv("MAILCHIMP_API_KEY", "fake-key-us9")
+    main = importlib.import_module("mysoc_mailchimp.__main__")
+    handler = MailChimpHandler(fake.api_key.api_key, "us9", host=fake.url)
+    monkeypatch.setattr(main, "mailchimp_handler", handler)
+    runner = CliRunner()
+
+    for name in ["old", "new"]:
+        result = runner.invoke(
+            main.cli,
+            ["export-members", "-l", str(LIST_WEB_ID), "-o", str(tmp_path / name)],
+        )
+        assert result.exit_code == 0, result.output
+        fake.members[next(iter(fake.members))]["merge_fields"]["LNAME"] = "Changed"
+
+    result = runner.invoke(
+        main.cli,
+        ["diff-members", str(tmp_path / "old"), str(tmp_path / "new"), "--json"],
+    )
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output) == {
+        "changes": [{"column": "merge_LNAME", "changes": 1}]
+    }
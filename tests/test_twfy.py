@@ -0,0 +1,176 @@
+import datetime
+import json
+from pathlib import Path
+
+import pytest
+
+from mysoc_mailchimp.cache import get_http_cache
+from mysoc_mailchimp.scraping import BlogPost
+from mysoc_mailchimp.twfy import (
+    BLOG_FEED_URL,
+    FeedPost,
+    blog_to_banner,
+    bulk_json_config,
+    convert_blog_to_announcement,
+    get_existing_config_urls,
+    get_feed_posts,
+    normalise_blog_url,
+)
+
+BLOG = BlogPost(
+    url="https://www.mysociety.org/2025/03/27/devolved-registers/",
+    title="Devolved registers",
+    desc="Now on TheyWorkForYou",
+    image_url="https://www.mysociety.org/files/2025/03/cover.jpg",
+)
+
+
+def test_announcement_json():
+    announcement = json.loads(convert_blog_to_announcement(BLOG, "today", 7))
+    assert announcement["title"] == "Devolved registers"
+    assert announcement["url"].endswith("utm_campaign=announcement")
+
+
+def test_banner_id_from_slug():
+    assert blog_to_banner(BLOG)["id"] == "blog-devolved-registers"
+
+
+def test_existing_config_urls_are_normalised(tmp_path: Path):
+    config = tmp_path / "banners.json"
+    config.write_text(json.dumps([blog_to_banner(BLOG)]))
+    assert get_existing_config_urls(config) == {normalise_blog_url(BLOG.url)}
+
+
+RSS = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel>
+<item><link>https://www.mysociety.org/2025/03/27/devolved-registers/</link>
+<pubDate>Thu, 27 Mar 2025 10:00:00 +0000</pubDate></item>
+<item><link>https://www.mysociety.org/2025/01/02/older-post/</link>
+<pubDate>Thu, 02 Jan 2025 10:00:00 +0000</pubDate></item>
+</channel></rss>"""
+
+
+def test_bulk_config_from_feed(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("MYSOC_MAILCHIMP_CACHE", str(tmp_path))
+    monkeypatch.setenv("MYSOC_MAILCHIMP_OFFLINE", "1")
+    get_http_cache.cache_clear()
+    try:
+        cache = get_http_cache()
+        cache.store(BLOG_FEED_URL, RSS.encode("utf-8"))
+        cache.store(
+            BLOG.url,
+            (
+                Path(__file__).parent / "fixtures" / "mysociety_blog_post.html"
+            ).read_bytes(),
+        )
+        posts = get_feed_posts()
+        assert [post.published.isoformat() for post in posts] == [  # type: ignore
+            "2025-03-27",
+            "2025-01-02",
+        ]
+        existing = {"https://www.mysociety.org/2025/01/02/older-post/"}
+        announcements, banners = bulk_json_config(
+            [post.url for post in posts], existing
+        )
+        assert [banner["id"] for banner in banners] == ["blog-devolved-registers"]
+        assert len(announcements) == 1
+    finally:
+        get_http_cache.cache_clear()
+
+
+def test_bulk_config_skips_failed_posts(tmp_path: Path, monkeypatch, capsys):
+    monkeypatch.setenv("MYSOC_MAILCHIMP_CACHE", str(tmp_path))
+    monkeypatch.setenv("MYSOC_MAILCHIMP_OFFLINE", "1")
+    get_http_cache.cache_clear()
+    try:
+        get_http_cache().store(
+            BLOG.url,
+            (
+                Path(__file__).parent / "fixtures" / "mysociety_blog_post.html"
+            ).read_bytes(),
+        )
+        # not in the offline cache, so fetching it fails
+        missing = "https://www.mysociety.org/2025/01/02/missing-post/"
+        announcements, banners = bulk_json_config([missing, BLOG.url])
+        assert [banner["id"] for banner in banners] == ["blog-devolved-registers"]
+        assert len(announcements) == 1
+        assert f"Skipping {missing}" in capsys.readouterr().err
+    finally:
+        get_http_cache.cache_clear()
+
+
+def rss(*items: tuple[str, str]) -> bytes:
+    body = "".join(
+        f"<item><link>https://www.mysociety.org/{slug}/</link>"
+        f"<pubDate>{date}</pubDate></item>"
+        for slug, date in items
+    )
+    return f"<rss><channel>{body}</channel></rss>".encode("utf-8")
+
+
+@pytest.fixture
+def offline_cache(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("MYSOC_MAILCHIMP_CACHE", str(tmp_path))
+    monkeypatch.setenv("MYSOC_MAILCHIMP_OFFLINE", "1")
+    get_http_cache.cache_clear()
+    yield get_http_cache()
+    get_http_cache.cache_clear()
+
+
+def test_feed_is_paged_back_to_since(offline_cache):
+    offline_cache.store(BLOG_FEED_URL, rss(("new", "Thu, 27 Mar 2025 10:00:00 +0000")))
+    offline_cache.store(
+        BLOG_FEED_URL + "?paged=2",
+        rss(
+            ("middle", "Mon, 10 Mar 2025 10:00:00 +0000"),
+            ("old", "Sat, 01 Feb 2025 10:00:00 +0000"),
+        ),
+    )
+    posts = get_feed_posts(since=datetime.date(2025, 3, 1))
+    assert [post.url.split("/")[-2] for post in posts] == ["new", "middle", "old"]
+
+
+def test_malformed_pub_date_is_ignored(offline_cache):
+    offline_cache.store(
+        BLOG_FEED_URL,
+        rss(("new", "Thu, 27 Mar 2025 10:00:00 +0000"), ("odd", "sometime in March")),
+    )
+    posts = get_feed_posts()
+    assert [post.published for post in posts] == [datetime.date(2025, 3, 27), None]
+
+
+def test_short_feed_warns(offline_cache, capsys):
+    offline_cache.store(BLOG_FEED_URL, rss(("new", "Thu, 27 Mar 2025 10:00:00 +0000")))
+    # no second page, so the feed can't go back far enough
+    posts = get_feed_posts(since=datetime.date(2025, 3, 1))
+    assert len(posts) == 1
+    assert "may be missing" in capsys.readouterr().err
+
+
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+
+def test_sitemap_index_is_followed(offline_cache):
+    index = "https://www.mysociety.org/wp-sitemap.xml"
+    offline_cache.store(
+        index,
+        f"""<sitemapindex xmlns="{SITEMAP_NS}">
+        <sitemap><loc>https://www.mysociety.org/posts-1.xml</loc></sitemap>
+        <sitemap><loc>https://www.mysociety.org/old.xml</loc>
+        <lastmod>2020-01-01</lastmod></sitemap>
+        </sitemapindex>""".encode("utf-8"),
+    )
+    offline_cache.store(
+        "https://www.mysociety.org/posts-1.xml",
+        f"""<urlset xmlns="{SITEMAP_NS}">
+        <url><loc>https://www.mysociety.org/2025/03/27/post/</loc>
+        <lastmod>2025-03-27T10:00:00+00:00</lastmod></url>
+        </urlset>""".encode("utf-8"),
+    )
+    # the old sitemap isn't in the cache, so is only skipped by its lastmod
+    posts = get_feed_posts(index, since=datetime.date(2025, 1, 1))
+    assert posts == [
+        FeedPost(
+            "https://www.mysociety.org/2025/03/27/post/", datetime.date(2025, 3, 27)
+        )
+    ]
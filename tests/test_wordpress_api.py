@@ -0,0 +1,207 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+import requests
+
+from mysoc_mailchimp import instrumentation, wordpress_api
+from mysoc_mailchimp.instrumentation import ApiSummary
+from mysoc_mailchimp.wordpress_api import (
+    MediaIndex,
+    MediaRecord,
+    RateLimiter,
+    hash_file,
+)
+
+from .conftest import use_wordpress
+
+
+def test_media_index_persists(tmp_path: Path):
+    image = tmp_path / "image.png"
+    image.write_bytes(b"not really a png")
+    content_hash = hash_file(image)
+
+    index = MediaIndex(tmp_path / "media_index.json")
+    assert index.get(content_hash) is None
+    index.add(content_hash, MediaRecord(12, "https://example.com/image.png"))
+
+    reloaded = MediaIndex(tmp_path / "media_index.json")
+    assert reloaded.get(content_hash) == MediaRecord(
+        12, "https://example.com/image.png"
+    )
+    reloaded.remove(content_hash)
+    assert MediaIndex(tmp_path / "media_index.json").get(content_hash) is None
+
+
+def test_upload_is_a_single_streamed_request(tmp_path: Path, monkeypatch):
+    seen: list[tuple[str, str, int]] = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            self.rfile.read(length)
+            seen.append((self.command, self.path, length))
+            body = json.dumps({"id": 5, "source_url": "https://wp/image.png"})
+            self.send_response(201)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        use_wordpress(monkeypatch, f"http://127.0.0.1:{server.server_port}/")
+        image = tmp_path / "image.png"
+        image.write_bytes(b"x" * 100_000)
+        uploaded = wordpress_api.BlogImage(image, alt_text="An image").upload_image()
+    finally:
+        server.shutdown()
+
+    assert (uploaded.id, uploaded.media_url) == (5, "https://wp/image.png")
+    assert len(seen) == 1
+    method, path, length = seen[0]
+    assert path.startswith("/wp-json/wp/v2/media?")
+    assert "alt_text=An+image" in path
+    assert length == 100_000
+
+
+def test_taxonomy_index_follows_pagination(tmp_path: Path, monkeypatch, capsys):
+    categories = [{"id": i, "name": f"Category {i}"} for i in range(1, 131)]
+    users = [{"id": 7, "slug": "repoweringdemocracy"}]
+    requested: list[str] = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requested.append(self.path)
+            path, _, query = self.path.partition("?")
+            params = dict(part.split("=") for part in query.split("&"))
+            page, per_page = int(params["page"]), int(params["per_page"])
+            items = categories if path.endswith("categories") else users
+            body = json.dumps(items[(page - 1) * per_page : page * per_page])
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("X-WP-TotalPages", str(-(-len(items) // per_page)))
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        use_wordpress(monkeypatch, f"http://127.0.0.1:{server.server_port}/")
+        index = wordpress_api.TaxonomyIndex(tmp_path / "taxonomy.json")
+        assert index.category_ids(["Category 2", "Category 120"]) == [2, 120]
+        assert index.author_id("repoweringdemocracy") == 7
+        calls = len(requested)
+
+        # a second index in a new process reads from disk with no requests
+        reloaded = wordpress_api.TaxonomyIndex(tmp_path / "taxonomy.json")
+        assert reloaded.category_ids(["Category 85"]) == [85]
+        assert len(requested) == calls
+
+        assert index.category_ids(["Category 2", "Missing"]) == [2]
+        assert "Categories not found in WordPress: Missing" in capsys.readouterr().out
+    finally:
+        server.shutdown()
+
+
+def test_client_retries_server_errors(monkeypatch):
+    responses = [503, 429, 200]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status = responses.pop(0)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(json.dumps({"message": "busy"}).encode())
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    summary = ApiSummary()
+    instrumentation.add_hook(summary)
+    try:
+        client = wordpress_api.WordPressClient(
+            f"http://127.0.0.1:{server.server_port}/", "user", "pass", backoff=0
+        )
+        client.get("posts/12")
+        responses.append(500)
+        client.max_retries = 0
+        with pytest.raises(wordpress_api.WordPressApiError):
+            client.get("posts/12")
+    finally:
+        instrumentation.remove_hook(summary)
+        server.shutdown()
+
+    assert [event.retries for event in summary.events] == [2, 0]
+    (row,) = summary.rows()
+    assert row["endpoint"] == "posts/{id}"
+    assert row["retries"] == 2
+    assert row["errors"] == 1
+
+
+def test_client_does_not_retry_posts_that_may_have_worked(monkeypatch):
+    responses = [502, 503, 201, "slow"]
+    received: list[int] = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            status = responses.pop(0)
+            received.append(status)
+            if status == "slow":
+                time.sleep(0.5)
+                status = 201
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(json.dumps({"id": 1}).encode())
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = wordpress_api.WordPressClient(
+            f"http://127.0.0.1:{server.server_port}/", "user", "pass", backoff=0
+        )
+        # a 502 might come after the post was created
+        with pytest.raises(wordpress_api.WordPressApiError):
+            client.post("posts", json={})
+        # a 503 means it wasn't, so is retried
+        assert client.post("posts", json={}) == {"id": 1}
+        with pytest.raises(requests.Timeout):
+            client.post("posts", json={}, timeout=0.1)
+    finally:
+        server.shutdown()
+
+    assert received == [502, 503, 201, "slow"]
+
+
+def test_rate_limiter_spaces_calls_across_threads():
+    limiter = RateLimiter(50)
+    starts: list[float] = []
+
+    def call():
+        limiter.wait()
+        starts.append(time.monotonic())
+
+    threads = [threading.Thread(target=call) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # six calls at 50 per second need at least five 20ms gaps
+    assert max(starts) - min(starts) >= 0.09
@@ -0,0 +1,119 @@
+import csv
+import json
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from bs4 import BeautifulSoup
+from PIL import Image
+
+from mysoc_mailchimp.wordpress_funcs import (
+    BatchResult,
+    InjectionRule,
+    UnsplashData,
+    WordpressConfig,
+    document_id_from_url,
+    edit_post_url,
+    inject_content,
+    shrink_image,
+    sized_unsplash_url,
+    write_batch_report,
+)
+
+
+def test_sized_unsplash_url_keeps_existing_parameters():
+    url = sized_unsplash_url(
+        "https://images.unsplash.com/photo-123?ixid=abc&ixlib=rb-4.0.3", 1200, 75
+    )
+    query = parse_qs(urlsplit(url).query)
+    assert query["ixid"] == ["abc"]
+    assert query["w"] == ["1200"]
+    assert query["q"] == ["75"]
+    assert query["fm"] == ["jpg"]
+
+
+def test_shrink_image_only_resizes_wide_images(tmp_path: Path):
+    wide = tmp_path / "wide.jpg"
+    Image.new("RGB", (3000, 2000), "blue").save(wide)
+    shrink_image(wide, 1200)
+    with Image.open(wide) as image:
+        assert image.size == (1200, 800)
+
+    narrow = tmp_path / "narrow.jpg"
+    Image.new("RGB", (600, 400), "blue").save(narrow)
+    before = narrow.read_bytes()
+    shrink_image(narrow, 1200)
+    assert narrow.read_bytes() == before
+
+
+def test_inject_content_around_h2s():
+    config = WordpressConfig(
+        before_first_h2="<div>first</div>",
+        before_h2="<div>later</div>",
+        end_of_document="<div>end</div>",
+        categories=[],
+        author="admin",
+    )
+    unsplash = UnsplashData(
+        "https://unsplash.com/photos/abc", "", "Jo", Path("image.jpg"), ""
+    )
+    soup = BeautifulSoup("<p>a</p><h2>One</h2><p>b</p><h2>Two</h2>", "html.parser")
+    html = str(inject_content(soup, config, unsplash))
+    assert html == (
+        "<p>a</p><div>first</div>\n\n<h2>One</h2><p>b</p>"
+        "<div>later</div>\n\n<h2>Two</h2>\n\n"
+        "\n\n<div>end</div>\n\n"
+        '<p>Image: <a href="https://unsplash.com/photos/abc">Jo</a> on Unsplash.</p>'
+    )
+
+
+def test_document_id_from_url():
+    url = "https://docs.google.com/document/d/19mOtaP1dXKjpRTJ_9W624/edit?tab=t.0"
+    assert document_id_from_url(url) == "19mOtaP1dXKjpRTJ_9W624"
+    assert document_id_from_url("19mOtaP1dXKjpRTJ_9W624") == "19mOtaP1dXKjpRTJ_9W624"
+    with pytest.raises(ValueError):
+        document_id_from_url("https://example.com/not a doc")
+
+
+def test_write_batch_report(tmp_path: Path):
+    results = [
+        BatchResult("abc", "First", "First post", 12, edit_post_url(12)),
+        BatchResult("def", "Second", error="Missing unsplash url"),
+    ]
+    json_path = tmp_path / "report.json"
+    write_batch_report(results, json_path)
+    rows = json.loads(json_path.read_text())
+    assert rows[0]["post_id"] == 12
+    assert rows[1]["error"] == "Missing unsplash url"
+
+    csv_path = tmp_path / "report.csv"
+    write_batch_report(results, csv_path)
+    with csv_path.open() as f:
+        rows = list(csv.DictReader(f))
+    assert [row["document_id"] for row in rows] == ["abc", "def"]
+
+
+def test_injection_rules_after_paragraph():
+    config = WordpressConfig(
+        categories=[],
+        author="admin",
+        injections=[
+            {"position": "after_paragraph", "n": 2, "html": "<aside>ad</aside>"},
+            {"position": "start_of_document", "html": "<div>intro</div>"},
+        ],
+    )
+    unsplash = UnsplashData(
+        "https://unsplash.com/photos/abc", "", "Jo", Path("image.jpg"), ""
+    )
+    soup = BeautifulSoup("<p>a</p><p>b</p><p>c</p>", "html.parser")
+    html = str(inject_content(soup, config, unsplash))
+    assert html.startswith(
+        "<div>intro</div>\n\n<p>a</p><p>b</p>\n\n<aside>ad</aside><p>c</p>"
+    )
+
+
+def test_injection_rule_validation():
+    with pytest.raises(ValueError):
+        InjectionRule("after_h3", "<div></div>")  # type: ignore
+    with pytest.raises(ValueError):
+        InjectionRule("after_paragraph", "<div></div>")
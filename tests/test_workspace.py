@@ -0,0 +1,66 @@
+import os
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from mysoc_mailchimp.gdoc import mammoth_html_to_soup
+from mysoc_mailchimp.images import ImageManifest
+from mysoc_mailchimp.workspace import Workspace, content_hash
+
+from .test_gdoc import data_uri
+
+
+def image_srcs(soup: BeautifulSoup) -> list[str]:
+    return [image["src"] for image in soup.find_all("img")]  # type: ignore
+
+
+def test_images_are_shared_between_documents(tmp_path: Path):
+    workspace = Workspace(tmp_path)
+    html = f'<img src="{data_uri(40, 30)}">'
+    first = mammoth_html_to_soup(html, workspace.document_dir("a"), workspace)
+    second = mammoth_html_to_soup(html, workspace.document_dir("b"), workspace)
+
+    assert image_srcs(first) == image_srcs(second)
+    path = Path(image_srcs(first)[0])
+    assert path.is_relative_to(workspace.images)
+    assert path.stem == content_hash(path.read_bytes())
+    # each document has its own manifest
+    assert path.as_posix() in ImageManifest.load(workspace.documents / "b")
+
+
+def test_repeated_image_is_stored_once(tmp_path: Path):
+    workspace = Workspace(tmp_path)
+    html = f'<img src="{data_uri(40, 30)}"><p>x</p><img src="{data_uri(40, 30)}">'
+    soup = mammoth_html_to_soup(html, workspace.document_dir("a"), workspace)
+    srcs = image_srcs(soup)
+    assert srcs[0] == srcs[1]
+    assert len(list(workspace.images.glob("*/*"))) == 1
+
+
+def age(path: Path, seconds: float):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_eviction_removes_least_recently_used(tmp_path: Path):
+    workspace = Workspace(tmp_path, max_bytes=2500)
+    for name, seconds in [("old", 3000), ("middle", 2000), ("new", 1000)]:
+        folder = workspace.document_dir(name)
+        (folder / "file").write_bytes(b"x" * 1000)
+        age(folder, seconds)
+
+    freed = workspace.evict(min_age=0)
+
+    assert freed == 1000
+    assert sorted(path.name for path in workspace.documents.iterdir()) == [
+        "middle",
+        "new",
+    ]
+
+
+def test_eviction_keeps_recently_used(tmp_path: Path):
+    workspace = Workspace(tmp_path, max_bytes=0)
+    (workspace.document_dir("running") / "file").write_bytes(b"x" * 1000)
+    assert workspace.evict(min_age=60) == 0
+    assert (workspace.documents / "running" / "file").exists()